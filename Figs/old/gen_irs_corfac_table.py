@@ -4,7 +4,7 @@
 #
 import argparse
 
-from measure_extinction.stardata import StarData
+from utils.star_cache import cached_stardata
 
 if __name__ == "__main__":
 
@@ -24,7 +24,7 @@ if __name__ == "__main__":
         if (line.find("#") != 0) & (len(line) > 0):
             name = line.rstrip()
             starnames.append(name)
-            tstar = StarData(
+            tstar = cached_stardata(
                 "DAT_files/" + name + ".dat",
                 path="/home/kgordon/Python_git/extstar_data/",
             )
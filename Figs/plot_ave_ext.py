@@ -15,6 +15,9 @@ from measure_extinction.merge_obsspec import _wavegrid
 from measure_extinction.extdata import ExtData
 
 from utils.G21 import G21_drude_asym as G21
+from utils.compiled_models import plot_chain_band
+from utils.rebin import rebin_spectra
+
 
 if __name__ == "__main__":
 
@@ -25,6 +28,9 @@ if __name__ == "__main__":
     parser.add_argument("--pdf", help="save figure as a pdf file", action="store_true")
     args = parser.parse_args()
 
+    # burn in for chains saved without the estimated burn in
+    mcmc_burnfrac = 0.4
+
     fontsize = 14
 
     font = {"size": fontsize}
@@ -118,28 +124,16 @@ if __name__ == "__main__":
         wrange = [5.0, 36.0]
         res = 25
         full_wave, full_wave_min, full_wave_max = _wavegrid(res, wrange)
-        n_waves = len(full_wave)
-        full_flux = np.zeros((n_waves), dtype=float)
-        full_unc = np.zeros((n_waves), dtype=float)
-        full_npts = np.zeros((n_waves), dtype=int)
-
-        cwaves = obsext_IRS_wave
-        cfluxes = obsext_IRS_ext
-        cuncs = obsext_IRS_uncs
-        for k in range(n_waves):
-            (indxs,) = np.where(
-                (cwaves >= full_wave_min[k]) & (cwaves < full_wave_max[k])
-            )
-            if len(indxs) > 0:
-                # weights = 1.0 / np.square(cuncs[indxs])
-                weights = 1.0
-                full_flux[k] += np.sum(weights * cfluxes[indxs])
-                full_unc[k] += np.sum(1.0 / np.square(cuncs[indxs]))
-                full_npts[k] += len(indxs)
-
+        # unweighted mean with the inverse variance weighted uncertainty
+        full_flux, full_unc, full_npts = rebin_spectra(
+            obsext_IRS_wave,
+            obsext_IRS_ext,
+            full_wave_min,
+            full_wave_max,
+            uncs=obsext_IRS_uncs,
+            unc="weighted",
+        )
         findxs = full_npts > 0
-        full_flux[findxs] /= full_npts[findxs]
-        full_unc[findxs] = np.sqrt(1.0 / full_unc[findxs])
 
         ax[1].errorbar(
             full_wave[findxs],
@@ -201,6 +195,15 @@ if __name__ == "__main__":
             ax[1].plot(
                 mod_x, G21_p50(mod_x), "k" + pline[i], lw=2, alpha=0.65, label="G21 Fit"
             )
+            plot_chain_band(
+                ax[1],
+                G21_p50,
+                mod_x,
+                avefilename.replace(".fits", ".h5"),
+                burnfrac=mcmc_burnfrac,
+                color="k",
+                alpha=0.25,
+            )
 
             g21_comps = G21_p50.copy()
             g21_comps.sil1_amp = 0.0
@@ -265,6 +268,15 @@ if __name__ == "__main__":
                 alpha=0.65,
                 label="FM90 Fit",
             )
+            plot_chain_band(
+                ax[0],
+                FM90_p50,
+                mod_x,
+                avefilename.replace("POWLAW2DRUDE", "FM90").replace(".fits", ".h5"),
+                burnfrac=mcmc_burnfrac,
+                color="k",
+                alpha=0.25,
+            )
 
             fm90_comps = FM90_p50.copy()
             fm90_comps.C3 = 0.0
@@ -19,7 +19,9 @@ from dust_extinction.averages import (
     F11_MWGC,
 )
 
-from measure_extinction.extdata import ExtData, AverageExtData
+from measure_extinction.extdata import AverageExtData
+
+from utils.sample_loader import load_filelist
 
 if __name__ == "__main__":
 
@@ -53,18 +55,10 @@ if __name__ == "__main__":
 
     filename = args.filelist
 
-    f = open(filename, "r")
-    file_lines = list(f)
-    extnames = []
-    extdatas = []
-    # avs = []
-    for line in file_lines:
-        if (line.find("#") != 0) & (len(line) > 0):
-            name = line.rstrip()
-            extnames.append(name)
-            text = ExtData(filename="fits/%s" % name)
-            extdatas.append(text)
-            # avs.append(text.columns["AV"][0])
+    # curves read in parallel
+    sample = load_filelist(filename)
+    extnames = sample.names
+    extdatas = sample.exts
 
     fontsize = 18
 
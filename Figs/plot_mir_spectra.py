@@ -12,7 +12,7 @@ import matplotlib
 
 import astropy.units as u
 
-from measure_extinction.stardata import StarData
+from utils.star_cache import cached_stardata
 
 
 def plot_mir_set(
@@ -35,7 +35,9 @@ def plot_mir_set(
     """
     n_col = len(col_vals)
     for i in range(len(starnames)):
-        stardata = StarData(subpath + starnames[i] + ".dat", path=path, use_corfac=True)
+        stardata = cached_stardata(
+            subpath + starnames[i] + ".dat", path=path, use_corfac=True
+        )
 
         stardata.plot(
             ax,
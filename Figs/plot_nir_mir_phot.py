@@ -2,7 +2,8 @@ import argparse
 import numpy as np
 
 import matplotlib.pyplot as plt
-from measure_extinction.stardata import StarData
+
+from utils.star_cache import cached_stardata
 
 
 def get_colors(starnames):
@@ -12,7 +13,9 @@ def get_colors(starnames):
     xvals = np.zeros((n_stars, 2))
     yvals = np.zeros((n_stars, 2))
     for i in range(n_stars):
-        stardata = StarData(subpath + starnames[i] + ".dat", path=path, use_corfac=True)
+        stardata = cached_stardata(
+            subpath + starnames[i] + ".dat", path=path, use_corfac=True
+        )
 
         b1vals = stardata.data["BAND"].get_band_mag(xbands[0])
         b2vals = stardata.data["BAND"].get_band_mag(xbands[1])
@@ -11,6 +11,9 @@ from measure_extinction.merge_obsspec import _wavegrid
 from measure_extinction.extdata import ExtData
 
 from utils.G21 import G21_drude_asym as G21
+from utils.compiled_models import plot_chain_band
+from utils.rebin import rebin_spectra
+
 
 if __name__ == "__main__":
 
@@ -20,6 +23,9 @@ if __name__ == "__main__":
     parser.add_argument("--pdf", help="save figure as a pdf file", action="store_true")
     args = parser.parse_args()
 
+    # burn in for chains saved without the estimated burn in
+    mcmc_burnfrac = 0.4
+
     fontsize = 14
 
     font = {"size": fontsize}
@@ -105,28 +111,16 @@ if __name__ == "__main__":
         wrange = [5.0, 36.0]
         res = 25
         full_wave, full_wave_min, full_wave_max = _wavegrid(res, wrange)
-        n_waves = len(full_wave)
-        full_flux = np.zeros((n_waves), dtype=float)
-        full_unc = np.zeros((n_waves), dtype=float)
-        full_npts = np.zeros((n_waves), dtype=int)
-
-        cwaves = obsext_IRS_wave
-        cfluxes = obsext_IRS_ext
-        cuncs = obsext_IRS_uncs
-        for k in range(n_waves):
-            (indxs,) = np.where(
-                (cwaves >= full_wave_min[k]) & (cwaves < full_wave_max[k])
-            )
-            if len(indxs) > 0:
-                # weights = 1.0 / np.square(cuncs[indxs])
-                weights = 1.0
-                full_flux[k] += np.sum(weights * cfluxes[indxs])
-                full_unc[k] += np.sum(1.0 / np.square(cuncs[indxs]))
-                full_npts[k] += len(indxs)
-
+        # unweighted mean with the inverse variance weighted uncertainty
+        full_flux, full_unc, full_npts = rebin_spectra(
+            obsext_IRS_wave,
+            obsext_IRS_ext,
+            full_wave_min,
+            full_wave_max,
+            uncs=obsext_IRS_uncs,
+            unc="weighted",
+        )
         findxs = full_npts > 0
-        full_flux[findxs] /= full_npts[findxs]
-        full_unc[findxs] = np.sqrt(1.0 / full_unc[findxs])
 
         ax.errorbar(
             full_wave[findxs],
@@ -139,6 +133,19 @@ if __name__ == "__main__":
             label="Diffuse R=25",
         )
 
+        # 68% band of the model relative to the p50 model
+        mod_x = np.logspace(np.log10(5.0), np.log10(40.0), num=1000) * u.micron
+        plot_chain_band(
+            ax,
+            G21_p50,
+            mod_x,
+            avefilename.replace(".fits", ".h5"),
+            burnfrac=mcmc_burnfrac,
+            offset=G21_p50(mod_x),
+            color="b",
+            alpha=0.25,
+        )
+
         # average residuals
         minwaves = [5.0, 10.0, 20.0]
         maxwaves = [10.0, 20.0, 40.0]
@@ -1,14 +1,13 @@
 import argparse
 
-import emcee
 import numpy as np
 import matplotlib.pyplot as pyplot
 import matplotlib
 import astropy.units as u
 from astropy.table import Table
-from astropy import uncertainty as unc
 
 from measure_extinction.extdata import ExtData
+from utils.mcmc_chains import ChainSummaryIndex
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -19,6 +18,7 @@ if __name__ == "__main__":
 
     filename = args.filelist
 
+    # burn in for chains saved without the estimated burn in
     mcmc_burnfrac = 0.4
 
     # data
@@ -45,41 +45,37 @@ if __name__ == "__main__":
     rvs = np.full((n_ext), 0.0)
     rvs_unc = np.full((2, n_ext), 0.0)
 
+    # posterior summaries of the chains, only updated for new or changed chains
+    index = ChainSummaryIndex("fits/chain_summary.ecsv", burnfrac=mcmc_burnfrac)
+
     for k, cname in enumerate(extfnames):
 
         # get P92 fits
         bfile = f"fits/{cname}"
         cext = ExtData(filename=bfile)
 
-        mcmcfile = bfile.replace(".fits", ".h5")
-        reader = emcee.backends.HDFBackend(mcmcfile)
-        nsteps, nwalkers = reader.get_log_prob().shape
-        samples = reader.get_chain(discard=int(mcmc_burnfrac * nsteps), flat=True)
-
-        avs_dist = unc.Distribution(samples[:, -1])
-        av_per = avs_dist.pdf_percentiles([16.0, 50.0, 84.0])
-        avs[k] = av_per[1]
-        avs_unc[1, k] = av_per[2] - av_per[1]
-        avs_unc[0, k] = av_per[1] - av_per[0]
-        # print(avs_dist.pdf_percentiles([33., 50., 87.]))
-
         (indxs,) = np.where(
             (cext.waves["BAND"] > 0.4 * u.micron)
             & (cext.waves["BAND"] < 0.5 * u.micron)
         )
-        ebvs_dist = unc.normal(
-            cext.exts["BAND"][indxs[0]],
-            std=cext.uncs["BAND"][indxs[0]],
-            n_samples=avs_dist.n_samples,
-        )
-        ebvs[k] = ebvs_dist.pdf_mean()
-        ebvs_unc[k] = ebvs_dist.pdf_std()
-
-        rvs_dist = avs_dist / ebvs_dist
-        rv_per = rvs_dist.pdf_percentiles([16.0, 50.0, 84.0])
-        rvs[k] = rv_per[1]
-        rvs_unc[1, k] = rv_per[2] - rv_per[1]
-        rvs_unc[0, k] = rv_per[1] - rv_per[0]
+        ebv = (cext.exts["BAND"][indxs[0]], cext.uncs["BAND"][indxs[0]])
+
+        mcmcfile = bfile.replace(".fits", ".h5")
+        csum = index.get(mcmcfile, av_col=-1, excesses={"EBV": ebv})
+
+        avs[k] = csum["AV"]["p50"]
+        avs_unc[1, k] = csum["AV"]["p84"] - csum["AV"]["p50"]
+        avs_unc[0, k] = csum["AV"]["p50"] - csum["AV"]["p16"]
+
+        ebvs[k] = csum["EBV"]["mean"]
+        ebvs_unc[k] = csum["EBV"]["std"]
+
+        rvs[k] = csum["AV/EBV"]["p50"]
+        rvs_unc[1, k] = csum["AV/EBV"]["p84"] - csum["AV/EBV"]["p50"]
+        rvs_unc[0, k] = csum["AV/EBV"]["p50"] - csum["AV/EBV"]["p16"]
+
+    # save any new or updated chain summaries
+    index.write()
 
     # output some info
     a = Table()
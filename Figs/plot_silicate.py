@@ -1,19 +1,17 @@
 # plot to plot the silicate strength versus other properties of the sightlines
 
 import argparse
-import math
 import os.path
 
-import emcee
 import numpy as np
 import matplotlib.pyplot as pyplot
 import matplotlib
 import astropy.units as u
 from astropy.table import Table
-from astropy import uncertainty as unc
 
 from dust_extinction.parameter_averages import F19
-from measure_extinction.extdata import ExtData
+from utils.sample_loader import load_sample
+from utils import mcmc_chains as mc
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -24,6 +22,7 @@ if __name__ == "__main__":
 
     filename = args.filelist
 
+    # burn in for chains saved without the estimated burn in
     mcmc_burnfrac = 0.4
 
     # data
@@ -80,60 +79,53 @@ if __name__ == "__main__":
     rvs = np.full((n_ext), 0.0)
     rvs_unc = np.full((2, n_ext), 0.0)
 
+    # posterior summaries of the chains, only updated for new or changed chains
+    index = mc.ChainSummaryIndex(
+        os.path.join(os.path.dirname(extfnames[0]), "chain_summary.ecsv"),
+        burnfrac=mcmc_burnfrac,
+    )
+    g21_derived = {"SIL_AMP_RATIO": mc.sil_amp_ratio}
+    fm90_derived = {"NUV_CENINTEN": mc.nuv_ceninten, "NUV_AREA": mc.nuv_area}
+
+    # curves and FM90 fits read in parallel
+    sample = load_sample(extfnames, fm90=True)
+
     for k, cname in enumerate(extfnames):
 
         # get P92 fits
         bfile = cname
-        cext = ExtData(filename=bfile)
-
-        mcmcfile = bfile.replace(".fits", ".h5")
-        reader = emcee.backends.HDFBackend(mcmcfile)
-        nsteps, nwalkers = reader.get_log_prob().shape
-        samples = reader.get_chain(discard=int(mcmc_burnfrac * nsteps), flat=True)
-
-        avs_dist = unc.Distribution(samples[:, -1])
-        av_per = avs_dist.pdf_percentiles([16.0, 50.0, 84.0])
-        avs[k] = av_per[1]
-        avs_unc[1, k] = av_per[2] - av_per[1]
-        avs_unc[0, k] = av_per[1] - av_per[0]
-        # print(avs_dist.pdf_percentiles([33., 50., 87.]))
+        cext = sample.exts[k]
 
         (indxs,) = np.where(
             (cext.waves["BAND"] > 0.4 * u.micron)
             & (cext.waves["BAND"] < 0.5 * u.micron)
         )
-        ebvs_dist = unc.normal(
-            cext.exts["BAND"][indxs[0]],
-            std=cext.uncs["BAND"][indxs[0]],
-            n_samples=avs_dist.n_samples,
+        ebv = (cext.exts["BAND"][indxs[0]], cext.uncs["BAND"][indxs[0]])
+
+        mcmcfile = bfile.replace(".fits", ".h5")
+        csum = index.get(
+            mcmcfile, av_col=-1, excesses={"EBV": ebv}, derived=g21_derived
         )
-        ebvs[k] = ebvs_dist.pdf_mean()
-        ebvs_unc[k] = ebvs_dist.pdf_std()
-
-        rvs_dist = avs_dist / ebvs_dist
-        rv_per = rvs_dist.pdf_percentiles([16.0, 50.0, 84.0])
-        rvs[k] = rv_per[1]
-        rvs_unc[1, k] = rv_per[2] - rv_per[1]
-        rvs_unc[0, k] = rv_per[1] - rv_per[0]
-
-        # print(np.corrcoef(np.stack([avs_dist.distribution, rvs_dist.distribution])))
-
-        silamp_dist = unc.Distribution(samples[:, 2])
-        sillam_dist = unc.Distribution(samples[:, 3])
-        silwid_dist = unc.Distribution(samples[:, 4])
-        silasm_dist = unc.Distribution(samples[:, 5])
-        silamp2_dist = unc.Distribution(samples[:, 6])
-
-        silampratio_dist = unc.Distribution(samples[:, 2] / samples[:, 6])
-
-        sil_amp[k] = silamp_dist.pdf_mean()
-        sil_amp_unc[k] = silamp_dist.pdf_std()
-        sil_width[k] = silwid_dist.pdf_mean()
-        sil_width_unc[k] = silwid_dist.pdf_std()
-        sil_lambda[k] = sillam_dist.pdf_mean()
-        sil_lambda_unc[k] = sillam_dist.pdf_std()
-        sil_asym[k] = silasm_dist.pdf_mean()
-        sil_asym_unc[k] = silasm_dist.pdf_std()
+
+        avs[k] = csum["AV"]["p50"]
+        avs_unc[1, k] = csum["AV"]["p84"] - csum["AV"]["p50"]
+        avs_unc[0, k] = csum["AV"]["p50"] - csum["AV"]["p16"]
+
+        ebvs[k] = csum["EBV"]["mean"]
+        ebvs_unc[k] = csum["EBV"]["std"]
+
+        rvs[k] = csum["AV/EBV"]["p50"]
+        rvs_unc[1, k] = csum["AV/EBV"]["p84"] - csum["AV/EBV"]["p50"]
+        rvs_unc[0, k] = csum["AV/EBV"]["p50"] - csum["AV/EBV"]["p16"]
+
+        sil_amp[k] = csum["param_2"]["mean"]
+        sil_amp_unc[k] = csum["param_2"]["std"]
+        sil_width[k] = csum["param_4"]["mean"]
+        sil_width_unc[k] = csum["param_4"]["std"]
+        sil_lambda[k] = csum["param_3"]["mean"]
+        sil_lambda_unc[k] = csum["param_3"]["std"]
+        sil_asym[k] = csum["param_5"]["mean"]
+        sil_asym_unc[k] = csum["param_5"]["std"]
 
         # needs updating
         # using C3 = a_i * lambda_i**2 * 2 to be able to use the FM area formula
@@ -141,42 +133,38 @@ if __name__ == "__main__":
         # sil_area[k] = silarea_dist.pdf_mean()
         # sil_area_unc[k] = silarea_dist.pdf_std()
 
-        sil2_amp[k] = silamp2_dist.pdf_mean()
-        sil2_amp_unc[k] = silamp2_dist.pdf_std()
+        sil2_amp[k] = csum["param_6"]["mean"]
+        sil2_amp_unc[k] = csum["param_6"]["std"]
 
-        sil_amp_ratio[k] = silampratio_dist.pdf_mean()
-        sil_amp_ratio_unc[k] = silampratio_dist.pdf_std()
+        sil_amp_ratio[k] = csum["SIL_AMP_RATIO"]["mean"]
+        sil_amp_ratio_unc[k] = csum["SIL_AMP_RATIO"]["std"]
 
         # get FM90 fits
         uvfname = bfile.replace(".fits", "_FM90.fits")
-        if os.path.isfile(uvfname):
-            cext_fm90 = ExtData(filename=uvfname)
+        if sample.exts_fm90[k] is not None:
             mcmcfile = uvfname.replace(".fits", ".h5")
-            reader = emcee.backends.HDFBackend(mcmcfile)
-            nsteps, nwalkers = reader.get_log_prob().shape
-            samples = reader.get_chain(discard=int(mcmc_burnfrac * nsteps), flat=True)
-
-            nuvamp_dist = unc.Distribution(samples[:, 2])
-            nuvlam_dist = unc.Distribution(samples[:, 4])
-            nuvwid_dist = unc.Distribution(samples[:, 5])
-
-            nuv_amp[k] = nuvamp_dist.pdf_mean()
-            nuv_amp_unc[k] = nuvamp_dist.pdf_std()
-            nuv_width[k] = nuvwid_dist.pdf_mean()
-            nuv_width_unc[k] = nuvwid_dist.pdf_std()
-            nuv_lambda[k] = nuvlam_dist.pdf_mean()
-            nuv_lambda_unc[k] = nuvlam_dist.pdf_std()
-
-            nuvceninten_dist = nuvamp_dist / (nuvwid_dist ** 2)
-            nuv_ci_per = nuvceninten_dist.pdf_percentiles([16.0, 50.0, 84.0])
-            nuv_ceninten[k] = nuv_ci_per[1]
-            nuv_ceninten_unc[1, k] = nuv_ci_per[2] - nuv_ci_per[1]
-            nuv_ceninten_unc[0, k] = nuv_ci_per[1] - nuv_ci_per[0]
-
-            # using C3 = a_i * lambda_i**2 * 2 to be able to use the FM area formula
-            nuvarea_dist = math.pi * nuvamp_dist / (2.0 * nuvwid_dist)
-            nuv_area[k] = nuvarea_dist.pdf_mean()
-            nuv_area_unc[k] = nuvarea_dist.pdf_std()
+            csum = index.get(mcmcfile, derived=fm90_derived)
+
+            nuv_amp[k] = csum["param_2"]["mean"]
+            nuv_amp_unc[k] = csum["param_2"]["std"]
+            nuv_width[k] = csum["param_5"]["mean"]
+            nuv_width_unc[k] = csum["param_5"]["std"]
+            nuv_lambda[k] = csum["param_4"]["mean"]
+            nuv_lambda_unc[k] = csum["param_4"]["std"]
+
+            nuv_ceninten[k] = csum["NUV_CENINTEN"]["p50"]
+            nuv_ceninten_unc[1, k] = (
+                csum["NUV_CENINTEN"]["p84"] - csum["NUV_CENINTEN"]["p50"]
+            )
+            nuv_ceninten_unc[0, k] = (
+                csum["NUV_CENINTEN"]["p50"] - csum["NUV_CENINTEN"]["p16"]
+            )
+
+            nuv_area[k] = csum["NUV_AREA"]["mean"]
+            nuv_area_unc[k] = csum["NUV_AREA"]["std"]
+
+    # save any new or updated chain summaries
+    index.write()
 
     rvs[-1] = 3.1
     rvs_unc[0, -1] = 0.0
@@ -1,5 +1,4 @@
 import argparse
-import os.path
 
 import numpy as np
 import matplotlib.pyplot as pyplot
@@ -10,8 +9,8 @@ import astropy.units as u
 
 # from calc_ext import P92_Elv
 from dust_extinction.shapes import FM90
-from measure_extinction.extdata import ExtData
 from utils.G21 import G21_drude_asym as G21
+from utils.sample_loader import load_filelist
 
 
 def plot_all_ext(
@@ -147,44 +146,34 @@ if __name__ == "__main__":
 
     filename = args.filelist
 
-    f = open(filename, "r")
-    file_lines = list(f)
-    extnames = []
-    extdatas = []
-    extdatas_fm90 = []
-    avs = []
+    # curves and FM90 fits read in parallel
+    sample = load_filelist(filename, fm90=True)
+    extnames = sample.names
+    extdatas = sample.exts
+    extdatas_fm90 = sample.exts_fm90
+    avs = [text.columns["AV"][0] for text in extdatas]
 
     normtype = "IUE"
     norm_wave_range = [0.25, 0.30] * u.micron
     normvals = []
 
-    for line in file_lines:
-        if (line.find("#") != 0) & (len(line) > 0):
-            name = line.rstrip()
-            extnames.append(name)
-            bfilename = f"fits/{name}"
-            text = ExtData(filename=bfilename)
-            extdatas.append(text)
-            avs.append(text.columns["AV"][0])
-
-            # determine the extinction in the near-UV
-            # useful for sorting to make a pretty plot
-            if "IUE" in text.exts.keys():
-                (gindxs,) = np.where(
-                    (text.npts[normtype] > 0)
-                    & (
-                        (text.waves[normtype] >= norm_wave_range[0])
-                        & (text.waves[normtype] <= norm_wave_range[1])
-                    )
+    for text in extdatas:
+        # determine the extinction in the near-UV
+        # useful for sorting to make a pretty plot
+        if "IUE" in text.exts.keys():
+            (gindxs,) = np.where(
+                (text.npts[normtype] > 0)
+                & (
+                    (text.waves[normtype] >= norm_wave_range[0])
+                    & (text.waves[normtype] <= norm_wave_range[1])
                 )
-                normvals.append(
-                    np.average(
-                        (text.exts[normtype][gindxs]) / float(text.columns["AV"][0])
-                        + 1.0
-                    )
+            )
+            normvals.append(
+                np.average(
+                    (text.exts[normtype][gindxs]) / float(text.columns["AV"][0])
+                    + 1.0
                 )
-            else:
-                normvals.append(1.0)
+            )
         else:
             normvals.append(1.0)
 
@@ -194,22 +183,6 @@ if __name__ == "__main__":
     # normvals = normvals[sindxs]
     # extnames = np.array(extnames)[sindxs]
 
-    extdatas = []
-    avs = []
-
-    for extname in extnames:
-        bfilename = f"fits/{extname}"
-        text = ExtData(filename=bfilename)
-        extdatas.append(text)
-        avs.append(text.columns["AV"][0])
-
-        fm90_filename = bfilename.replace(".fits", "_FM90.fits")
-        if os.path.isfile(fm90_filename):
-            textfm90 = ExtData(filename=fm90_filename)
-            extdatas_fm90.append(textfm90)
-        else:
-            extdatas_fm90.append(None)
-
     fontsize = 18
 
     font = {"size": fontsize}
@@ -4,12 +4,11 @@
 #
 import argparse
 
-import emcee
 import numpy as np
-from astropy import uncertainty as unc
 import astropy.units as u
 
-from measure_extinction.extdata import ExtData
+from utils.mcmc_chains import ChainSummaryIndex
+from utils.sample_loader import load_sample
 
 if __name__ == "__main__":
 
@@ -96,9 +95,14 @@ if __name__ == "__main__":
 
         okeys = ["AV", "RV", "SCALE", "ALPHA"]
 
+    # burn in for chains saved without the estimated burn in
     mcmc_burnfrac = 0.4
+    # posterior summaries of the chains, only updated for new or changed chains
+    index = ChainSummaryIndex("fits/chain_summary.ecsv", burnfrac=mcmc_burnfrac)
+    # curves read in parallel
+    sample = load_sample(files)
     for k, bfile in enumerate(files):
-        edata = ExtData(filename=bfile)
+        edata = sample.exts[k]
 
         spos = names[k].find("_")
         sname = names[k][:spos].upper()
@@ -116,30 +120,18 @@ if __name__ == "__main__":
                     val, punc, munc = (1.0, 0.0, 0.0)
             elif ckey == "RV":
                 if sname != "DIFFUS":
-                    mcmcfile = bfile.replace(".fits", ".h5")
-                    reader = emcee.backends.HDFBackend(mcmcfile)
-                    nsteps, nwalkers = reader.get_log_prob().shape
-                    samples = reader.get_chain(
-                        discard=int(mcmc_burnfrac * nsteps), flat=True
-                    )
-
-                    # R(V) calc
-                    avs_dist = unc.Distribution(samples[:, -1])
                     (indxs,) = np.where(
                         (edata.waves["BAND"] > 0.4 * u.micron)
                         & (edata.waves["BAND"] < 0.5 * u.micron)
                     )
-                    ebvs_dist = unc.normal(
-                        edata.exts["BAND"][indxs[0]],
-                        std=edata.uncs["BAND"][indxs[0]],
-                        n_samples=avs_dist.n_samples,
-                    )
+                    ebv = (edata.exts["BAND"][indxs[0]], edata.uncs["BAND"][indxs[0]])
 
-                    rvs_dist = avs_dist / ebvs_dist
-                    rv_per = rvs_dist.pdf_percentiles([16.0, 50.0, 84.0])
-                    val = rv_per[1]
-                    punc = rv_per[2] - rv_per[1]
-                    munc = rv_per[1] - rv_per[0]
+                    # R(V) calc
+                    mcmcfile = bfile.replace(".fits", ".h5")
+                    csum = index.get(mcmcfile, av_col=-1, excesses={"EBV": ebv})
+                    val = csum["AV/EBV"]["p50"]
+                    punc = csum["AV/EBV"]["p84"] - csum["AV/EBV"]["p50"]
+                    munc = csum["AV/EBV"]["p50"] - csum["AV/EBV"]["p16"]
                 else:
                     (indxs,) = np.where(
                         (edata.waves["BAND"] > 0.4 * u.micron)
@@ -163,3 +155,6 @@ if __name__ == "__main__":
             print(f"\\{{{hstr2[:-3]}}}")
             print(f"\\startdata")
         print(f"{pstr[:-3]} \\\\")
+
+    # save any new or updated chain summaries
+    index.write()
@@ -4,7 +4,7 @@
 #
 import argparse
 
-from measure_extinction.extdata import ExtData
+from utils.sample_loader import load_sample
 
 if __name__ == "__main__":
 
@@ -60,8 +60,10 @@ if __name__ == "__main__":
 
     okeys = ["C1", "C2", "C3", "C4", "XO", "GAMMA"]
 
+    # FM90 fits read in parallel
+    sample = load_sample([bfile.replace(".fits", "_FM90.fits") for bfile in files])
     for k, bfile in enumerate(files):
-        edata = ExtData(filename=bfile.replace(".fits", "_FM90.fits"))
+        edata = sample.exts[k]
 
         spos = names[k].find("_")
         sname = names[k][:spos].upper()
@@ -26,6 +26,121 @@ def drude_asym(x, scale, x_o, gamma_o, asym):
     return y
 
 
+def drude_deriv(x, scale, x_o, gamma_o):
+    """
+    Derivatives of the drude function with respect to scale, x_o, and gamma_o
+    """
+    q = (gamma_o / x_o) ** 2
+    u = x / x_o - x_o / x
+    denom = u ** 2 + q
+
+    d_scale = q / denom
+    # y = scale * q / denom, with denom = u**2 + q
+    dy_dq = scale * (u ** 2) / (denom ** 2)
+    dy_du = -2.0 * scale * q * u / (denom ** 2)
+    d_x_o = dy_dq * (-2.0 * q / x_o) + dy_du * (-x / (x_o ** 2) - 1.0 / x)
+    d_gamma_o = dy_dq * 2.0 * gamma_o / (x_o ** 2)
+
+    return [d_scale, d_x_o, d_gamma_o]
+
+
+def drude_asym_deriv(x, scale, x_o, gamma_o, asym):
+    """
+    Derivatives of the asymmetric drude function with respect to scale, x_o,
+    gamma_o, and asym
+    """
+    expterm = np.exp(asym * (x - x_o))
+    gamma = 2.0 * gamma_o / (1.0 + expterm)
+    q = (gamma / x_o) ** 2
+    u = x / x_o - x_o / x
+    denom = u ** 2 + q
+
+    d_scale = q / denom
+    # y = scale * q / denom, with denom = u**2 + q and q depending on gamma
+    dy_dq = scale * (u ** 2) / (denom ** 2)
+    dy_du = -2.0 * scale * q * u / (denom ** 2)
+    dq_dgamma = 2.0 * gamma / (x_o ** 2)
+    dgamma_dx_o = gamma * asym * expterm / (1.0 + expterm)
+    d_x_o = (
+        dy_dq * (-2.0 * q / x_o + dq_dgamma * dgamma_dx_o)
+        + dy_du * (-x / (x_o ** 2) - 1.0 / x)
+    )
+    d_gamma_o = dy_dq * dq_dgamma * gamma / gamma_o
+    d_asym = dy_dq * dq_dgamma * (-gamma * (x - x_o) * expterm / (1.0 + expterm))
+
+    return [d_scale, d_x_o, d_gamma_o, d_asym]
+
+
+def powerlaw_deriv(x, scale, alpha):
+    """
+    Derivatives of the G21 powerlaw with respect to scale and alpha
+    """
+    # scale * ((1.0 / x) ** (-1.0 * alpha)) = scale * x ** alpha
+    d_scale = x ** alpha
+    d_alpha = scale * d_scale * np.log(x)
+
+    return [d_scale, d_alpha]
+
+
+def axav_to_exv_fit_deriv(model):
+    """
+    Set analytic derivatives for a compound model of an A(x)/A(V) model
+    piped into AxAvToExv.  The A(x)/A(V) model must have analytic derivatives.
+
+    Parameters
+    ----------
+    model : astropy CompoundModel
+        model of the form axav_model | AxAvToExv
+
+    Returns
+    -------
+    model : astropy CompoundModel
+        input model with fit_deriv set
+    """
+    axav_model = model.left
+    n_axav = len(axav_model.param_names)
+
+    def fit_deriv(in_x, *params):
+        """
+        Derivatives of E(x-V) = (A(x)/A(V) - 1) * A(V)
+        """
+        axav_params = params[:n_axav]
+        Av = params[n_axav]
+        axav = axav_model.evaluate(in_x, *axav_params)
+        d_axav = axav_model.fit_deriv(in_x, *axav_params)
+
+        return [Av * cderiv for cderiv in d_axav] + [axav - 1.0]
+
+    model.fit_deriv = fit_deriv
+    model.col_fit_deriv = True
+    return model
+
+
+def fm90_fit_deriv(in_x, C1, C2, C3, C4, xo, gamma):
+    """
+    Derivatives of the FM90 function with respect to the parameters
+
+    The FM90.fit_deriv of dust_extinction has incorrect xo and gamma
+    derivatives, set with fm90_model.fit_deriv = fm90_fit_deriv
+    """
+    x = in_x
+
+    x2 = x ** 2
+    # bump term is C3 * x2 / denom
+    denom = (x2 - xo ** 2) ** 2 + x2 * (gamma ** 2)
+
+    d_C1 = np.ones_like(x * xo)
+    d_C2 = x * np.ones_like(xo)
+    d_C3 = x2 / denom
+    y = x - 5.9
+    fuv = np.where(x >= 5.9, 0.5392 * (y ** 2) + 0.05644 * (y ** 3), 0.0)
+    d_C4 = fuv * np.ones_like(xo)
+    d_xo = 4.0 * C3 * x2 * xo * (x2 - xo ** 2) / (denom ** 2)
+    d_gamma = -2.0 * C3 * (x2 ** 2) * gamma / (denom ** 2)
+
+    return [d_C1, d_C2, d_C3, d_C4, d_xo, d_gamma]
+
+
 class G21(Fittable1DModel):
     """
     Powerlaw plus Drude profiles for the silicate features for the
@@ -104,6 +219,30 @@ class G21(Fittable1DModel):
 
         return axav
 
+    def fit_deriv(
+        self,
+        in_x,
+        scale,
+        alpha,
+        sil1_amp,
+        sil1_center,
+        sil1_fwhm,
+        sil2_amp,
+        sil2_center,
+        sil2_fwhm,
+    ):
+        """
+        Derivatives of the G21 function with respect to the parameters
+        """
+        x = in_x
+        wave = 1 / x
+
+        return (
+            powerlaw_deriv(x, scale, alpha)
+            + drude_deriv(wave, sil1_amp, sil1_center, sil1_fwhm)
+            + drude_deriv(wave, sil2_amp, sil2_center, sil2_fwhm)
+        )
+
 
 class G21_drude_asym(Fittable1DModel):
     """
@@ -188,3 +327,29 @@ class G21_drude_asym(Fittable1DModel):
         axav += drude_asym(wave, sil2_amp, sil2_center, sil2_fwhm, sil2_asym)
 
         return axav
+
+    def fit_deriv(
+        self,
+        in_x,
+        scale,
+        alpha,
+        sil1_amp,
+        sil1_center,
+        sil1_fwhm,
+        sil1_asym,
+        sil2_amp,
+        sil2_center,
+        sil2_fwhm,
+        sil2_asym,
+    ):
+        """
+        Derivatives of the G21_drude_asym function with respect to the parameters
+        """
+        x = in_x
+        wave = 1 / x
+
+        return (
+            powerlaw_deriv(x, scale, alpha)
+            + drude_asym_deriv(wave, sil1_amp, sil1_center, sil1_fwhm, sil1_asym)
+            + drude_asym_deriv(wave, sil2_amp, sil2_center, sil2_fwhm, sil2_asym)
+        )
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the modules import their siblings by name (e.g., from mcmc_chains import
+# ChainReader) as when run as scripts, so these also work when imported as
+# utils.X through the Figs and Tables utils symlinks
+_utils_dir = os.path.dirname(os.path.realpath(__file__))
+if _utils_dir not in sys.path:
+    sys.path.append(_utils_dir)
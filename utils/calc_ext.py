@@ -1,15 +1,155 @@
 import argparse
+import multiprocessing
+import os
+from functools import lru_cache
 
-from measure_extinction.stardata import StarData
 from measure_extinction.extdata import ExtData
 
+from star_cache import cached_stardata
+
+all = ["load_star", "calc_ext", "read_pairs", "calc_pairs"]
+
+
+@lru_cache(maxsize=None)
+def load_star(starname, path):
+    """
+    Read the observed data for a star, each star is only read once per process
+    and is parsed again only if its files changed.
+
+    Parameters
+    ----------
+    starname : str
+        name of the star
+    path : str
+        base path to observed data
+
+    Returns
+    -------
+    starobs : StarData
+        observed data
+    """
+    return cached_stardata("DAT_files/%s.dat" % starname, path=path)
+
+
+def calc_ext(redstarname, compstarname, path):
+    """
+    Calculate and save the extinction curve for a reddened and comparison star.
+
+    Parameters
+    ----------
+    redstarname : str
+        name of reddened star
+    compstarname : str
+        name of comparison star
+    path : str
+        base path to observed data
+
+    Returns
+    -------
+    out_fname : str
+        name of the saved extinction curve file
+    """
+    # read in the observed data for both stars
+    redstarobs = load_star(redstarname, path)
+    compstarobs = load_star(compstarname, path)
+
+    # calculate the extinction curve
+    extdata = ExtData()
+    extdata.calc_elx(redstarobs, compstarobs)
+
+    # save the extinction curve
+    out_fname = "fits/%s_%s_ext.fits" % (redstarname, compstarname)
+    extdata.save(out_fname)
+    return out_fname
+
+
+def read_pairs(filename):
+    """
+    Read the reddened and comparison star pairs from a file with either the
+    two star names or an extinction curve file name (e.g., as in
+    data/all_ext_14oct20.dat) on each line.
+
+    Parameters
+    ----------
+    filename : str
+        file with one pair per line, # for comments
+
+    Returns
+    -------
+    pairs : list of tuples
+        (reddened star, comparison star)
+    """
+    pairs = []
+    with open(filename, "r") as f:
+        for line in f:
+            names = line.strip().split()
+            if (len(names) == 0) or (names[0].find("#") == 0):
+                continue
+            if len(names) >= 2:
+                pairs.append((names[0], names[1]))
+            else:
+                sightline = os.path.basename(names[0]).split("_ext")[0]
+                pairs.append(tuple(sightline.split("_")[0:2]))
+    return pairs
+
+
+def _calc_group(args):
+    """
+    Calculate the extinction curves for pairs sharing a comparison star.
+    """
+    pairs, path = args
+    return [
+        calc_ext(redstarname, compstarname, path)
+        for redstarname, compstarname in pairs
+    ]
+
+
+def calc_pairs(pairs, path, nprocs=1):
+    """
+    Calculate the extinction curves for many pairs in one process or a pool of
+    processes.  The pairs are grouped by comparison star so that each
+    comparison star is read once per group.
+
+    Parameters
+    ----------
+    pairs : list of tuples
+        (reddened star, comparison star)
+    path : str
+        base path to observed data
+    nprocs : int, optional
+        number of processes
+
+    Returns
+    -------
+    out_fnames : list of str
+        names of the saved extinction curve files
+    """
+    groups = {}
+    for redstarname, compstarname in pairs:
+        groups.setdefault(compstarname, []).append((redstarname, compstarname))
+    jobs = [(cpairs, path) for cpairs in groups.values()]
+
+    if nprocs > 1:
+        with multiprocessing.Pool(nprocs) as pool:
+            results = pool.map(_calc_group, jobs, chunksize=1)
+    else:
+        results = [_calc_group(job) for job in jobs]
+    return [out_fname for result in results for out_fname in result]
+
 
 if __name__ == "__main__":
 
     # commandline parser
     parser = argparse.ArgumentParser()
-    parser.add_argument("redstarname", help="name of reddened star")
-    parser.add_argument("compstarname", help="name of comparision star")
+    parser.add_argument("redstarname", help="name of reddened star", nargs="?")
+    parser.add_argument("compstarname", help="name of comparision star", nargs="?")
+    parser.add_argument(
+        "--pairs",
+        help="file with a reddened and comparison star or curve file per line",
+    )
+    parser.add_argument(
+        "--nprocs", help="number of processes for --pairs", default=1, type=int
+    )
     parser.add_argument(
         "--path",
         help="base path to observed data",
@@ -17,17 +157,12 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
-    # read in the observed data for both stars
-    redstarobs = StarData("DAT_files/%s.dat" % args.redstarname, path=args.path)
-    compstarobs = StarData("DAT_files/%s.dat" % args.compstarname, path=args.path)
-
-    # output filebase
-    filebase = "fits/%s_%s" % (args.redstarname, args.compstarname)
-
-    # calculate the extinction curve
-    extdata = ExtData()
-    extdata.calc_elx(redstarobs, compstarobs)
-
-    # save the extinction curve
-    out_fname = "fits/%s_%s_ext.fits" % (args.redstarname, args.compstarname)
-    extdata.save(out_fname)
+    if args.pairs is not None:
+        for out_fname in calc_pairs(
+            read_pairs(args.pairs), args.path, nprocs=args.nprocs
+        ):
+            print(out_fname)
+    elif args.compstarname is not None:
+        calc_ext(args.redstarname, args.compstarname, args.path)
+    else:
+        parser.error("give a reddened and comparison star or --pairs")
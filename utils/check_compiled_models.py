@@ -0,0 +1,95 @@
+import argparse
+
+import numpy as np
+
+from dust_extinction.conversions import AxAvToExv
+from dust_extinction.shapes import FM90
+
+from G21 import G21, G21_drude_asym
+from compiled_models import compile_model
+
+all = ["check_compiled"]
+
+
+def check_compiled(model, x, ntest=10, scatter=0.1, rtol=1e-10, seed=0):
+    """
+    Check that a compiled model gives the same values as the astropy model
+    at the model parameters and at random parameters around them.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to compile
+    x : array
+        x values in wavenumbers [1/micron]
+    ntest : int, optional
+        number of random parameter vectors to test
+    scatter : float, optional
+        fractional scatter of the random parameters, kept within the bounds
+    rtol : float, optional
+        relative tolerance for the comparison
+    seed : int, optional
+        seed for the random parameters
+
+    Returns
+    -------
+    maxdiff : float
+        maximum difference relative to the maximum absolute model value
+
+    Raises
+    ------
+    ValueError
+        model not supported or compiled and astropy model values differ
+    """
+    compiled = compile_model(model, x)
+    if compiled is None:
+        raise ValueError("%s cannot be compiled" % type(model).__name__)
+
+    rng = np.random.default_rng(seed)
+    params = np.tile(np.asarray(model.parameters, dtype=float), (ntest + 1, 1))
+    params[1:] *= 1.0 + rng.uniform(-scatter, scatter, size=(ntest, params.shape[1]))
+    for k, pname in enumerate(model.param_names):
+        cmin, cmax = model.bounds[pname]
+        if cmin is not None:
+            params[:, k] = np.maximum(params[:, k], cmin)
+        if cmax is not None:
+            params[:, k] = np.minimum(params[:, k], cmax)
+
+    maxdiff = 0.0
+    ycomp = compiled(params)
+    for cparams, cycomp in zip(params, ycomp):
+        ymod = model.evaluate(x, *cparams)
+        scale = np.max(np.absolute(ymod))
+        maxdiff = max(maxdiff, np.max(np.absolute(cycomp - ymod)) / scale)
+        if not np.allclose(cycomp, ymod, rtol=rtol, atol=rtol * scale):
+            raise ValueError(
+                "compiled %s differs from the astropy model for parameters %s"
+                % (compiled.name, cparams)
+            )
+    return maxdiff
+
+
+if __name__ == "__main__":
+
+    # commandline parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--ntest", help="number of random parameter vectors", default=100, type=int
+    )
+    parser.add_argument("--rtol", help="relative tolerance", default=1e-10, type=float)
+    args = parser.parse_args()
+
+    # x grids of the fits in wavenumbers [1/micron]
+    mir_x = 1.0 / np.linspace(1.0, 39.0, 500)
+    uv_x = np.linspace(3.3, 8.0, 500)
+
+    models = {
+        "G21": (G21(), mir_x),
+        "G21_drude_asym": (G21_drude_asym(), mir_x),
+        "G21 | AxAvToExv": (G21() | AxAvToExv(Av=2.0), mir_x),
+        "G21_drude_asym | AxAvToExv": (G21_drude_asym() | AxAvToExv(Av=2.0), mir_x),
+        "FM90": (FM90(), uv_x),
+    }
+    for cname, (model, x) in models.items():
+        maxdiff = check_compiled(model, x, ntest=args.ntest, rtol=args.rtol)
+        print("%s: max relative difference %.2e" % (cname, maxdiff))
@@ -0,0 +1,395 @@
+import os
+
+import numpy as np
+
+import astropy.units as u
+from astropy.table import QTable
+from astropy.modeling import CompoundModel
+
+from mcmc_chains import ChainReader
+
+all = [
+    "CompiledModel",
+    "compile_model",
+    "samples_to_params",
+    "model_bands",
+    "plot_chain_band",
+]
+
+
+def _drude(wave, scale, x_o, gamma_o):
+    """
+    G21 drude with the wavelength terms as plain ufuncs
+    """
+    q = (gamma_o / x_o) ** 2
+    y = wave / x_o - x_o / wave
+    return scale * q / (y * y + q)
+
+
+def _drude_asym(wave, scale, x_o, gamma_o, asym):
+    """
+    G21 asymmetric drude with the wavelength terms as plain ufuncs
+    """
+    gamma = 2.0 * gamma_o / (1.0 + np.exp(asym * (wave - x_o)))
+    q = (gamma / x_o) ** 2
+    y = wave / x_o - x_o / wave
+    return scale * q / (y * y + q)
+
+
+def _g21(
+    grid,
+    scale,
+    alpha,
+    sil1_amp,
+    sil1_center,
+    sil1_fwhm,
+    sil2_amp,
+    sil2_center,
+    sil2_fwhm,
+):
+    """
+    G21 A(x)/A(V)
+    """
+    wave = grid["wave"]
+    return (
+        scale * np.exp(alpha * grid["logx"])
+        + _drude(wave, sil1_amp, sil1_center, sil1_fwhm)
+        + _drude(wave, sil2_amp, sil2_center, sil2_fwhm)
+    )
+
+
+def _g21_drude_asym(
+    grid,
+    scale,
+    alpha,
+    sil1_amp,
+    sil1_center,
+    sil1_fwhm,
+    sil1_asym,
+    sil2_amp,
+    sil2_center,
+    sil2_fwhm,
+    sil2_asym,
+):
+    """
+    G21_drude_asym A(x)/A(V)
+    """
+    wave = grid["wave"]
+    return (
+        scale * np.exp(alpha * grid["logx"])
+        + _drude_asym(wave, sil1_amp, sil1_center, sil1_fwhm, sil1_asym)
+        + _drude_asym(wave, sil2_amp, sil2_center, sil2_fwhm, sil2_asym)
+    )
+
+
+def _fm90(grid, C1, C2, C3, C4, xo, gamma):
+    """
+    FM90 E(x-V)/E(B-V)
+    """
+    x = grid["x"]
+    x2 = grid["x2"]
+    return (
+        C1
+        + C2 * x
+        + C3 * x2 / ((x2 - xo * xo) ** 2 + x2 * (gamma * gamma))
+        + C4 * grid["fm90_fuv"]
+    )
+
+
+def _p92_term(wave, amp, cen_wave, b):
+    """
+    P92 term with n = 2
+    """
+    l2 = (wave / cen_wave) ** 2
+    return amp / (l2 + 1.0 / l2 + b)
+
+
+def _p92_mod(
+    grid,
+    BKG_amp,
+    BKG_lambda,
+    BKG_width,
+    FUV_amp,
+    FUV_lambda,
+    FUV_b,
+    FUV_n,
+    NUV_amp,
+    NUV_lambda,
+    NUV_width,
+    SIL1_amp,
+    SIL1_lambda,
+    SIL1_width,
+    SIL2_amp,
+    SIL2_lambda,
+    SIL2_width,
+    FIR_amp,
+    FIR_lambda,
+    FIR_width,
+):
+    """
+    P92_mod A(x)/A(V)
+    """
+    wave = grid["wave"]
+    # b from the width for the n = 2 terms
+    fuv_norm = wave / FUV_lambda
+    return (
+        _p92_term(wave, BKG_amp, BKG_lambda, (BKG_width / BKG_lambda) ** 2 - 2.0)
+        + FUV_amp / (fuv_norm ** FUV_n + fuv_norm ** (-FUV_n) + FUV_b)
+        + _p92_term(wave, NUV_amp, NUV_lambda, (NUV_width / NUV_lambda) ** 2 - 2.0)
+        + _p92_term(
+            wave, SIL1_amp, SIL1_lambda, (SIL1_width / SIL1_lambda) ** 2 - 2.0
+        )
+        + _p92_term(
+            wave, SIL2_amp, SIL2_lambda, (SIL2_width / SIL2_lambda) ** 2 - 2.0
+        )
+        + _p92_term(wave, FIR_amp, FIR_lambda, (FIR_width / FIR_lambda) ** 2 - 2.0)
+    )
+
+
+# plain numpy evaluators for the models, by class name
+compiled_evaluators = {
+    "G21": _g21,
+    "G21_drude_asym": _g21_drude_asym,
+    "FM90": _fm90,
+    "P92_mod": _p92_mod,
+}
+
+
+class CompiledModel:
+    """
+    Evaluate a model on a fixed x grid from full parameter vectors with
+    plain numpy ufuncs.  The x dependent quantities are computed once and
+    the x range is checked once.  Avoids the astropy parameter setting,
+    input validation, and unit handling for each evaluation.
+
+    Supports the models in compiled_evaluators and these models piped into
+    AxAvToExv.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to compile
+    x : array
+        x values in wavenumbers [1/micron]
+    """
+
+    def __init__(self, model, x):
+        if isinstance(model, CompoundModel):
+            if model.op != "|" or type(model.right).__name__ != "AxAvToExv":
+                raise ValueError("only compound models of model | AxAvToExv")
+            leaf = model.left
+            self.av_indx = len(leaf.param_names)
+        else:
+            leaf = model
+            self.av_indx = None
+        leaf_name = type(leaf).__name__
+        if leaf_name not in compiled_evaluators.keys():
+            raise ValueError("no compiled evaluator for %s" % leaf_name)
+        self.evaluator = compiled_evaluators[leaf_name]
+        self.name = leaf_name if self.av_indx is None else leaf_name + " | AxAvToExv"
+        self.n_leaf = len(leaf.param_names)
+
+        # range check done once
+        leaf(x)
+
+        x = np.asarray(x, dtype=float)
+        y = x - 5.9
+        self.grid = {
+            "x": x,
+            "x2": x ** 2,
+            "logx": np.log(x),
+            "wave": 1.0 / x,
+            # FM90 FUV rise term
+            "fm90_fuv": np.where(
+                x >= 5.9, 0.5392 * (y ** 2) + 0.05644 * (y ** 3), 0.0
+            ),
+        }
+
+    def __call__(self, params):
+        """
+        Evaluate the model.
+
+        Parameters
+        ----------
+        params : 1D or 2D array
+            full parameter vector or block of parameter vectors [nblock, nparams]
+            in model.param_names order
+
+        Returns
+        -------
+        ymod : 1D or 2D array
+            model values [len(x)] or [nblock, len(x)]
+        """
+        params = np.asarray(params, dtype=float)
+        if params.ndim == 1:
+            cols = params
+        else:
+            cols = params.T[:, :, np.newaxis]
+        ymod = self.evaluator(self.grid, *cols[: self.n_leaf])
+        if self.av_indx is not None:
+            ymod = (ymod - 1.0) * cols[self.av_indx]
+        if params.ndim == 2:
+            ymod = np.broadcast_to(ymod, (len(params), len(self.grid["x"])))
+        return ymod
+
+
+def compile_model(model, x):
+    """
+    Compile a model for evaluation on a fixed x grid.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to compile
+    x : array
+        x values in wavenumbers [1/micron]
+
+    Returns
+    -------
+    compiled : CompiledModel or None
+        compiled model, None if the model is not supported
+    """
+    try:
+        compiled = CompiledModel(model, x)
+    except ValueError:
+        return None
+    return compiled
+
+
+def samples_to_params(model, samples, param_names=None):
+    """
+    Full parameter vectors from posterior samples of the fit parameters.
+
+    Parameters
+    ----------
+    model : astropy model
+        model with the values of the parameters not sampled
+    samples : 2D array
+        samples [nsamples, nfit]
+    param_names : list of str, optional
+        names of the sampled parameters, default is the parameters that are
+        not fixed or tied in model.param_names order as used by the fitters
+
+    Returns
+    -------
+    params : 2D array
+        full parameter vectors [nsamples, nparams]
+    """
+    samples = np.atleast_2d(samples)
+    if param_names is None:
+        for pname in model.param_names:
+            if model.tied[pname]:
+                raise ValueError("tied parameters are not supported")
+        param_names = [
+            pname for pname in model.param_names if not model.fixed[pname]
+        ]
+    if samples.shape[1] != len(param_names):
+        raise ValueError(
+            "samples have %d parameters, expected %d"
+            % (samples.shape[1], len(param_names))
+        )
+
+    indxs = [model.param_names.index(pname) for pname in param_names]
+    params = np.tile(np.asarray(model.parameters, dtype=float), (len(samples), 1))
+    params[:, indxs] = samples
+    return params
+
+
+def model_bands(
+    model,
+    x,
+    samples,
+    param_names=None,
+    percentiles=(16.0, 50.0, 84.0),
+    chunk_size=10000000,
+    filename=None,
+):
+    """
+    Percentile bands of a model evaluated for all the posterior samples.
+
+    The model is evaluated for all the samples at once on chunks of the x
+    values to limit the memory used.
+
+    Parameters
+    ----------
+    model : astropy model
+        model with the values of the parameters not sampled
+    x : array or astropy.units.Quantity
+        x values in wavenumbers [1/micron] or with units
+    samples : 2D array
+        samples of the fit parameters [nsamples, nfit]
+    param_names : list of str, optional
+        names of the sampled parameters (see samples_to_params)
+    percentiles : tuple of floats, optional
+        percentiles to compute
+    chunk_size : int, optional
+        maximum number of model values evaluated at once
+    filename : str, optional
+        file to save the bands as a table with columns x and p16, p50, etc.
+
+    Returns
+    -------
+    bands : 2D array
+        model percentiles [len(percentiles), len(x)]
+    """
+    if isinstance(x, u.Quantity):
+        x = x.to(1.0 / u.micron, equivalencies=u.spectral()).value
+    x = np.atleast_1d(np.asarray(x, dtype=float))
+    params = samples_to_params(model, samples, param_names=param_names)
+
+    nchunk = max(1, chunk_size // len(params))
+    bands = np.zeros((len(percentiles), len(x)))
+    for k in range(0, len(x), nchunk):
+        cx = x[k : k + nchunk]
+        compiled = compile_model(model, cx)
+        if compiled is not None:
+            ymod = compiled(params)
+        else:
+            # one sample at a time for models without a compiled evaluator
+            model_copy = model.copy()
+            ymod = np.zeros((len(params), len(cx)))
+            for i, cparams in enumerate(params):
+                model_copy.parameters = cparams
+                ymod[i] = model_copy(cx)
+        bands[:, k : k + nchunk] = np.percentile(ymod, percentiles, axis=0)
+
+    if filename is not None:
+        otab = QTable()
+        otab["x"] = x / u.micron
+        for cper, cband in zip(percentiles, bands):
+            otab["p%g" % cper] = cband
+        otab.write(filename, overwrite=True)
+
+    return bands
+
+
+def plot_chain_band(ax, model, mod_x, chainfile, burnfrac=0.4, offset=None, **kwargs):
+    """
+    Plot the 68% band of the model from all the samples in a saved MCMC chain,
+    nothing is plotted if the chain file does not exist.
+
+    Parameters
+    ----------
+    ax : matplotlib axis
+        axis for the plot
+    model : astropy model
+        model with the values of the parameters not sampled
+    mod_x : astropy.units.Quantity
+        x values for the band
+    chainfile : str
+        name of the HDF5 file with the chain
+    burnfrac : float, optional
+        fraction of the chain to discard if no burn in is stored
+    offset : array, optional
+        values subtracted from the band (e.g., the model for residuals)
+    kwargs : dict
+        other arguments for ax.fill_between
+    """
+    if not os.path.isfile(chainfile):
+        return
+    reader = ChainReader(chainfile, burnfrac=burnfrac)
+    samples = reader.get_chain(flat=True)
+    bands = model_bands(model, mod_x, samples, param_names=reader.param_names)
+    if offset is not None:
+        bands = bands - offset
+    ax.fill_between(mod_x.value, bands[0], bands[2], **kwargs)
@@ -0,0 +1,303 @@
+import argparse
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import runpy
+import sys
+
+all = ["file_hash", "local_modules", "DependencyTracker", "filelist_inputs"]
+
+
+def file_hash(filename, blocksize=1048576):
+    """
+    SHA1 hash of the contents of a file.
+
+    Parameters
+    ----------
+    filename : str
+        name of the file
+
+    Returns
+    -------
+    hash : str
+        hex digest of the hash
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _imported_names(tree):
+    """
+    Names of the modules and possible submodules imported in a parsed file.
+    """
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.append(node.module)
+            names += ["%s.%s" % (node.module, alias.name) for alias in node.names]
+    return names
+
+
+def local_modules(script):
+    """
+    The script and the local modules it imports, directly or through other
+    local modules.  Local modules are found relative to the directory of the
+    importing file, e.g., utils.mcmc_chains through the Figs/utils symlink
+    and mcmc_chains from another module in utils.
+
+    Parameters
+    ----------
+    script : str
+        script file name
+
+    Returns
+    -------
+    files : list of str
+        script and module file names relative to the current directory,
+        symlinks resolved
+    """
+    files = []
+    todo = [script]
+    while len(todo) > 0:
+        cfile = os.path.relpath(os.path.realpath(todo.pop()))
+        if cfile in files:
+            continue
+        files.append(cfile)
+        with open(cfile, "r") as f:
+            tree = ast.parse(f.read(), filename=cfile)
+        cdir = os.path.dirname(cfile)
+        for cname in _imported_names(tree):
+            parts = cname.split(".")
+            for k in range(1, len(parts) + 1):
+                cpath = os.path.join(cdir, *parts[0:k])
+                for mfile in [cpath + ".py", os.path.join(cpath, "__init__.py")]:
+                    if os.path.isfile(mfile):
+                        todo.append(mfile)
+                        break
+    return files[0:1] + sorted(files[1:])
+
+
+class DependencyTracker:
+    """
+    Record of the hashes of the inputs, code, and arguments used to make each
+    artifact (extinction curve, fit, figure, table), kept in a JSON file.
+
+    Work is only needed if the recorded signature of an artifact differs from
+    the current one or an output is missing.  File hashes are cached by
+    modification time and size so unchanged files are not read again.
+
+    Parameters
+    ----------
+    filename : str, optional
+        name of the JSON file with the records
+    """
+
+    def __init__(self, filename=".dependencies.json"):
+        self.filename = filename
+        self.records = {}
+        self.hashes = {}
+        if os.path.isfile(filename):
+            with open(filename, "r") as f:
+                saved = json.load(f)
+            self.records = saved.get("records", {})
+            self.hashes = saved.get("hashes", {})
+
+    def hash(self, filename):
+        """
+        Hash of a file, None if the file does not exist.
+
+        Parameters
+        ----------
+        filename : str
+            name of the file
+
+        Returns
+        -------
+        hash : str
+            hex digest of the hash
+        """
+        if not os.path.isfile(filename):
+            return None
+        fstat = os.stat(filename)
+        cached = self.hashes.get(filename)
+        if (
+            cached is not None
+            and cached["mtime"] == fstat.st_mtime
+            and cached["size"] == fstat.st_size
+        ):
+            return cached["sha1"]
+        sha1 = file_hash(filename)
+        self.hashes[filename] = {
+            "mtime": fstat.st_mtime,
+            "size": fstat.st_size,
+            "sha1": sha1,
+        }
+        return sha1
+
+    def signature(self, inputs, code=(), args=()):
+        """
+        Current signature of an artifact.
+
+        Parameters
+        ----------
+        inputs : list of str
+            input files
+        code : list of str, optional
+            code files
+        args : list of str, optional
+            arguments
+
+        Returns
+        -------
+        signature : dict
+            hashes of the inputs and code, and the arguments
+        """
+        return {
+            "inputs": {cfile: self.hash(cfile) for cfile in inputs},
+            "code": {cfile: self.hash(cfile) for cfile in code},
+            "args": list(args),
+        }
+
+    def changes(self, key, inputs, code=(), args=(), outputs=()):
+        """
+        Reasons an artifact needs to be made again.
+
+        Parameters
+        ----------
+        key : str
+            name of the artifact
+        inputs, code, args : lists of str
+            see signature
+        outputs : list of str, optional
+            output files that have to exist
+
+        Returns
+        -------
+        reasons : list of str
+            empty if the artifact is up to date
+        """
+        record = self.records.get(key)
+        if record is None:
+            return ["not made before"]
+
+        reasons = []
+        for cfile in outputs:
+            if not os.path.isfile(cfile):
+                reasons.append("missing %s" % cfile)
+        current = self.signature(inputs, code=code, args=args)
+        for ctype in ["inputs", "code"]:
+            for cfile, chash in current[ctype].items():
+                if record[ctype].get(cfile) != chash:
+                    reasons.append("changed %s" % cfile)
+            for cfile in set(record[ctype].keys()) - set(current[ctype].keys()):
+                reasons.append("removed %s" % cfile)
+        if record["args"] != current["args"]:
+            reasons.append("changed arguments")
+        return reasons
+
+    def record(self, key, inputs, code=(), args=()):
+        """
+        Record the current signature of an artifact after it is made.
+
+        Parameters
+        ----------
+        key : str
+            name of the artifact
+        inputs, code, args : lists of str
+            see signature
+        """
+        self.records[key] = self.signature(inputs, code=code, args=args)
+
+    def write(self):
+        """
+        Write the records.
+        """
+        with open(self.filename, "w") as f:
+            json.dump({"records": self.records, "hashes": self.hashes}, f, indent=1)
+
+
+def filelist_inputs(filelist, basedir="fits"):
+    """
+    Input files for a figure or table from a list of extinction curve files:
+    the list, the curves, their FM90 fits, and the MCMC chains of both.
+
+    Parameters
+    ----------
+    filelist : str
+        file with one extinction curve file name per line, # for comments
+    basedir : str, optional
+        directory for the names that are not found as given
+
+    Returns
+    -------
+    inputs : list of str
+        existing input files
+    """
+    inputs = [filelist]
+    with open(filelist, "r") as f:
+        for line in f:
+            name = line.strip()
+            if (len(name) == 0) or (name.find("#") == 0):
+                continue
+            if not os.path.isfile(name):
+                name = os.path.join(basedir, name)
+            for cname in [name, name.replace(".fits", "_FM90.fits")]:
+                for cfile in [cname, cname.replace(".fits", ".h5")]:
+                    if os.path.isfile(cfile) and cfile not in inputs:
+                        inputs.append(cfile)
+    return inputs
+
+
+if __name__ == "__main__":
+
+    # commandline parser
+    parser = argparse.ArgumentParser(
+        description="run a figure or table script only if its inputs changed, "
+        + "e.g., python utils/dependencies.py Figs/plot_silicate.py "
+        + "data/all_ext_14oct20_pldrude.dat --png"
+    )
+    parser.add_argument("script", help="figure or table script")
+    parser.add_argument("filelist", help="file with list of curves for the script")
+    parser.add_argument(
+        "--output", help="save the printed output of the script to this file"
+    )
+    parser.add_argument(
+        "--dry_run", help="only report if the script would run", action="store_true"
+    )
+    parser.add_argument("--force", help="run even if up to date", action="store_true")
+    args, script_args = parser.parse_known_args()
+
+    tracker = DependencyTracker()
+    argv = [args.filelist] + script_args
+    inputs = filelist_inputs(args.filelist)
+    code = local_modules(args.script)
+    outputs = [] if args.output is None else [args.output]
+    key = " ".join([args.script] + argv)
+
+    reasons = tracker.changes(key, inputs, code=code, args=argv, outputs=outputs)
+    if args.force:
+        reasons.append("forced")
+    if len(reasons) == 0:
+        print(f"{key}: up to date")
+        sys.exit(0)
+    print(f"{key}: would run, {', '.join(reasons)}")
+    if args.dry_run:
+        sys.exit(0)
+
+    # scripts import from the utils directory of the repository
+    sys.path.insert(0, os.getcwd())
+    sys.argv = [args.script] + argv
+    if args.output is None:
+        runpy.run_path(args.script, run_name="__main__")
+    else:
+        with open(args.output, "w") as f, contextlib.redirect_stdout(f):
+            runpy.run_path(args.script, run_name="__main__")
+    tracker.record(key, inputs, code=code, args=argv)
+    tracker.write()
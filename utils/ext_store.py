@@ -0,0 +1,418 @@
+import argparse
+import os
+
+import numpy as np
+import h5py
+
+import astropy.units as u
+from measure_extinction.extdata import ExtData
+
+from mcmc_chains import ChainReader
+
+all = ["read_filelist", "export_store", "ExtStore"]
+
+
+def read_filelist(filelist, basedir="fits"):
+    """
+    Read the extinction curve files from a list file.
+
+    Parameters
+    ----------
+    filelist : str
+        file with one extinction curve file name per line, # for comments
+    basedir : str, optional
+        directory with the extinction curve files
+
+    Returns
+    -------
+    sightlines : list of str
+        sightline names (reddened_comparison)
+    extfnames : list of str
+        extinction curve file names
+    """
+    sightlines = []
+    extfnames = []
+    with open(filelist, "r") as f:
+        for line in f:
+            name = line.strip()
+            if (len(name) == 0) or (name.find("#") == 0):
+                continue
+            sightlines.append(os.path.basename(name).split("_ext")[0])
+            extfnames.append(os.path.join(basedir, name))
+    return sightlines, extfnames
+
+
+def _fit_dicts(ext):
+    """
+    Fit parameter dictionaries of an ExtData (e.g., g21_p50_fit).
+    """
+    return {
+        cname: cval
+        for cname, cval in vars(ext).items()
+        if cname.endswith("_fit") and isinstance(cval, dict)
+    }
+
+
+def _chain_samples(chainfile, burnfrac, nsamples, rng):
+    """
+    Random subset of the burned in, autocorrelation thinned samples.
+    """
+    reader = ChainReader(chainfile, burnfrac=burnfrac, thin="auto")
+    samples = reader.get_chain(flat=True)
+    if len(samples) > nsamples:
+        samples = samples[np.sort(rng.choice(len(samples), nsamples, replace=False))]
+    return samples, reader.param_names
+
+
+def export_store(
+    filelist, storefile, basedir="fits", burnfrac=0.4, nsamples=1000, seed=0
+):
+    """
+    Pack the extinction curves, fit parameters, and thinned posterior samples
+    for a list of sightlines into one HDF5 file.
+
+    Layout, n is the number of sightlines:
+
+    - index/sightline, index/filename, index/type : [n] names, curve files,
+      and curve types
+    - curves/<src>/offsets : [n + 1] start of each sightline in the columns
+    - curves/<src>/waves, exts, uncs, npts : concatenated curves
+    - curves/<src>/names : concatenated band names (if present)
+    - columns/<name> : [n, 3] value and uncertainties (e.g., AV), nan if missing
+    - params/<fit>/<param> : [n, m] fit parameters (e.g., g21_p50_fit/SCALE)
+    - samples/<chain> : [n, nsamples, nparams] posterior samples with the
+      parameter names as an attribute, nan if missing
+
+    The FM90 fits (_FM90.fits and _FM90.h5) of each curve are included as
+    the fm90 chain and their fm90 fit parameters.
+
+    Parameters
+    ----------
+    filelist : str
+        file with one extinction curve file name per line, # for comments
+    storefile : str
+        name of the HDF5 file to write
+    basedir : str, optional
+        directory with the extinction curve files
+    burnfrac : float, optional
+        fraction of the chains to discard if no burn in is stored
+    nsamples : int, optional
+        maximum number of samples per chain
+    seed : int, optional
+        seed for the random subsets of the samples
+    """
+    rng = np.random.default_rng(seed)
+    sightlines, extfnames = read_filelist(filelist, basedir=basedir)
+    nsight = len(sightlines)
+
+    curves = {}
+    columns = {}
+    params = {}
+    samples = {}
+    types = []
+    for k, extfname in enumerate(extfnames):
+        ext = ExtData(filename=extfname)
+        types.append(ext.type)
+        fits = _fit_dicts(ext)
+        chains = {"fit": extfname.replace(".fits", ".h5")}
+        fm90fname = extfname.replace(".fits", "_FM90.fits")
+        if os.path.isfile(fm90fname):
+            for cname, cval in _fit_dicts(ExtData(filename=fm90fname)).items():
+                fits.setdefault(cname, cval)
+            chains["fm90"] = fm90fname.replace(".fits", ".h5")
+
+        for src in ext.waves.keys():
+            ccurve = curves.setdefault(src, {"k": [], "waves": [], "exts": []})
+            ccurve["k"].append(k)
+            ccurve["waves"].append(ext.waves[src])
+            ccurve["exts"].append(np.asarray(ext.exts[src], dtype=float))
+            for cname in ["uncs", "npts", "names"]:
+                cvals = getattr(ext, cname, {})
+                if src in cvals.keys():
+                    ccurve.setdefault(cname, {})[k] = cvals[src]
+        for cname, cval in ext.columns.items():
+            cval = np.atleast_1d(np.asarray(cval, dtype=float))[0:3]
+            columns.setdefault(cname, np.full((nsight, 3), np.nan))[
+                k, 0 : len(cval)
+            ] = cval
+        for fname, cfit in fits.items():
+            for pname, cval in cfit.items():
+                cval = np.atleast_1d(np.asarray(cval, dtype=float))
+                params.setdefault((fname, pname), {})[k] = cval
+        for cname, chainfile in chains.items():
+            if os.path.isfile(chainfile):
+                samples.setdefault(cname, {})[k] = _chain_samples(
+                    chainfile, burnfrac, nsamples, rng
+                )
+
+    with h5py.File(storefile, "w") as f:
+        strtype = h5py.string_dtype()
+        f.attrs["filelist"] = filelist
+        f.create_dataset("index/sightline", data=sightlines, dtype=strtype)
+        f.create_dataset("index/filename", data=extfnames, dtype=strtype)
+        f.create_dataset("index/type", data=types, dtype=strtype)
+
+        for src, ccurve in curves.items():
+            group = f.create_group("curves/%s" % src)
+            counts = np.zeros(nsight, dtype=int)
+            counts[ccurve["k"]] = [len(cwaves) for cwaves in ccurve["waves"]]
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            group["offsets"] = offsets
+            waves = [u.Quantity(cwaves, u.micron).value for cwaves in ccurve["waves"]]
+            group.create_dataset("waves", data=np.concatenate(waves), chunks=True)
+            group["waves"].attrs["unit"] = "micron"
+            group.create_dataset(
+                "exts", data=np.concatenate(ccurve["exts"]), chunks=True
+            )
+            for cname in ["uncs", "npts"]:
+                if cname in ccurve.keys():
+                    cvals = np.full(offsets[-1], np.nan)
+                    for k, cval in ccurve[cname].items():
+                        cvals[offsets[k] : offsets[k + 1]] = cval
+                    group.create_dataset(cname, data=cvals, chunks=True)
+            if "names" in ccurve.keys():
+                cnames = np.full(offsets[-1], "", dtype=object)
+                for k, cval in ccurve["names"].items():
+                    cnames[offsets[k] : offsets[k + 1]] = list(cval)
+                group.create_dataset("names", data=cnames, dtype=strtype)
+
+        for cname, cvals in columns.items():
+            f["columns/%s" % cname] = cvals
+
+        for (fname, pname), cvals in params.items():
+            nvals = max([len(cval) for cval in cvals.values()])
+            ovals = np.full((nsight, nvals), np.nan)
+            for k, cval in cvals.items():
+                ovals[k, 0 : len(cval)] = cval
+            f["params/%s/%s" % (fname, pname)] = ovals
+
+        for cname, csamples in samples.items():
+            pnames = []
+            for _, cpnames in csamples.values():
+                for pname in cpnames or []:
+                    if pname not in pnames:
+                        pnames.append(pname)
+            ndim = max([len(pnames)] + [cs.shape[1] for cs, _ in csamples.values()])
+            dset = f.create_dataset(
+                "samples/%s" % cname,
+                shape=(nsight, nsamples, ndim),
+                dtype=np.float32,
+                chunks=(1, nsamples, 1),
+                fillvalue=np.nan,
+            )
+            for k, (cs, cpnames) in csamples.items():
+                if cpnames is None:
+                    cols = list(range(cs.shape[1]))
+                else:
+                    cols = [pnames.index(pname) for pname in cpnames]
+                ovals = np.full((nsamples, ndim), np.nan, dtype=np.float32)
+                ovals[0 : len(cs), cols] = cs
+                dset[k] = ovals
+            dset.attrs["param_names"] = pnames
+
+
+class ExtStore:
+    """
+    Read access to the extinction curves, fit parameters, and posterior
+    samples packed by export_store.  Only the requested columns and
+    sightlines are read from the file.
+
+    Parameters
+    ----------
+    filename : str
+        name of the HDF5 file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = h5py.File(filename, "r")
+        self.sightlines = list(self.file["index/sightline"].asstr()[:])
+        self.filenames = list(self.file["index/filename"].asstr()[:])
+        self.types = list(self.file["index/type"].asstr()[:])
+        self.index = {cname: k for k, cname in enumerate(self.sightlines)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self.file.close()
+
+    def _indx(self, sightline):
+        """
+        Index of a sightline given by name or index.
+        """
+        if isinstance(sightline, str):
+            return self.index[sightline]
+        return sightline
+
+    def sources(self):
+        """
+        Names of the curve sources (e.g., BAND, IUE, IRS).
+        """
+        return list(self.file["curves"].keys())
+
+    def curve(self, sightline, src):
+        """
+        Extinction curve of one sightline for one source.
+
+        Parameters
+        ----------
+        sightline : str or int
+            sightline name or index
+        src : str
+            source (e.g., IRS)
+
+        Returns
+        -------
+        curve : dict
+            waves (Quantity) and exts, uncs, npts, names if present, None if
+            the sightline has no data for the source
+        """
+        k = self._indx(sightline)
+        if src not in self.file["curves"]:
+            return None
+        group = self.file["curves/%s" % src]
+        start, stop = group["offsets"][k : k + 2]
+        if start == stop:
+            return None
+        curve = {"waves": group["waves"][start:stop] * u.micron}
+        for cname in ["exts", "uncs", "npts"]:
+            if cname in group:
+                curve[cname] = group[cname][start:stop]
+        if "names" in group:
+            curve["names"] = list(group["names"].asstr()[start:stop])
+        return curve
+
+    def column(self, cname):
+        """
+        Column for all the sightlines (e.g., AV).
+
+        Returns
+        -------
+        vals : 2D array
+            [nsightlines, 3] value and uncertainties, nan if missing
+        """
+        return self.file["columns/%s" % cname][:]
+
+    def param(self, fname, pname):
+        """
+        Fit parameter for all the sightlines.
+
+        Parameters
+        ----------
+        fname : str
+            fit name (e.g., g21_p50_fit)
+        pname : str
+            parameter name (e.g., SCALE)
+
+        Returns
+        -------
+        vals : 2D array
+            [nsightlines, m] values, nan if missing
+        """
+        return self.file["params/%s/%s" % (fname, pname)][:]
+
+    def param_names(self, chain="fit"):
+        """
+        Parameter names of the samples of a chain.
+        """
+        return list(self.file["samples/%s" % chain].attrs["param_names"])
+
+    def samples(self, chain="fit", cols=None, sightline=None):
+        """
+        Posterior samples.
+
+        Parameters
+        ----------
+        chain : str, optional
+            chain, fit or fm90
+        cols : list of str or ints, optional
+            parameters, default is all
+        sightline : str or int, optional
+            one sightline, default is all
+
+        Returns
+        -------
+        samples : array
+            [nsightlines, nsamples, ncols] or [nsamples, ncols] for one
+            sightline, nan for missing samples
+        """
+        dset = self.file["samples/%s" % chain]
+        steps = slice(None) if sightline is None else self._indx(sightline)
+        if cols is None:
+            return dset[steps]
+        pnames = self.param_names(chain)
+        cols = [pnames.index(c) if isinstance(c, str) else c for c in cols]
+        # h5py needs increasing column indices
+        ucols, inverse = np.unique(cols, return_inverse=True)
+        return dset[steps, :, list(ucols)][..., inverse]
+
+    def get_extdata(self, sightline):
+        """
+        ExtData for a sightline from the store, without reading its files.
+
+        Parameters
+        ----------
+        sightline : str or int
+            sightline name or index
+
+        Returns
+        -------
+        ext : ExtData
+            extinction curve with the columns and fit parameters
+        """
+        k = self._indx(sightline)
+        ext = ExtData()
+        ext.type = self.types[k]
+        for src in self.sources():
+            curve = self.curve(k, src)
+            if curve is None:
+                continue
+            ext.waves[src] = curve["waves"]
+            ext.exts[src] = curve["exts"]
+            if "uncs" in curve.keys():
+                ext.uncs[src] = curve["uncs"]
+            if "npts" in curve.keys():
+                ext.npts[src] = curve["npts"]
+            if "names" in curve.keys():
+                ext.names[src] = curve["names"]
+        for cname in self.file.get("columns", {}):
+            cval = self.file["columns/%s" % cname][k]
+            if np.isfinite(cval[0]):
+                ext.columns[cname] = tuple(cval[np.isfinite(cval)])
+        for fname in self.file.get("params", {}):
+            cfit = {}
+            for pname, dset in self.file["params/%s" % fname].items():
+                cval = dset[k]
+                if np.isfinite(cval[0]):
+                    cfit[pname] = cval[0] if len(cval) == 1 else cval
+            if len(cfit) > 0:
+                setattr(ext, fname, cfit)
+        return ext
+
+
+if __name__ == "__main__":
+
+    # commandline parser
+    parser = argparse.ArgumentParser(
+        description="pack the curves, fits, and chains for a list of sightlines"
+    )
+    parser.add_argument("filelist", help="file with list of curves")
+    parser.add_argument("storefile", help="HDF5 file to write")
+    parser.add_argument(
+        "--nsamples", help="maximum samples per chain", default=1000, type=int
+    )
+    parser.add_argument(
+        "--burnfrac", help="burn in for chains without one", default=0.4, type=float
+    )
+    args = parser.parse_args()
+
+    export_store(
+        args.filelist, args.storefile, burnfrac=args.burnfrac, nsamples=args.nsamples
+    )
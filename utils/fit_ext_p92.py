@@ -1,4 +1,5 @@
 import argparse
+from functools import partial
 import warnings
 import matplotlib.pyplot as plt
 import matplotlib
@@ -6,14 +7,16 @@ import numpy as np
 
 import astropy.units as u
 from astropy.modeling.fitting import LevMarLSQFitter
-from astropy.modeling.fitting import _fitter_to_model_params
 
 from astropy.utils.exceptions import AstropyWarning
 from dust_extinction.conversions import AxAvToExv
 from measure_extinction.extdata import ExtData
 
-from models_mcmc_extension import EmceeFitter
+from models_mcmc_extension import EmceeFitter, LaplaceFitter
+from varpro import AvProjection
 from P92_mod import P92_mod
+from G21 import axav_to_exv_fit_deriv
+from compiled_models import model_bands
 
 
 def tie_amps_SIL2_to_SIL1(model):
@@ -47,11 +50,59 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("extfile", help="file with extinction curve")
     parser.add_argument(
-        "--burnfrac", type=float, default=0.1, help="fraction of MCMC chain to burn"
+        "--burnfrac",
+        type=float,
+        help="fraction of MCMC chain to burn (default automatic)",
     )
     parser.add_argument(
         "--nsteps", type=int, default=100, help="# of steps in MCMC chain"
     )
+    parser.add_argument(
+        "--nprocs", type=int, default=1, help="# of processes for the MCMC walkers"
+    )
+    parser.add_argument(
+        "--autocorr_check",
+        type=int,
+        default=0,
+        help="check MCMC convergence every # steps and stop early (0 = never)",
+    )
+    parser.add_argument(
+        "--autocorr_tol",
+        type=float,
+        default=0.01,
+        help="converged when the autocorrelation time changes less than this fraction",
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue the saved MCMC chain adding nsteps more steps",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--init_cov",
+        help="start the MCMC walkers from the LevMarLSQ covariance",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sampler",
+        choices=["emcee", "hmc"],
+        default="emcee",
+        help="MCMC sampler, hmc uses the analytic model derivatives",
+    )
+    parser.add_argument(
+        "--unbounded",
+        help="MCMC sampling in unconstrained transformed parameters",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fast",
+        help="Gaussian approximation around the LevMarLSQ fit instead of MCMC",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--av_mcmc",
+        choices=["marginalize", "profile"],
+        help="MCMC with A(V) marginalized or profiled (E(lambda-V) curves only)",
+    )
     parser.add_argument("--png", help="save figure as a png file", action="store_true")
     parser.add_argument("--pdf", help="save figure as a pdf file", action="store_true")
     args = parser.parse_args()
@@ -87,8 +138,10 @@ if __name__ == "__main__":
     # initialize the model
     #    a few tweaks to the starting parameters helps find the solution
     if extdata.type == "elx":
-        p92_init = P92_mod(BKG_amp=200.0, FUV_amp=100.0, FUV_lambda=0.06) | AxAvToExv(
-            Av=av_guess
+        # analytic derivatives through the AxAvToExv conversion
+        p92_init = axav_to_exv_fit_deriv(
+            P92_mod(BKG_amp=200.0, FUV_amp=100.0, FUV_lambda=0.06)
+            | AxAvToExv(Av=av_guess)
         )
     else:
         p92_init = P92_mod(BKG_amp=200.0, FUV_amp=100.0, FUV_lambda=0.06)
@@ -127,10 +180,27 @@ if __name__ == "__main__":
 
     # pick the fitter
     fit = LevMarLSQFitter()
+    if args.av_mcmc:
+        projection = partial(AvProjection, mode=args.av_mcmc)
+    else:
+        projection = None
     nsteps = args.nsteps
-    fit2 = EmceeFitter(
-        nsteps=nsteps, burnfrac=args.burnfrac, save_samples=emcee_samples_file
-    )
+    if args.fast:
+        # quick look Laplace approximation, same outputs as the MCMC
+        fit2 = LaplaceFitter(nsteps=nsteps, save_samples=emcee_samples_file)
+    else:
+        fit2 = EmceeFitter(
+            nsteps=nsteps,
+            burnfrac=args.burnfrac,
+            save_samples=emcee_samples_file,
+            nprocs=args.nprocs,
+            autocorr_check=args.autocorr_check,
+            autocorr_tol=args.autocorr_tol,
+            resume=args.resume,
+            projection=projection,
+            sampler=args.sampler,
+            unbounded=args.unbounded,
+        )
 
     # modify weights to make sure the 2175 A bump is fit
     weights = 1.0 / y_unc
@@ -143,7 +213,11 @@ if __name__ == "__main__":
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=UserWarning)
         p92_fit = fit(p92_init, x, y, weights=weights, maxiter=10000, epsilon=0.001)
-        p92_fit2 = fit2(p92_fit, x, y, weights=weights)
+        if args.init_cov:
+            init_cov = fit.fit_info["param_cov"]
+        else:
+            init_cov = None
+        p92_fit2 = fit2(p92_fit, x, y, weights=weights, init_cov=init_cov)
 
     print(args.extfile)
     print("autocorr tau = ", fit2.fit_info["sampler"].get_autocorr_time(quiet=True))
@@ -191,20 +265,25 @@ if __name__ == "__main__":
     extdata.plot(ax, color="k", alpha=0.5)
     extdata.plot(ax2, color="k", alpha=0.5)
 
-    # plot samples from the mcmc chaing
-    flat_samples = fit2.fit_info["sampler"].get_chain(
-        discard=int(0.1 * nsteps), flat=True
+    # plot the 68% band from all the samples in the mcmc chain
+    # discard the burn in determined by the fitter
+    sampler = fit2.fit_info["sampler"]
+    flat_samples = sampler.get_chain(discard=fit2.fit_info["discard"], flat=True)
+    p92_bands = model_bands(
+        p92_fit2,
+        x,
+        flat_samples,
+        filename=ofile.replace(".fits", "_bands.fits"),
     )
-    inds = np.random.randint(len(flat_samples), size=100)
-    model_copy = p92_fit2.copy()
-    for ind in inds:
-        sample = flat_samples[ind]
-        _fitter_to_model_params(model_copy, sample)
-        ax.plot(1.0 / x, model_copy(x), "C1", alpha=0.05)
-        ax2.plot(1.0 / x, model_copy(x), "C1", alpha=0.05)
-    # for the figure legend
-    ax.plot(1.0 / x, model_copy(x), "C1", alpha=0.05, label="EMCEE Fits")
-    ax2.plot(1.0 / x, model_copy(x), "C1", alpha=0.05, label="EMCEE Fits")
+    for cax in [ax, ax2]:
+        cax.fill_between(
+            1.0 / x,
+            p92_bands[0],
+            p92_bands[2],
+            color="C1",
+            alpha=0.25,
+            label="EMCEE 68%",
+        )
 
     # ax.plot(1.0 / x, p92_init(x), "r--", label="P92 Init")
     ax.plot(1.0 / x, p92_fit(x), "r-", label="P92 Best Fit")
@@ -3,20 +3,22 @@ import matplotlib
 
 import numpy as np
 import argparse
+from functools import partial
 import warnings
 
 import astropy.units as u
 
 # from astropy.modeling.models import PowerLaw1D, Drude1D
 from astropy.modeling.fitting import LevMarLSQFitter
-from astropy.modeling.fitting import _fitter_to_model_params
 
 from measure_extinction.extdata import ExtData
 from dust_extinction.conversions import AxAvToExv
 
-from models_mcmc_extension import EmceeFitter
+from models_mcmc_extension import EmceeFitter, LaplaceFitter
+from varpro import LinearProjection, AvProjection, VarProLSQFitter
+from compiled_models import model_bands
 
-from G21 import G21, G21_drude_asym
+from G21 import G21, G21_drude_asym, axav_to_exv_fit_deriv
 
 
 def clean_pnames(pnames):
@@ -36,7 +38,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("file", help="file with the extinction curve to fit")
     parser.add_argument(
-        "--burnfrac", type=float, default=0.1, help="fraction of MCMC chain to burn"
+        "--burnfrac",
+        type=float,
+        help="fraction of MCMC chain to burn (default automatic)",
     )
     parser.add_argument(
         "--nsteps", type=int, default=100, help="# of steps in MCMC chain"
@@ -47,6 +51,63 @@ if __name__ == "__main__":
     parser.add_argument(
         "--notitle", help="no title on plot", action="store_true"
     )
+    parser.add_argument(
+        "--nprocs", type=int, default=1, help="# of processes for the MCMC walkers"
+    )
+    parser.add_argument(
+        "--autocorr_check",
+        type=int,
+        default=0,
+        help="check MCMC convergence every # steps and stop early (0 = never)",
+    )
+    parser.add_argument(
+        "--autocorr_tol",
+        type=float,
+        default=0.01,
+        help="converged when the autocorrelation time changes less than this fraction",
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue the saved MCMC chain adding nsteps more steps",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--init_cov",
+        help="start the MCMC walkers from the LevMarLSQ covariance",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sampler",
+        choices=["emcee", "hmc"],
+        default="emcee",
+        help="MCMC sampler, hmc uses the analytic model derivatives",
+    )
+    parser.add_argument(
+        "--unbounded",
+        help="MCMC sampling in unconstrained transformed parameters",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fast",
+        help="Gaussian approximation around the LevMarLSQ fit instead of MCMC",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--varpro",
+        help="LevMarLSQ fit with linear parameters solved (variable projection)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--varpro_mcmc",
+        choices=["profile", "marginalize"],
+        help="MCMC of nonlinear parameters, linear ones profiled or marginalized "
+        "(approximate for more than one linear parameter)",
+    )
+    parser.add_argument(
+        "--av_mcmc",
+        choices=["marginalize", "profile"],
+        help="MCMC with A(V) marginalized or profiled (E(lambda-V) curves only)",
+    )
     parser.add_argument("--png", help="save figure as a png file", action="store_true")
     parser.add_argument("--pdf", help="save figure as a pdf file", action="store_true")
     parser.add_argument("--path", help="path for the extinction curves")
@@ -78,8 +139,11 @@ if __name__ == "__main__":
         if not np.isfinite(av_guess):
             av_guess = 1.0
 
-        g21_init = G21() | AxAvToExv(Av=av_guess)
-        g21_asym_init = G21_drude_asym() | AxAvToExv(Av=av_guess)
+        # analytic derivatives through the AxAvToExv conversion
+        g21_init = axav_to_exv_fit_deriv(G21() | AxAvToExv(Av=av_guess))
+        g21_asym_init = axav_to_exv_fit_deriv(
+            G21_drude_asym() | AxAvToExv(Av=av_guess)
+        )
         # g21_init = g21_x() | AxAvToExv(Av=av_guess)
 
         g21_asym_init[0].sil2_fwhm.fixed = True
@@ -105,13 +169,35 @@ if __name__ == "__main__":
 
     # fit the extinction only using data between 1 and 40 micron
     gvals = (1.0 < 1.0 / x) & (1.0 / x < 40.0)
-    fit = LevMarLSQFitter()
+    if args.varpro:
+        fit = VarProLSQFitter()
+    else:
+        fit = LevMarLSQFitter()
+    if args.varpro_mcmc:
+        projection = partial(LinearProjection, mode=args.varpro_mcmc)
+    elif args.av_mcmc:
+        projection = partial(AvProjection, mode=args.av_mcmc)
+    else:
+        projection = None
 
     nsteps = args.nsteps
     emcee_samples_file = ofile.replace(".fits", ".h5")
-    fit2 = EmceeFitter(
-        nsteps=nsteps, burnfrac=args.burnfrac, save_samples=emcee_samples_file
-    )
+    if args.fast:
+        # quick look Laplace approximation, same outputs as the MCMC
+        fit2 = LaplaceFitter(nsteps=nsteps, save_samples=emcee_samples_file)
+    else:
+        fit2 = EmceeFitter(
+            nsteps=nsteps,
+            burnfrac=args.burnfrac,
+            save_samples=emcee_samples_file,
+            nprocs=args.nprocs,
+            autocorr_check=args.autocorr_check,
+            autocorr_tol=args.autocorr_tol,
+            resume=args.resume,
+            projection=projection,
+            sampler=args.sampler,
+            unbounded=args.unbounded,
+        )
 
     weights = 1.0 / y_unc[gvals]
 
@@ -138,7 +224,13 @@ if __name__ == "__main__":
         # print(g21_asym_fit.param_names)
         # print(g21_asym_fit.parameters)
 
-        g21_asym_fit2 = fit2(g21_asym_fit, x[gvals], y[gvals], weights=weights)
+        if args.init_cov:
+            init_cov = fit.fit_info["param_cov"]
+        else:
+            init_cov = None
+        g21_asym_fit2 = fit2(
+            g21_asym_fit, x[gvals], y[gvals], weights=weights, init_cov=init_cov
+        )
 
     # make the standard mcmc plots
     fit2.plot_emcee_results(g21_asym_fit2, filebase=ofile.replace(".fits", ""))
@@ -195,16 +287,17 @@ if __name__ == "__main__":
 
     ax[1].set_xlabel(r"$\lambda$ [$\mu m$]", fontsize=1.3 * fontsize)
 
-    # plot samples from the mcmc chaing
-    flat_samples = fit2.fit_info["sampler"].get_chain(
-        discard=int(0.1 * nsteps), flat=True
+    # plot the 68% band from all the samples in the mcmc chain
+    # discard the burn in determined by the fitter
+    sampler = fit2.fit_info["sampler"]
+    flat_samples = sampler.get_chain(discard=fit2.fit_info["discard"], flat=True)
+    g21_bands = model_bands(
+        g21_asym_fit2,
+        x[gvals],
+        flat_samples,
+        filename=ofile.replace(".fits", "_bands.fits"),
     )
-    inds = np.random.randint(len(flat_samples), size=100)
-    model_copy = g21_asym_fit2.copy()
-    for ind in inds:
-        sample = flat_samples[ind]
-        _fitter_to_model_params(model_copy, sample)
-        ax[0].plot(wave[gvals], model_copy(wave[gvals]), "C1", alpha=0.05, color='b')
+    ax[0].fill_between(wave[gvals], g21_bands[0], g21_bands[2], color="b", alpha=0.25)
     # for the figure legend
     ax[0].plot(wave[gvals], g21_asym_fit2(wave[gvals]), "C1", label="EMCEE Fits", color='b')
 
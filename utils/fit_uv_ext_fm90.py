@@ -1,16 +1,15 @@
 import matplotlib.pyplot as plt
-import numpy as np
 import argparse
+from functools import partial
 import warnings
 
-# from multiprocessing import Pool
-# using a Pool does not work in this setup it seems
-
 from astropy.modeling.fitting import LevMarLSQFitter
-from astropy.modeling.fitting import _fitter_to_model_params
 import astropy.units as u
 
-from models_mcmc_extension import EmceeFitter
+from models_mcmc_extension import EmceeFitter, LaplaceFitter
+from varpro import LinearProjection, VarProLSQFitter
+from G21 import fm90_fit_deriv
+from compiled_models import model_bands
 
 from dust_extinction.shapes import FM90
 
@@ -26,7 +25,61 @@ if __name__ == "__main__":
         "--nsteps", type=int, default=100, help="# of steps in MCMC chain"
     )
     parser.add_argument(
-        "--burnfrac", type=float, default=0.1, help="fraction of MCMC chain to burn"
+        "--burnfrac",
+        type=float,
+        help="fraction of MCMC chain to burn (default automatic)",
+    )
+    parser.add_argument(
+        "--nprocs", type=int, default=1, help="# of processes for the MCMC walkers"
+    )
+    parser.add_argument(
+        "--autocorr_check",
+        type=int,
+        default=0,
+        help="check MCMC convergence every # steps and stop early (0 = never)",
+    )
+    parser.add_argument(
+        "--autocorr_tol",
+        type=float,
+        default=0.01,
+        help="converged when the autocorrelation time changes less than this fraction",
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue the saved MCMC chain adding nsteps more steps",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--init_cov",
+        help="start the MCMC walkers from the LevMarLSQ covariance",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sampler",
+        choices=["emcee", "hmc"],
+        default="emcee",
+        help="MCMC sampler, hmc uses the analytic model derivatives",
+    )
+    parser.add_argument(
+        "--unbounded",
+        help="MCMC sampling in unconstrained transformed parameters",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fast",
+        help="Gaussian approximation around the LevMarLSQ fit instead of MCMC",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--varpro",
+        help="LevMarLSQ fit with linear parameters solved (variable projection)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--varpro_mcmc",
+        choices=["profile", "marginalize"],
+        help="MCMC of nonlinear parameters, linear ones profiled or marginalized "
+        "(approximate for more than one linear parameter)",
     )
     parser.add_argument("--png", help="save figure as a png file", action="store_true")
     parser.add_argument("--pdf", help="save figure as a pdf file", action="store_true")
@@ -50,6 +103,9 @@ if __name__ == "__main__":
 
     # initialize the model
     fm90_init = FM90()
+    # hmc needs the model gradient, LevMarLSQ keeps the numerical derivatives
+    if args.sampler == "hmc":
+        fm90_init.fit_deriv = fm90_fit_deriv
 
     fm90_init.C1.bounds = (0., 3.)
     fm90_init.C2.bounds = (-0.1, 0.6)
@@ -62,11 +118,31 @@ if __name__ == "__main__":
     emcee_samples_file = ofile.replace(".fits", ".h5")
 
     # pick the fitter
-    fit = LevMarLSQFitter()
+    if args.varpro:
+        fit = VarProLSQFitter()
+    else:
+        fit = LevMarLSQFitter()
+    if args.varpro_mcmc:
+        projection = partial(LinearProjection, mode=args.varpro_mcmc)
+    else:
+        projection = None
     nsteps = args.nsteps
-    fit3 = EmceeFitter(
-        nsteps=nsteps, burnfrac=args.burnfrac, save_samples=emcee_samples_file
-    )
+    if args.fast:
+        # quick look Laplace approximation, same outputs as the MCMC
+        fit3 = LaplaceFitter(nsteps=nsteps, save_samples=emcee_samples_file)
+    else:
+        fit3 = EmceeFitter(
+            nsteps=nsteps,
+            burnfrac=args.burnfrac,
+            save_samples=emcee_samples_file,
+            nprocs=args.nprocs,
+            autocorr_check=args.autocorr_check,
+            autocorr_tol=args.autocorr_tol,
+            resume=args.resume,
+            projection=projection,
+            sampler=args.sampler,
+            unbounded=args.unbounded,
+        )
 
     # modify weights to make sure the 2175 A bump is fit
     weights = 1.0 / y_unc[gindxs]
@@ -78,7 +154,13 @@ if __name__ == "__main__":
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=UserWarning)
         fm90_fit = fit(fm90_init, x[gindxs], y[gindxs], weights=weights)
-        fm90_fit3 = fit3(fm90_fit, x[gindxs], y[gindxs], weights=weights)
+        if args.init_cov:
+            init_cov = fit.fit_info["param_cov"]
+        else:
+            init_cov = None
+        fm90_fit3 = fit3(
+            fm90_fit, x[gindxs], y[gindxs], weights=weights, init_cov=init_cov
+        )
 
     print("autocorr tau = ", fit3.fit_info["sampler"].get_autocorr_time(quiet=True))
 
@@ -106,16 +188,17 @@ if __name__ == "__main__":
     ax.plot(x[gindxs], fm90_fit3(x[gindxs]), label="emcee")
     ax.plot(x[gindxs], fm90_fit(x[gindxs]), label="LevMarLSQ")
 
-    # plot samples from the mcmc chaing
-    flat_samples = fit3.fit_info["sampler"].get_chain(
-        discard=int(0.1 * nsteps), flat=True
+    # plot the 68% band from all the samples in the mcmc chain
+    # discard the burn in determined by the fitter
+    sampler = fit3.fit_info["sampler"]
+    flat_samples = sampler.get_chain(discard=fit3.fit_info["discard"], flat=True)
+    fm90_bands = model_bands(
+        fm90_fit3,
+        x[gindxs],
+        flat_samples,
+        filename=ofile.replace(".fits", "_bands.fits"),
     )
-    inds = np.random.randint(len(flat_samples), size=100)
-    model_copy = fm90_fit3.copy()
-    for ind in inds:
-        sample = flat_samples[ind]
-        _fitter_to_model_params(model_copy, sample)
-        plt.plot(x[gindxs], model_copy(x[gindxs]), "C1", alpha=0.05)
+    ax.fill_between(x[gindxs], fm90_bands[0], fm90_bands[2], color="C1", alpha=0.25)
 
     ax.set_xlabel(r"$x$ [$\mu m^{-1}$]")
     ax.set_ylabel(r"$A(\lambda)/A(V)$")
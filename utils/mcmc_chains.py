@@ -0,0 +1,778 @@
+import os
+import hashlib
+import json
+
+import numpy as np
+import h5py
+import emcee
+from astropy.table import Table
+
+all = [
+    "estimate_burnin",
+    "set_discard",
+    "ChainReader",
+    "sil1_ceninten",
+    "sil1_area",
+    "sil_amp_ratio",
+    "nuv_ceninten",
+    "nuv_area",
+    "ChainSummaryIndex",
+]
+
+
+def estimate_burnin(log_prob, chain=None, nsigma=3.0, ntau=2.0, max_frac=0.5):
+    """
+    Estimate the number of burn in steps to discard from a MCMC chain.
+
+    The burn in is first taken as the point after which the median
+    log(probability) of the walkers stays within nsigma of the median of the
+    last half of the chain.  If the chain is given, ntau times the
+    integrated autocorrelation time of the rest of the chain is added.
+
+    Parameters
+    ----------
+    log_prob : 2D array
+        natural log of the probability [nsteps, nwalkers]
+    chain : 3D array, optional
+        samples [nsteps, nwalkers, ndim]
+    nsigma : float, optional
+        threshold for the log(probability) to be stationary
+    ntau : float, optional
+        number of autocorrelation times to add to the burn in
+    max_frac : float, optional
+        maximum fraction of the chain to discard
+
+    Returns
+    -------
+    discard : int
+        number of steps to discard
+    """
+    nsteps = log_prob.shape[0]
+    max_discard = int(max_frac * nsteps)
+    if nsteps < 4:
+        return 0
+
+    # stationarity of the log(probability)
+    lp_med = np.median(log_prob, axis=1)
+    ref = lp_med[nsteps // 2 :]
+    ref_med = np.median(ref)
+    ref_sig = 1.4826 * np.median(np.absolute(ref - ref_med))
+    (indxs,) = np.where(np.absolute(lp_med - ref_med) > nsigma * ref_sig)
+    if len(indxs) > 0:
+        discard = indxs[-1] + 1
+    else:
+        discard = 0
+    discard = min(discard, max_discard)
+
+    # add a few autocorrelation times to forget the starting positions
+    if chain is not None and ntau > 0:
+        tau = emcee.autocorr.integrated_time(chain[discard:], tol=0)
+        discard += int(ntau * np.max(tau))
+
+    return min(discard, max_discard)
+
+
+def set_discard(backend, discard):
+    """
+    Store the number of burn in steps to discard with a MCMC chain.
+
+    Parameters
+    ----------
+    backend : emcee.backends.HDFBackend
+        backend with the chain
+    discard : int
+        number of steps to discard
+    """
+    with backend.open("a") as f:
+        f[backend.name].attrs["discard"] = int(discard)
+
+
+class ChainReader:
+    """
+    Memory bounded access to a MCMC chain saved in the emcee HDF5 layout.
+
+    Only the requested steps and parameter columns are read from the file,
+    so the full flattened chain is never in memory unless asked for.
+
+    Parameters
+    ----------
+    filename : str
+        name of the HDF5 file with the chain
+    burnfrac : float, optional
+        fraction of the chain to discard if no burn in is stored
+    discard : int, optional
+        number of steps to discard, default is the stored burn in
+    thin : int or "auto", optional
+        only use every thin steps, "auto" for half the shortest
+        autocorrelation time
+    name : str, optional
+        name of the group with the chain in the HDF5 file
+    """
+
+    def __init__(self, filename, burnfrac=0.4, discard=None, thin=1, name="mcmc"):
+        self.filename = filename
+        self.name = name
+        with h5py.File(filename, "r") as f:
+            attrs = f[name].attrs
+            self.iteration = int(attrs["iteration"])
+            self.nwalkers = int(attrs["nwalkers"])
+            self.ndim = int(attrs["ndim"])
+            if discard is None:
+                if "discard" in attrs:
+                    discard = int(attrs["discard"])
+                else:
+                    discard = int(burnfrac * self.iteration)
+            if "param_names" in attrs:
+                self.param_names = [
+                    cname.decode() if isinstance(cname, bytes) else str(cname)
+                    for cname in attrs["param_names"]
+                ]
+            else:
+                self.param_names = None
+        self.discard = discard
+        if thin == "auto":
+            thin = self.autocorr_thin()
+        self.thin = thin
+
+    @property
+    def first(self):
+        """
+        First step used, same as emcee.backends.Backend.get_chain.
+        """
+        return self.discard + self.thin - 1
+
+    @property
+    def nsteps(self):
+        """
+        Number of steps after the burn in and thinning.
+        """
+        return len(range(self.first, self.iteration, self.thin))
+
+    def _read(self, dataset, start, stop, cols):
+        """
+        Read steps [start, stop) of the burned in, thinned chain for the
+        requested columns.
+        """
+        steps = slice(
+            self.first + start * self.thin,
+            min(self.first + stop * self.thin, self.iteration),
+            self.thin,
+        )
+        with h5py.File(self.filename, "r") as f:
+            dset = f[self.name][dataset]
+            if cols is None:
+                return dset[steps]
+            # h5py needs increasing column indices
+            cols = np.atleast_1d(cols) % self.ndim
+            ucols, inverse = np.unique(cols, return_inverse=True)
+            return dset[steps, :, list(ucols)][..., inverse]
+
+    def get_chain(self, cols=None, flat=False):
+        """
+        Burned in, thinned chain.
+
+        Parameters
+        ----------
+        cols : int or list of ints, optional
+            parameter columns to read, default is all
+        flat : boolean, optional
+            flatten the steps and walkers
+
+        Returns
+        -------
+        chain : array
+            samples [nsteps, nwalkers, ncols] or [nsteps * nwalkers, ncols]
+        """
+        chain = self._read("chain", 0, self.nsteps, cols)
+        if flat:
+            chain = chain.reshape(-1, chain.shape[-1])
+        return chain
+
+    def get_log_prob(self, flat=False):
+        """
+        Burned in, thinned log(probability).
+
+        Parameters
+        ----------
+        flat : boolean, optional
+            flatten the steps and walkers
+
+        Returns
+        -------
+        log_prob : array
+            log(probability) [nsteps, nwalkers] or [nsteps * nwalkers]
+        """
+        steps = slice(self.first, self.iteration, self.thin)
+        with h5py.File(self.filename, "r") as f:
+            log_prob = f[self.name]["log_prob"][steps]
+        if flat:
+            log_prob = log_prob.reshape(-1)
+        return log_prob
+
+    def _check_steps(self):
+        """
+        Raise an error if no steps are left after the burn in.
+        """
+        if self.nsteps == 0:
+            raise ValueError(
+                "%s has no steps after discarding %d of %d steps"
+                % (self.filename, self.discard, self.iteration)
+            )
+
+    def iter_blocks(self, block_steps=1000, cols=None):
+        """
+        Iterate over blocks of steps of the burned in, thinned chain.
+
+        Parameters
+        ----------
+        block_steps : int, optional
+            number of (thinned) steps in each block
+        cols : int or list of ints, optional
+            parameter columns to read, default is all
+
+        Yields
+        ------
+        block : 2D array
+            flattened samples [nblock * nwalkers, ncols]
+        """
+        for start in range(0, self.nsteps, block_steps):
+            block = self._read("chain", start, start + block_steps, cols)
+            yield block.reshape(-1, block.shape[-1])
+
+    def autocorr_thin(self, frac=0.5):
+        """
+        Thinning from the autocorrelation time, read one column at a time.
+
+        Parameters
+        ----------
+        frac : float, optional
+            fraction of the shortest autocorrelation time
+
+        Returns
+        -------
+        thin : int
+            number of steps between the samples used
+        """
+        taus = []
+        with h5py.File(self.filename, "r") as f:
+            dset = f[self.name]["chain"]
+            for k in range(self.ndim):
+                chain = dset[self.discard : self.iteration, :, k]
+                taus.append(
+                    emcee.autocorr.integrated_time(chain[..., np.newaxis], tol=0)[0]
+                )
+        return max(1, int(frac * np.min(taus)))
+
+    def mean_std(self, block_steps=1000, cols=None):
+        """
+        Mean and standard deviation of the parameters accumulated over blocks
+        of steps.
+
+        Parameters
+        ----------
+        block_steps : int, optional
+            number of (thinned) steps in each block
+        cols : int or list of ints, optional
+            parameter columns, default is all
+
+        Returns
+        -------
+        mean, std : 1D arrays
+            mean and standard deviation for each column
+
+        Raises
+        ------
+        ValueError
+            no steps left after the burn in
+        """
+        self._check_steps()
+        nvals = 0
+        total = 0.0
+        total2 = 0.0
+        for block in self.iter_blocks(block_steps=block_steps, cols=cols):
+            # shift by the first block for numerical stability
+            if nvals == 0:
+                shift = block[0]
+            block = block - shift
+            nvals += len(block)
+            total = total + np.sum(block, axis=0)
+            total2 = total2 + np.sum(block ** 2, axis=0)
+        mean = total / nvals
+        std = np.sqrt(np.maximum(total2 / nvals - mean ** 2, 0.0))
+        return mean + shift, std
+
+    def percentiles(self, percentiles=(16.0, 50.0, 84.0), cols=None):
+        """
+        Percentiles of the parameters computed one column at a time.
+
+        Parameters
+        ----------
+        percentiles : tuple of floats, optional
+            percentiles to compute
+        cols : int or list of ints, optional
+            parameter columns, default is all
+
+        Returns
+        -------
+        pers : 2D array
+            percentiles [len(percentiles), ncols]
+
+        Raises
+        ------
+        ValueError
+            no steps left after the burn in
+        """
+        self._check_steps()
+        if cols is None:
+            cols = range(self.ndim)
+        return np.array(
+            [
+                np.percentile(self.get_chain(cols=[k]), percentiles)
+                for k in np.atleast_1d(cols)
+            ]
+        ).T
+
+
+# columns of the G21_drude_asym and FM90 parameters in the chains
+g21_cols = {"sil1_amp": 2, "sil1_center": 3, "sil1_fwhm": 4, "sil2_amp": 6}
+fm90_cols = {"C3": 2, "gamma": 5}
+
+
+def sil1_ceninten(samples):
+    """
+    Central intensity of the G21 10 micron silicate feature,
+    I(lambda_o) = a/(gamma/lambda_o)**2.
+
+    Parameters
+    ----------
+    samples : array
+        G21_drude_asym samples [..., ndim]
+
+    Returns
+    -------
+    ceninten : array
+        central intensity [...]
+    """
+    amp = samples[..., g21_cols["sil1_amp"]]
+    center = samples[..., g21_cols["sil1_center"]]
+    fwhm = samples[..., g21_cols["sil1_fwhm"]]
+    return amp / ((fwhm / center) ** 2)
+
+
+def sil1_area(samples):
+    """
+    Area of the G21 10 micron silicate feature using C3 = a * lambda_o**2 * 2
+    to be able to use the FM90 area formula.
+
+    Parameters
+    ----------
+    samples : array
+        G21_drude_asym samples [..., ndim]
+
+    Returns
+    -------
+    area : array
+        feature area [...]
+    """
+    amp = samples[..., g21_cols["sil1_amp"]]
+    center = samples[..., g21_cols["sil1_center"]]
+    fwhm = samples[..., g21_cols["sil1_fwhm"]]
+    return np.pi * amp * (center ** 2) / fwhm
+
+
+def sil_amp_ratio(samples):
+    """
+    Ratio of the G21 10 and 20 micron silicate feature amplitudes.
+
+    Parameters
+    ----------
+    samples : array
+        G21_drude_asym samples [..., ndim]
+
+    Returns
+    -------
+    ratio : array
+        amplitude ratio [...]
+    """
+    return samples[..., g21_cols["sil1_amp"]] / samples[..., g21_cols["sil2_amp"]]
+
+
+def nuv_ceninten(samples):
+    """
+    Central intensity of the FM90 2175 A bump, I(x_o) = C3/gamma**2
+    (without the factor of 2).
+
+    Parameters
+    ----------
+    samples : array
+        FM90 samples [..., ndim]
+
+    Returns
+    -------
+    ceninten : array
+        central intensity [...]
+    """
+    return samples[..., fm90_cols["C3"]] / (samples[..., fm90_cols["gamma"]] ** 2)
+
+
+def nuv_area(samples):
+    """
+    Area of the FM90 2175 A bump, pi*C3/(2*gamma).
+
+    Parameters
+    ----------
+    samples : array
+        FM90 samples [..., ndim]
+
+    Returns
+    -------
+    area : array
+        bump area [...]
+    """
+    C3 = samples[..., fm90_cols["C3"]]
+    gamma = samples[..., fm90_cols["gamma"]]
+    return np.pi * C3 / (2.0 * gamma)
+
+
+def _derived_posteriors(
+    samples, av_col=None, excesses=None, derived=None, seed=0
+):
+    """
+    Posterior samples of the parameters and derived quantities of a
+    sightline.
+
+    Parameters
+    ----------
+    samples : 2D array
+        samples [nsamples, ndim]
+    av_col : int, optional
+        column of the samples with A(V), returned as AV
+    excesses : dict, optional
+        color excesses as name: (value, unc), sampled as gaussians and
+        returned along with AV/name if av_col given
+    derived : dict, optional
+        derived quantities as name: function of the samples [..., ndim]
+    seed : int, optional
+        seed for the samples of the color excesses
+
+    Returns
+    -------
+    posteriors : dict
+        name: samples [nsamples] for the parameters (param_0, param_1, ...) and the other quantities
+    """
+    if excesses is None:
+        excesses = {}
+    if derived is None:
+        derived = {}
+
+    posteriors = {}
+    for k in range(samples.shape[-1]):
+        posteriors["param_%d" % k] = samples[..., k]
+    if av_col is not None:
+        avs = samples[..., av_col]
+        posteriors["AV"] = avs
+        rng = np.random.default_rng(seed)
+        for cname, (cval, cunc) in excesses.items():
+            cexs = cval + cunc * rng.standard_normal(avs.shape)
+            posteriors[cname] = cexs
+            posteriors["AV/%s" % cname] = avs / cexs
+    for cname, cfunc in derived.items():
+        posteriors[cname] = cfunc(samples)
+    return posteriors
+
+
+def _summarize_posteriors(posteriors):
+    """
+    Summary statistics of posterior samples.
+
+    Parameters
+    ----------
+    posteriors : dict
+        name: samples [nsamples]
+
+    Returns
+    -------
+    summaries : dict
+        name: dict with the mean, std, p16, p50, and p84 values
+    """
+    summaries = {}
+    for cname, csamples in posteriors.items():
+        per = np.percentile(csamples, [16.0, 50.0, 84.0], axis=-1)
+        summaries[cname] = {
+            "mean": np.mean(csamples, axis=-1),
+            "std": np.std(csamples, axis=-1),
+            "p16": per[0],
+            "p50": per[1],
+            "p84": per[2],
+        }
+    return summaries
+
+
+def _file_hash(filename, blocksize=1048576):
+    """
+    SHA1 hash of the contents of a file.
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class ChainSummaryIndex:
+    """
+    Posterior summaries of MCMC chains kept in one table keyed by sightline
+    and quantity.
+
+    For each chain the mean, standard deviation, and 16/50/84 percentiles
+    of the parameters (param_0, param_1, ...) are stored along with those of
+    A(V), color excesses, A(V)/color excess ratios (e.g., R(V) = AV/EBV),
+    and other derived quantities.  Quantities requested for the first time
+    or with different inputs (e.g., another color excess value) are added to
+    the stored ones for the chain, so scripts asking for different quantities
+    share the index.  All the quantities of a chain are summarized again only
+    if the file changed (modification time and size, then contents hash) or
+    the burn in, thinning, or subsampling changed.
+
+    Parameters
+    ----------
+    filename : str
+        name of the ECSV file with the index
+    burnfrac : float, optional
+        fraction of the chain to discard if no burn in is stored
+    seed : int, optional
+        seed for the samples of the color excesses and the subsampling
+    nsamples : int, optional
+        randomly subsample the chains to this number of samples
+    thin : int or "auto", optional
+        only use every thin steps of the chains (see ChainReader)
+    """
+
+    stat_names = ["mean", "std", "p16", "p50", "p84"]
+
+    def __init__(self, filename, burnfrac=0.4, seed=0, nsamples=None, thin=1):
+        self.filename = filename
+        self.burnfrac = burnfrac
+        self.seed = seed
+        self.nsamples = nsamples
+        self.thin = thin
+        self.modified = False
+
+        self.chains = {}
+        self.summaries = {}
+        if os.path.isfile(filename):
+            itab = Table.read(filename, format="ascii.ecsv")
+            # indexes without the quantity inputs are summarized again
+            if "spec" in itab.colnames:
+                self.chains = dict(itab.meta.get("chains", {}))
+                for row in itab:
+                    csum = self.summaries.setdefault(row["sightline"], {})
+                    csum[row["quantity"]] = {"spec": str(row["spec"])}
+                    for cstat in self.stat_names:
+                        csum[row["quantity"]][cstat] = float(row[cstat])
+
+    def _is_current(self, chainfile, info):
+        """
+        Check if the chain file is unchanged since it was summarized.
+        """
+        fstat = os.stat(chainfile)
+        if info["mtime"] == fstat.st_mtime and info["size"] == fstat.st_size:
+            return True
+        # touched or copied, only summarize again if the contents changed
+        if info["sha1"] == _file_hash(chainfile):
+            info["mtime"] = fstat.st_mtime
+            info["size"] = fstat.st_size
+            self.modified = True
+            return True
+        return False
+
+    @staticmethod
+    def _specs(ndim, av_col, excesses, derived):
+        """
+        Inputs of each requested quantity, a stored quantity is only used if
+        its inputs are the same.
+        """
+        specs = {"param_%d" % k: {} for k in range(ndim)}
+        if av_col is not None:
+            specs["AV"] = {"av_col": av_col}
+            for cname, (cval, cunc) in excesses.items():
+                cspec = {"av_col": av_col, "excess": [float(cval), float(cunc)]}
+                specs[cname] = cspec
+                specs["AV/%s" % cname] = cspec
+        for cname in derived.keys():
+            specs[cname] = {"derived": cname}
+        return {
+            cname: json.dumps(cspec, sort_keys=True) for cname, cspec in specs.items()
+        }
+
+    def get(self, chainfile, av_col=None, excesses=None, derived=None):
+        """
+        Summaries for one chain, summarizing the missing quantities if needed.
+
+        Parameters
+        ----------
+        chainfile : str
+            name of the HDF5 file with the chain, the sightline is the file
+            name without the directory and extension
+        av_col : int, optional
+            column of the samples with A(V), stored as AV
+        excesses : dict, optional
+            color excesses as name: (value, unc), e.g., {"EBV": (0.5, 0.02)},
+            sampled as gaussians and stored along with AV/name if av_col given
+        derived : dict, optional
+            derived quantities as name: function of the samples [nsamples, ndim]
+
+        Returns
+        -------
+        summaries : dict
+            quantity: dict with mean, std, p16, p50, and p84 values for the
+            parameters and the requested quantities
+        """
+        sightline = os.path.splitext(os.path.basename(chainfile))[0]
+        if excesses is None:
+            excesses = {}
+        if derived is None:
+            derived = {}
+        options = {
+            "burnfrac": float(self.burnfrac),
+            "seed": int(self.seed),
+            "nsamples": self.nsamples,
+            "thin": self.thin,
+        }
+
+        info = self.chains.get(sightline)
+        if (
+            info is None
+            or info["options"] != options
+            or not self._is_current(chainfile, info)
+        ):
+            # new or changed chain, none of the stored quantities are valid
+            info = None
+            self.chains.pop(sightline, None)
+            self.summaries[sightline] = {}
+            reader = ChainReader(chainfile, burnfrac=self.burnfrac, thin=self.thin)
+            ndim = reader.ndim
+        else:
+            reader = None
+            ndim = info["ndim"]
+
+        csums = self.summaries.setdefault(sightline, {})
+        specs = self._specs(ndim, av_col, excesses, derived)
+        missing = [
+            cname
+            for cname, cspec in specs.items()
+            if cname not in csums.keys() or csums[cname]["spec"] != cspec
+        ]
+        if len(missing) > 0:
+            if reader is None:
+                reader = ChainReader(
+                    chainfile,
+                    burnfrac=self.burnfrac,
+                    discard=info["discard"],
+                    thin=info["thin"],
+                )
+            self._summarize(sightline, reader, missing, av_col, excesses, derived)
+            for cname in missing:
+                csums[cname]["spec"] = specs[cname]
+            if info is None:
+                fstat = os.stat(chainfile)
+                self.chains[sightline] = {
+                    "mtime": fstat.st_mtime,
+                    "size": fstat.st_size,
+                    "sha1": _file_hash(chainfile),
+                    "ndim": reader.ndim,
+                    "discard": reader.discard,
+                    "thin": reader.thin,
+                    "param_names": reader.param_names,
+                    "options": options,
+                }
+            self.modified = True
+
+        return {
+            cname: {cstat: csums[cname][cstat] for cstat in self.stat_names}
+            for cname in specs.keys()
+        }
+
+    def _summarize(self, sightline, reader, missing, av_col, excesses, derived):
+        """
+        Compute the summaries of the missing quantities reading the chain in
+        blocks of steps.  Only the values of the missing quantities that are
+        not parameters are kept, the parameters are summarized one column at
+        a time unless the chain is subsampled.
+        """
+        reader._check_steps()
+        excesses = {
+            cname: cval
+            for cname, cval in excesses.items()
+            if cname in missing or "AV/%s" % cname in missing
+        }
+        derived = {
+            cname: cfunc for cname, cfunc in derived.items() if cname in missing
+        }
+
+        # random subset of the flattened samples
+        ntotal = reader.nsteps * reader.nwalkers
+        keep = None
+        if self.nsamples is not None and self.nsamples < ntotal:
+            rng = np.random.default_rng(self.seed)
+            keep = np.sort(rng.choice(ntotal, self.nsamples, replace=False))
+
+        params = [
+            cname for cname in missing if cname.startswith("param_") and keep is None
+        ]
+        others = [cname for cname in missing if cname not in params]
+
+        csums = self.summaries[sightline]
+        if len(params) > 0:
+            cols = [int(cname[6:]) for cname in params]
+            mean, std = reader.mean_std(cols=cols)
+            pers = reader.percentiles(percentiles=(16.0, 50.0, 84.0), cols=cols)
+            for k, cname in enumerate(params):
+                csums[cname] = {
+                    "mean": float(mean[k]),
+                    "std": float(std[k]),
+                    "p16": float(pers[0, k]),
+                    "p50": float(pers[1, k]),
+                    "p84": float(pers[2, k]),
+                }
+
+        if len(others) > 0:
+            values = {cname: [] for cname in others}
+            start = 0
+            for k, block in enumerate(reader.iter_blocks()):
+                if keep is not None:
+                    stop = start + len(block)
+                    block = block[keep[(keep >= start) & (keep < stop)] - start]
+                    start = stop
+                posteriors = _derived_posteriors(
+                    block,
+                    av_col=av_col,
+                    excesses=excesses,
+                    derived=derived,
+                    seed=self.seed + k,
+                )
+                for cname in others:
+                    values[cname].append(posteriors[cname])
+            for cname, cstats in _summarize_posteriors(
+                {cname: np.concatenate(cvals) for cname, cvals in values.items()}
+            ).items():
+                csums[cname] = {cstat: float(cval) for cstat, cval in cstats.items()}
+
+    def write(self):
+        """
+        Write the index if it changed.
+        """
+        if not self.modified:
+            return
+        rows = [
+            [sightline, cname, cstats["spec"]]
+            + [cstats[cstat] for cstat in self.stat_names]
+            for sightline in sorted(self.summaries.keys())
+            for cname, cstats in self.summaries[sightline].items()
+        ]
+        itab = Table(
+            rows=rows, names=["sightline", "quantity", "spec"] + self.stat_names
+        )
+        itab.meta["chains"] = self.chains
+        itab.write(self.filename, format="ascii.ecsv", overwrite=True)
+        self.modified = False
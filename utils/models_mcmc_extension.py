@@ -1,6 +1,12 @@
+import copy
+import multiprocessing
+import warnings
+
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy.special import expit
 
+from astropy.modeling import CompoundModel
 from astropy.modeling.fitting import (
     Fitter,
     _validate_model,
@@ -13,10 +19,694 @@ from astropy.modeling.statistic import leastsquare
 from astropy import uncertainty as astrounc
 
 import emcee
+from emcee.pbar import get_progress_bar
 import corner
 
+from mcmc_chains import estimate_burnin, set_discard
+from compiled_models import compile_model
+
+
+all = [
+    "EmceeOpt",
+    "EmceeFitter",
+    "EmceeLogProbability",
+    "ParameterLayout",
+    "plot_emcee_results",
+    "evaluate_model_block",
+    "chain_to_backend",
+    "LaplaceFitter",
+    "HMCOpt",
+    "BoundedTransform",
+    "TransformedLogProbability",
+    "hmc_sample",
+]
+
+
+def _model_block_broadcasts(model, x):
+    """
+    Determine if the model evaluate method broadcasts over a block of
+    parameter vectors given as columns.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to check
+    x : array
+        input coordinates
+
+    Returns
+    -------
+    broadcasts : boolean
+        True if a block evaluation gives the same result as individual
+        evaluations
+    """
+    params = np.tile(model.parameters, (2, 1))
+    try:
+        ymod = model.evaluate(x, *params.T[:, :, np.newaxis])
+    except (IndexError, ValueError):
+        # e.g., FM90 uses fancy indexing on the output array
+        return False
+    if np.shape(ymod) != (2, len(x)):
+        return False
+    return np.allclose(ymod[0], model.evaluate(x, *model.parameters), equal_nan=True)
+
+
+def evaluate_model_block(model, x, params, broadcasts=True):
+    """
+    Evaluate a model for a block of full parameter vectors.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to evaluate, the parameter values of the model are not used
+    x : array
+        input coordinates
+    params : 2D array
+        full parameter vectors [nblock, nparams] in model.param_names order
+    broadcasts : boolean
+        if True, evaluate all the parameter vectors in one broadcast call,
+        otherwise loop over the parameter vectors
+
+    Returns
+    -------
+    ymod : 2D array
+        model values [nblock, len(x)]
+    """
+    if broadcasts:
+        return model.evaluate(x, *params.T[:, :, np.newaxis])
+    else:
+        return np.array([model.evaluate(x, *cparams) for cparams in params])
+
+
+class ParameterLayout:
+    """
+    Free parameter layout of a model compiled once per fit.
+
+    The free parameters are those that are not fixed or tied, in the
+    model.param_names order.  This is the order of the fit parameters used
+    by the fitters and of the saved MCMC chains.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to fit
+
+    Attributes
+    ----------
+    param_names : list of str
+        names of the free parameters
+    fit_indxs : int array
+        indices of the free parameters in model.parameters
+    lower, upper : float arrays
+        lower and upper bounds of the free parameters, -inf/inf if not bounded
+    params : float array
+        all the model parameters, gives the values of the fixed parameters
+    has_tied : boolean
+        True if the model has tied parameters
+    """
+
+    def __init__(self, model):
+        self.param_names = []
+        fit_indxs = []
+        lower = []
+        upper = []
+        for i, pname in enumerate(model.param_names):
+            if not (model.fixed[pname] or model.tied[pname]):
+                self.param_names.append(pname)
+                fit_indxs.append(i)
+                cmin, cmax = model.bounds[pname]
+                lower.append(-np.inf if cmin is None else cmin)
+                upper.append(np.inf if cmax is None else cmax)
+        self.fit_indxs = np.array(fit_indxs, dtype=int)
+        self.lower = np.array(lower, dtype=float)
+        self.upper = np.array(upper, dtype=float)
+        self.params = np.array(model.parameters)
+        self.has_tied = any(model.tied.values())
+
+    @property
+    def ndim(self):
+        """
+        Number of free parameters
+        """
+        return len(self.fit_indxs)
+
+    def in_bounds(self, fps):
+        """
+        Check if the fit parameters are within the bounds.
+
+        Parameters
+        ----------
+        fps : 1D or 2D array
+            fit parameters [ndim] or block of fit parameters [nblock, ndim]
+
+        Returns
+        -------
+        in_bounds : boolean or boolean array
+            True if all the parameters are within the bounds
+        """
+        return np.all((fps >= self.lower) & (fps <= self.upper), axis=-1)
+
+    def clip(self, fps):
+        """
+        Clip the fit parameters to be within the bounds.
+
+        Parameters
+        ----------
+        fps : 1D or 2D array
+            fit parameters [ndim] or block of fit parameters [nblock, ndim]
+
+        Returns
+        -------
+        fps : 1D or 2D array
+            clipped fit parameters
+        """
+        return np.clip(fps, self.lower, self.upper)
+
+    def full_params(self, fps):
+        """
+        Full model parameter vectors for a block of fit parameters.
+
+        Parameters
+        ----------
+        fps : 2D array
+            block of fit parameters [nblock, ndim]
+
+        Returns
+        -------
+        params : 2D array
+            full parameters [nblock, nparams] with the fixed values filled in
+        """
+        params = np.tile(self.params, (len(fps), 1))
+        params[:, self.fit_indxs] = fps
+        return params
+
+    def subset(self, indxs):
+        """
+        Layout for a subset of the free parameters.
+
+        Parameters
+        ----------
+        indxs : int array
+            indices of the subset in the free parameters
+
+        Returns
+        -------
+        layout : ParameterLayout
+            layout with only the subset as free parameters
+        """
+        layout = copy.copy(self)
+        layout.param_names = [self.param_names[k] for k in indxs]
+        layout.fit_indxs = self.fit_indxs[indxs]
+        layout.lower = self.lower[indxs]
+        layout.upper = self.upper[indxs]
+        return layout
+
+
+class BoundedTransform:
+    """
+    Transformation of the bounded fit parameters to unconstrained
+    parameters.  Uses a logit transform for two sided bounds, a log
+    transform for one sided bounds, and no transform otherwise.
+
+    Parameters
+    ----------
+    layout : ParameterLayout
+        free parameter layout with the bounds
+
+    Attributes
+    ----------
+    layout : ParameterLayout
+        layout for the unconstrained parameters (no bounds)
+    """
+
+    def __init__(self, layout):
+        self.lower = layout.lower
+        self.upper = layout.upper
+        has_lower = np.isfinite(self.lower)
+        has_upper = np.isfinite(self.upper)
+        self.two_sided = has_lower & has_upper
+        self.lower_only = has_lower & ~has_upper
+        self.upper_only = ~has_lower & has_upper
+        self.width = np.where(self.two_sided, self.upper - self.lower, 1.0)
+
+        self.layout = copy.copy(layout)
+        self.layout.lower = np.full(layout.ndim, -np.inf)
+        self.layout.upper = np.full(layout.ndim, np.inf)
+
+    def to_unbounded(self, fps, eps=1e-10):
+        """
+        Transform the fit parameters to the unconstrained parameters.
+
+        Parameters
+        ----------
+        fps : 1D or 2D array
+            fit parameters [ndim] or block of fit parameters [nblock, ndim]
+        eps : float, optional
+            parameters on the bounds are moved inside by eps (relative)
+
+        Returns
+        -------
+        z : 1D or 2D array
+            unconstrained parameters
+        """
+        z = np.array(fps, dtype=float)
+        frac = np.clip((fps - self.lower) / self.width, eps, 1.0 - eps)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.where(self.two_sided, np.log(frac) - np.log1p(-frac), z)
+            z = np.where(self.lower_only, np.log(np.maximum(fps - self.lower, eps)), z)
+            z = np.where(self.upper_only, np.log(np.maximum(self.upper - fps, eps)), z)
+        return z
+
+    def to_bounded(self, z):
+        """
+        Transform the unconstrained parameters to the fit parameters.
+
+        Parameters
+        ----------
+        z : 1D or 2D array
+            unconstrained parameters [ndim] or block [nblock, ndim]
+
+        Returns
+        -------
+        fps : 1D or 2D array
+            fit parameters
+        """
+        with np.errstate(over="ignore"):
+            fps = np.where(self.two_sided, self.lower + self.width * expit(z), z)
+            fps = np.where(self.lower_only, self.lower + np.exp(z), fps)
+            fps = np.where(self.upper_only, self.upper - np.exp(z), fps)
+        return fps
+
+    def deriv(self, z):
+        """
+        Derivatives of the fit parameters with respect to the unconstrained
+        parameters.
+        """
+        with np.errstate(over="ignore"):
+            sig = expit(z)
+            dfps = np.where(self.two_sided, self.width * sig * (1.0 - sig), 1.0)
+            dfps = np.where(self.lower_only, np.exp(z), dfps)
+            dfps = np.where(self.upper_only, -np.exp(z), dfps)
+        return dfps
+
+    def log_jacobian(self, z):
+        """
+        Natural log of the Jacobian of the transform to the fit parameters.
+
+        Parameters
+        ----------
+        z : 1D or 2D array
+            unconstrained parameters [ndim] or block [nblock, ndim]
+
+        Returns
+        -------
+        log_jac : float or array
+            log(|dfps/dz|) summed over the parameters
+        """
+        # log(sig * (1 - sig)) = -log(1 + exp(-z)) - log(1 + exp(z))
+        log_jac = np.where(
+            self.two_sided,
+            np.log(self.width) - np.logaddexp(0.0, -z) - np.logaddexp(0.0, z),
+            0.0,
+        )
+        log_jac = np.where(self.lower_only | self.upper_only, z, log_jac)
+        return np.sum(log_jac, axis=-1)
+
+    def grad_log_jacobian(self, z):
+        """
+        Gradient of log_jacobian with respect to the unconstrained parameters.
+        """
+        grad = np.where(self.two_sided, 1.0 - 2.0 * expit(z), 0.0)
+        return np.where(self.lower_only | self.upper_only, 1.0, grad)
+
+    def transform_cov(self, fps, cov):
+        """
+        Transform a covariance matrix of the fit parameters to the
+        unconstrained parameters at fps.
+        """
+        dz = 1.0 / self.deriv(self.to_unbounded(fps))
+        return cov * np.outer(dz, dz)
+
+
+def chain_to_backend(chain, log_prob, accepted, filename=None, param_names=None):
+    """
+    Store a chain in an emcee backend.  Used for chains that are not
+    directly produced by the emcee sampler.
+
+    Parameters
+    ----------
+    chain : 3D array
+        samples [nsteps, nwalkers, ndim]
+    log_prob : 2D array
+        natural log of the probability of the samples [nsteps, nwalkers]
+    accepted : array
+        number of accepted proposals for each walker
+    filename : str, optional
+        HDF5 file to save the chain, in memory backend if not given
+    param_names : list of str, optional
+        names of the parameters, saved in the HDF5 file
+
+    Returns
+    -------
+    backend : emcee.backends.Backend or emcee.backends.HDFBackend
+        backend with the chain
+    """
+    nsteps, nwalkers, ndim = chain.shape
+    if filename:
+        backend = emcee.backends.HDFBackend(filename)
+        backend.reset(nwalkers, ndim)
+        with backend.open("a") as f:
+            g = f[backend.name]
+            g["chain"].resize(nsteps, axis=0)
+            g["chain"][...] = chain
+            g["log_prob"].resize(nsteps, axis=0)
+            g["log_prob"][...] = log_prob
+            g["accepted"][...] = accepted
+            g.attrs["iteration"] = nsteps
+            if param_names is not None:
+                g.attrs["param_names"] = param_names
+    else:
+        backend = emcee.backends.Backend()
+        backend.reset(nwalkers, ndim)
+        backend.chain = np.array(chain, dtype=backend.dtype)
+        backend.log_prob = np.array(log_prob, dtype=backend.dtype)
+        backend.accepted = np.array(accepted, dtype=backend.dtype)
+        backend.iteration = nsteps
+    return backend
+
+
+def _model_recipe(model):
+    """
+    Picklable description of the model structure: the model classes
+    and the compound model operators.
+    """
+    if isinstance(model, CompoundModel):
+        return (model.op, _model_recipe(model.left), _model_recipe(model.right))
+    else:
+        return type(model)
+
+
+def _model_from_recipe(recipe):
+    """
+    Rebuild a model from the output of _model_recipe.  The parameter values
+    are the defaults as only the model structure is needed for evaluate.
+    """
+    if isinstance(recipe, tuple):
+        op, left, right = recipe
+        return CompoundModel(op, _model_from_recipe(left), _model_from_recipe(right))
+    else:
+        return recipe()
+
+
+class EmceeLogProbability:
+    """
+    Picklable natural log of the probability built from the parameter
+    layout of a model.  Uses flat priors set using the parameter bounds
+    and the standard leastsquare statistic.
+
+    Can be called with a single set of fit parameters or with a
+    [nwalkers, ndim] block of fit parameters.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to fit, fixed parameters are set to the current values
+    x : array
+        input coordinates
+    y : array
+        input coordinates
+    weights : array, optional
+        weights for fitting, 1/sigma for Gaussian uncertainties
+    layout : ParameterLayout, optional
+        free parameter layout of the model, computed if not given
+    """
+
+    def __init__(self, model, x, y, weights=None, layout=None):
+        if layout is None:
+            layout = ParameterLayout(model)
+        if layout.has_tied:
+            raise ValueError("tied parameters are not supported")
+
+        self.model = model
+        self.layout = layout
+        self.x = x
+        self.y = y
+        if weights is None:
+            weights = 1.0
+        self.weights = weights
+        self.broadcasts = _model_block_broadcasts(model, x)
+        # plain numpy evaluation of the model if supported
+        self.compiled = compile_model(model, x)
+
+    def __getstate__(self):
+        # astropy (compound) models are not reliably picklable
+        state = self.__dict__.copy()
+        state["model"] = _model_recipe(self.model)
+        return state
+
+    def __setstate__(self, state):
+        state["model"] = _model_from_recipe(state["model"])
+        self.__dict__.update(state)
+
+    def __call__(self, fps):
+        """
+        Compute the natural log of the probability.
+
+        Parameters
+        ----------
+        fps : 1D or 2D array
+            fit parameters [ndim] or block of fit parameters [nwalkers, ndim]
+
+        Returns
+        -------
+        log(prob) : float or array
+            natural log of the probability
+        """
+        fps = np.asarray(fps)
+        if fps.ndim == 1:
+            return self.block(fps[np.newaxis, :])[0]
+        else:
+            return self.block(fps)
+
+    def block(self, fps):
+        """
+        Compute the natural log of the probability for a block of fit
+        parameters in one broadcast pass.
+
+        Parameters
+        ----------
+        fps : 2D array
+            block of fit parameters [nwalkers, ndim]
+
+        Returns
+        -------
+        log(prob) : array
+            natural log of the probability for each walker
+        """
+        lnp = np.full(len(fps), -np.inf)
+        inbounds = self.layout.in_bounds(fps)
+        if not np.any(inbounds):
+            return lnp
+
+        params = self.layout.full_params(fps[inbounds])
+        ymod = self.model_block(params)
+        lnp[inbounds] = -0.5 * np.sum(np.square(self.weights * (ymod - self.y)), axis=1)
+
+        return lnp
+
+    def model_block(self, params):
+        """
+        Evaluate the model for a block of full parameter vectors.
+
+        Parameters
+        ----------
+        params : 2D array
+            full parameter vectors [nblock, nparams]
+
+        Returns
+        -------
+        ymod : 2D array
+            model values [nblock, len(x)]
+        """
+        if self.compiled is not None:
+            return self.compiled(params)
+        else:
+            return evaluate_model_block(self.model, self.x, params, self.broadcasts)
+
+    def weighted_derivs(self, fps):
+        """
+        Derivatives of the weighted model with respect to the fit parameters
+        using the analytic derivatives of the model (fit_deriv).
+
+        Parameters
+        ----------
+        fps : 2D array
+            block of fit parameters [nblock, ndim]
+
+        Returns
+        -------
+        derivs : 3D array
+            weighted derivatives [nblock, ndim, npts]
+        """
+        if getattr(self.model, "fit_deriv", None) is None:
+            raise ValueError("model does not have analytic derivatives (fit_deriv)")
+        params = self.layout.full_params(fps)
+        if self.broadcasts:
+            derivs = self.model.fit_deriv(self.x, *params.T[:, :, np.newaxis])
+            derivs = np.stack(
+                [
+                    np.broadcast_to(derivs[k], (len(fps), len(self.x)))
+                    for k in self.layout.fit_indxs
+                ],
+                axis=1,
+            )
+        else:
+            derivs = np.array(
+                [
+                    np.array(self.model.fit_deriv(self.x, *cparams))[
+                        self.layout.fit_indxs
+                    ]
+                    for cparams in params
+                ]
+            )
+        return self.weights * derivs
+
+    def block_and_grad(self, fps):
+        """
+        Compute the natural log of the probability and its gradient for a
+        block of fit parameters.
+
+        Parameters
+        ----------
+        fps : 2D array
+            block of fit parameters [nblock, ndim]
+
+        Returns
+        -------
+        log(prob) : array
+            natural log of the probability for each row
+        grad : 2D array
+            gradient of the log(prob) [nblock, ndim], zero outside the bounds
+        """
+        lnp = np.full(len(fps), -np.inf)
+        grad = np.zeros(fps.shape)
+        inbounds = self.layout.in_bounds(fps)
+        if not np.any(inbounds):
+            return lnp, grad
+
+        params = self.layout.full_params(fps[inbounds])
+        ymod = self.model_block(params)
+        wres = self.weights * (ymod - self.y)
+        lnp[inbounds] = -0.5 * np.sum(np.square(wres), axis=1)
+        derivs = self.weighted_derivs(fps[inbounds])
+        grad[inbounds] = -np.einsum("bkp,bp->bk", derivs, wres)
+
+        return lnp, grad
+
+
+_pool_log_probability = None
+
+
+def _init_pool_worker(log_probability):
+    """
+    Set the log(probability) once per worker process
+    """
+    global _pool_log_probability
+    _pool_log_probability = log_probability
+
+
+def _pool_block(fps):
+    """
+    Compute the log(probability) for a block of walkers in a worker process
+    """
+    return _pool_log_probability.block(fps)
+
 
-all = ["EmceeOpt", "EmceeFitter", "plot_emcee_results"]
+class PoolLogProbability:
+    """
+    Spread the log(probability) for a block of walkers over a process pool.
+
+    Parameters
+    ----------
+    pool : multiprocessing.Pool
+        pool with the workers initialized with _init_pool_worker
+    nprocs : int
+        number of processes in the pool
+    """
+
+    def __init__(self, pool, nprocs):
+        self.pool = pool
+        self.nprocs = nprocs
+
+    def __call__(self, fps):
+        blocks = np.array_split(np.atleast_2d(fps), self.nprocs)
+        return np.concatenate(self.pool.map(_pool_block, blocks))
+
+
+class TransformedLogProbability:
+    """
+    Log(probability) in the unconstrained parameters of a BoundedTransform
+    including the Jacobian of the transform.
+
+    Parameters
+    ----------
+    log_probability : EmceeLogProbability or similar
+        log(probability) of the fit parameters with a block method
+    transform : BoundedTransform
+        transform of the fit parameters
+    """
+
+    def __init__(self, log_probability, transform):
+        self.log_probability = log_probability
+        self.transform = transform
+        if getattr(log_probability, "block_and_grad", None) is None:
+            self.block_and_grad = None
+
+    def __call__(self, z):
+        """
+        Compute the natural log of the probability.
+
+        Parameters
+        ----------
+        z : 1D or 2D array
+            unconstrained parameters [ndim] or block [nwalkers, ndim]
+
+        Returns
+        -------
+        log(prob) : float or array
+            natural log of the probability
+        """
+        z = np.asarray(z)
+        if z.ndim == 1:
+            return self.block(z[np.newaxis, :])[0]
+        else:
+            return self.block(z)
+
+    def block(self, z):
+        """
+        Compute the natural log of the probability for a block of
+        unconstrained parameters.
+        """
+        lnp = self.log_probability.block(self.transform.to_bounded(z))
+        return lnp + self.transform.log_jacobian(z)
+
+    def weighted_derivs(self, z):
+        """
+        Weighted model derivatives with respect to the unconstrained
+        parameters.
+        """
+        derivs = self.log_probability.weighted_derivs(self.transform.to_bounded(z))
+        return derivs * self.transform.deriv(z)[:, :, np.newaxis]
+
+    def block_and_grad(self, z):
+        """
+        Compute the natural log of the probability and its gradient for a
+        block of unconstrained parameters.
+        """
+        lnp, grad = self.log_probability.block_and_grad(self.transform.to_bounded(z))
+        lnp = lnp + self.transform.log_jacobian(z)
+        grad = grad * self.transform.deriv(z) + self.transform.grad_log_jacobian(z)
+        return lnp, grad
 
 
 class EmceeOpt(Optimization):
@@ -25,29 +715,145 @@ class EmceeOpt(Optimization):
     """
 
     supported_constraints = ["bounds", "fixed", "tied"]
+    requires_gradient = False
 
     def __init__(self):
         super().__init__(emcee)
-        self.fit_info = {"perparams": None, "samples": None, "sampler": None}
+        self._reset_fit_info()
+
+    def _reset_fit_info(self):
+        """
+        New fit_info for a run, nothing is kept from a previous run.
+        """
+        self.fit_info = {
+            "perparams": None,
+            "samples": None,
+            "sampler": None,
+            "autocorr": None,
+        }
 
     @staticmethod
     def _get_best_fit_params(sampler):
         """
         Determine the best fit parameters given an emcee sampler object
+        or backend
+        """
+        log_prob = sampler.get_log_prob()
+        k, i = np.unravel_index(np.nanargmax(log_prob), log_prob.shape)
+        return sampler.get_chain()[k, i, :]
+
+    @staticmethod
+    def _check_backend_layout(backend, nwalkers, fit_param_names):
         """
-        # very likely a faster way
-        max_lnp = -1e6
-        nwalkers, nsteps = sampler.lnprobability.shape
-        for k in range(nwalkers):
-            tmax_lnp = np.nanmax(sampler.lnprobability[k])
-            if tmax_lnp > max_lnp:
-                max_lnp = tmax_lnp
-                (indxs,) = np.where(sampler.lnprobability[k] == tmax_lnp)
-                fit_params_best = sampler.chain[k, indxs[0], :]
+        Check that a stored chain has the parameter layout of the model
+        being fit.
+
+        Parameters
+        ----------
+        backend : emcee.backends.HDFBackend
+            backend with the stored chain
+        nwalkers : int
+            number of walkers
+        fit_param_names : list of str
+            names of the parameters being fit
 
-        return fit_params_best
+        Raises
+        ------
+        ValueError
+           stored chain does not match the parameter layout
+        """
+        if backend.shape != (nwalkers, len(fit_param_names)):
+            raise ValueError(
+                "stored chain in %s has shape %s, expected %s"
+                % (
+                    backend.filename,
+                    backend.shape,
+                    (nwalkers, len(fit_param_names)),
+                )
+            )
+        with backend.open() as f:
+            attrs = f[backend.name].attrs
+            if "param_names" in attrs:
+                stored_names = [
+                    cname.decode() if isinstance(cname, bytes) else cname
+                    for cname in attrs["param_names"]
+                ]
+            else:
+                stored_names = None
+        if stored_names is None:
+            warnings.warn(
+                "stored chain in %s has no parameter names, only checked the shape"
+                % backend.filename
+            )
+        elif stored_names != list(fit_param_names):
+            raise ValueError(
+                "stored chain in %s has parameters %s, expected %s"
+                % (backend.filename, stored_names, fit_param_names)
+            )
 
-    def __call__(self, objfunc, initval, fargs, nsteps, save_samples=None, **kwargs):
+    @staticmethod
+    def _init_walkers(
+        initval, nwalkers, layout, init_cov=None, init_scale=1.0, maxtries=100
+    ):
+        """
+        Initial walker positions, all within the parameter bounds.
+
+        Parameters
+        ----------
+        initval : array
+            initial guess for the parameter values
+        nwalkers : int
+            number of walkers
+        layout : ParameterLayout
+            free parameter layout of the model
+        init_cov : 2D array, optional
+            covariance matrix to draw the positions from, otherwise a tiny
+            ball around initval is used
+        init_scale : float, optional
+            scale factor for the init_cov standard deviations
+        maxtries : int, optional
+            maximum number of redraws for positions outside the bounds,
+            positions are clipped to the bounds after this
+
+        Returns
+        -------
+        pos : 2D array
+            walker positions [nwalkers, ndim]
+        """
+        if init_cov is None:
+            pos = initval + 1e-4 * np.random.randn(nwalkers, len(initval))
+        else:
+            cov = (init_scale ** 2) * np.asarray(init_cov)
+            pos = np.random.multivariate_normal(initval, cov, size=nwalkers)
+            # truncate to the bounds by redrawing
+            for k in range(maxtries):
+                (redraw,) = np.where(~layout.in_bounds(pos))
+                if len(redraw) == 0:
+                    break
+                pos[redraw] = np.random.multivariate_normal(
+                    initval, cov, size=len(redraw)
+                )
+
+        # ensure all the walkers start within the bounds
+        return layout.clip(pos)
+
+    def __call__(
+        self,
+        objfunc,
+        initval,
+        fargs,
+        nsteps,
+        save_samples=None,
+        vectorize=False,
+        autocorr_check=None,
+        autocorr_ntau=50,
+        autocorr_tol=0.01,
+        resume=False,
+        layout=None,
+        init_cov=None,
+        init_scale=1.0,
+        **kwargs
+    ):
         """
         Run the sampler.
 
@@ -59,42 +865,105 @@ class EmceeOpt(Optimization):
             initial guess for the parameter values
         fargs : tuple
             other arguments to be passed to the statistic function
+        nsteps : int
+            number of steps in the MCMC chain
+        save_samples : str, optional
+            filename for the HDF5 file to save the samples
+        vectorize : boolean, optional
+            if True, objfunc takes the full [nwalkers, ndim] block of walker
+            positions and returns an array of nwalkers log probabilities
+        autocorr_check : int, optional
+            check the integrated autocorrelation time every autocorr_check
+            steps and stop once converged, nsteps is then the maximum
+        autocorr_ntau : float, optional
+            converged requires the chain to be longer than autocorr_ntau times
+            the autocorrelation time for all the parameters
+        autocorr_tol : float, optional
+            converged requires the fractional change in the autocorrelation
+            time since the previous check to be below autocorr_tol
+        resume : boolean, optional
+            if True and save_samples has a stored chain, continue that chain
+            from the last walker positions and append nsteps more steps
+        layout : ParameterLayout, optional
+            free parameter layout of the model, computed if not given
+        init_cov : 2D array, optional
+            covariance matrix of the fit parameters, e.g., param_cov from
+            LevMarLSQFitter, used to draw the initial walker positions
+        init_scale : float, optional
+            scale factor for the init_cov standard deviations
         kwargs : dict
             other keyword arguments to be passed to the solver
         """
         # optresult = self.opt_method(objfunc, initval, args=fargs)
         # fitparams = optresult['x']
 
+        self._reset_fit_info()
         ndim = len(initval)
         nwalkers = 2 * ndim
-        pos = initval + 1e-4 * np.random.randn(nwalkers, ndim)
-
-        # ensure all the walkers start within the bounds
-        model = fargs[0]
-        for cp in pos:
-            k = 0
-            for cname in model.param_names:
-                if not model.fixed[cname]:
-                    if model.bounds[cname][0] is not None:
-                        if cp[k] < model.bounds[cname][0]:
-                            cp[k] = model.bounds[cname][0]
-                    if model.bounds[cname][1] is not None:
-                        if cp[k] > model.bounds[cname][1]:
-                            cp[k] = model.bounds[cname][1]
-                    # only non-fixed parameters are in initval
-                    # so only increment k when non-fixed
-                    k += 1
+        if layout is None:
+            layout = ParameterLayout(fargs[0])
+        pos = self._init_walkers(
+            initval, nwalkers, layout, init_cov=init_cov, init_scale=init_scale
+        )
 
         # Set up the backend
+        save_backend = None
         if save_samples:
-            # Don't forget to clear it in case the file already exists
             save_backend = emcee.backends.HDFBackend(save_samples)
-            save_backend.reset(nwalkers, ndim)
+            if resume and save_backend.initialized and save_backend.iteration > 0:
+                self._check_backend_layout(save_backend, nwalkers, layout.param_names)
+                # continue from the last stored walker positions
+                pos = save_backend.get_last_sample()
+            else:
+                # Don't forget to clear it in case the file already exists
+                save_backend.reset(nwalkers, ndim)
+                with save_backend.open("a") as f:
+                    f[save_backend.name].attrs["param_names"] = layout.param_names
+        elif resume:
+            raise ValueError("resume requires save_samples")
+
+        # self contained objective functions do not need the arguments
+        #   avoids pickling the model when using a process pool
+        if isinstance(
+            objfunc,
+            (EmceeLogProbability, PoolLogProbability, TransformedLogProbability),
+        ):
+            objargs = None
+        else:
+            objargs = fargs
 
         sampler = self.opt_method.EnsembleSampler(
-            nwalkers, ndim, objfunc, backend=save_backend, args=fargs
+            nwalkers,
+            ndim,
+            objfunc,
+            backend=save_backend,
+            args=objargs,
+            vectorize=vectorize,
         )
-        sampler.run_mcmc(pos, nsteps, progress=True)
+        if autocorr_check:
+            # convergence based on the integrated autocorrelation time
+            #   following the emcee documentation
+            autocorr = {"iteration": [], "tau": [], "converged": False}
+            old_tau = np.inf
+            for sample in sampler.sample(pos, iterations=nsteps, progress=True):
+                if sampler.iteration % autocorr_check:
+                    continue
+
+                tau = sampler.get_autocorr_time(tol=0)
+                autocorr["iteration"].append(sampler.iteration)
+                autocorr["tau"].append(tau)
+
+                converged = np.all(tau * autocorr_ntau < sampler.iteration)
+                converged &= np.all(np.abs(old_tau - tau) / tau < autocorr_tol)
+                if converged:
+                    autocorr["converged"] = True
+                    break
+                old_tau = tau
+            autocorr["iteration"] = np.array(autocorr["iteration"])
+            autocorr["tau"] = np.array(autocorr["tau"])
+            self.fit_info["autocorr"] = autocorr
+        else:
+            sampler.run_mcmc(pos, nsteps, progress=True)
         samples = sampler.get_chain()
 
         fitparams = self._get_best_fit_params(sampler)
@@ -104,17 +973,340 @@ class EmceeOpt(Optimization):
         return fitparams, self.fit_info
 
 
+def hmc_sample(
+    block_and_grad,
+    pos,
+    nsteps,
+    inv_mass,
+    nleapfrog=10,
+    target_accept=0.8,
+    nadapt=0,
+    progress=True,
+):
+    """
+    Hamiltonian Monte Carlo for a set of chains run together so that each
+    leapfrog step is a single block evaluation.
+
+    The step size is adapted with dual averaging (Hoffman & Gelman 2014) and
+    the diagonal mass matrix set from the chain variance halfway through the
+    adaptation steps.
+
+    Parameters
+    ----------
+    block_and_grad : callable
+        gives the log(prob) and its gradient for a block of parameters
+    pos : 2D array
+        initial positions of the chains [nchains, ndim]
+    nsteps : int
+        number of steps
+    inv_mass : array
+        initial diagonal inverse mass matrix, roughly the parameter variances
+    nleapfrog : int, optional
+        number of leapfrog steps per trajectory
+    target_accept : float, optional
+        target acceptance probability for the step size adaptation
+    nadapt : int, optional
+        number of initial steps used for adaptation
+    progress : boolean, optional
+        show a progress bar
+
+    Returns
+    -------
+    chain : 3D array
+        samples [nsteps, nchains, ndim]
+    log_prob : 2D array
+        log(prob) of the samples [nsteps, nchains]
+    accepted : array
+        number of accepted trajectories for each chain
+    step_size : float
+        adapted step size
+    inv_mass : array
+        adapted diagonal inverse mass matrix
+    """
+    nchains, ndim = pos.shape
+    pos = np.array(pos)
+    inv_mass = np.array(inv_mass, dtype=float)
+    chain = np.empty((nsteps, nchains, ndim))
+    log_prob = np.empty((nsteps, nchains))
+    accepted = np.zeros(nchains)
+
+    lnp, grad = block_and_grad(pos)
+
+    # dual averaging for the step size, step in units of the mass matrix
+    step_size = 1.0 / nleapfrog
+    mu = np.log(10.0 * step_size)
+    hbar = 0.0
+    log_bar = 0.0
+    m = 0
+
+    with get_progress_bar(progress, nsteps) as pbar:
+        for i in range(nsteps):
+            # jitter the step size to avoid periodic trajectories
+            cstep = step_size * np.random.uniform(0.9, 1.1)
+
+            mom = np.random.standard_normal((nchains, ndim)) / np.sqrt(inv_mass)
+            q = pos.copy()
+            p = mom + 0.5 * cstep * grad
+            for k in range(nleapfrog):
+                q = q + cstep * inv_mass * p
+                qlnp, qgrad = block_and_grad(q)
+                if k < nleapfrog - 1:
+                    p = p + cstep * qgrad
+            p = p + 0.5 * cstep * qgrad
+
+            h_start = -lnp + 0.5 * np.sum(inv_mass * mom ** 2, axis=1)
+            h_end = -qlnp + 0.5 * np.sum(inv_mass * p ** 2, axis=1)
+            with np.errstate(invalid="ignore"):
+                log_alpha = np.minimum(0.0, h_start - h_end)
+            log_alpha[~np.isfinite(log_alpha)] = -np.inf
+
+            accept = np.log(np.random.uniform(size=nchains)) < log_alpha
+            pos[accept] = q[accept]
+            lnp[accept] = qlnp[accept]
+            grad[accept] = qgrad[accept]
+            accepted += accept
+            chain[i] = pos
+            log_prob[i] = lnp
+
+            if i < nadapt:
+                m += 1
+                eta = 1.0 / (m + 10.0)
+                hbar = (1.0 - eta) * hbar + eta * (
+                    target_accept - np.mean(np.exp(log_alpha))
+                )
+                log_step = mu - np.sqrt(m) / 0.05 * hbar
+                eta = m ** (-0.75)
+                log_bar = eta * log_step + (1.0 - eta) * log_bar
+                step_size = np.exp(log_step)
+
+                if i == nadapt // 2 and i > 0:
+                    # mass matrix from the 2nd quarter of the adaptation
+                    samples = chain[nadapt // 4 : i + 1].reshape(-1, ndim)
+                    inv_mass = np.var(samples, axis=0) + 1e-10
+                    # restart the step size adaptation for the new mass matrix
+                    mu = np.log(10.0 * step_size)
+                    hbar = 0.0
+                    log_bar = 0.0
+                    m = 0
+                elif i == nadapt - 1:
+                    step_size = np.exp(log_bar)
+
+            pbar.update(1)
+
+    return chain, log_prob, accepted, step_size, inv_mass
+
+
+class HMCOpt(EmceeOpt):
+    """
+    Hamiltonian Monte Carlo sampler using the analytic derivatives of the
+    model.  The chains are saved in the same format as EmceeOpt.
+    """
+
+    supported_constraints = ["bounds", "fixed"]
+    requires_gradient = True
+
+    def __init__(self):
+        super().__init__()
+        self._opt_method = hmc_sample
+
+    def _reset_fit_info(self):
+        """
+        New fit_info for a run, nothing is kept from a previous run.
+        """
+        super()._reset_fit_info()
+        self.fit_info["hmc"] = None
+
+    def __call__(
+        self,
+        objfunc,
+        initval,
+        fargs,
+        nsteps,
+        save_samples=None,
+        vectorize=False,
+        autocorr_check=None,
+        autocorr_ntau=50,
+        autocorr_tol=0.01,
+        resume=False,
+        layout=None,
+        init_cov=None,
+        init_scale=1.0,
+        nleapfrog=10,
+        target_accept=0.8,
+        nadapt=None,
+        **kwargs
+    ):
+        """
+        Run the sampler.
+
+        Parameters
+        ----------
+        objfunc : EmceeLogProbability
+            log(probability) with the block_and_grad method
+        initval : iterable
+            initial guess for the parameter values
+        fargs : tuple
+            other arguments to be passed to the statistic function
+        nsteps : int
+            number of steps in the MCMC chain
+        save_samples : str, optional
+            filename for the HDF5 file to save the samples
+        vectorize : boolean, optional
+            not used, always evaluates all the chains in one block
+        autocorr_check, autocorr_ntau, autocorr_tol : optional
+            not supported
+        resume : boolean, optional
+            not supported
+        layout : ParameterLayout, optional
+            free parameter layout of the model, computed if not given
+        init_cov : 2D array, optional
+            covariance matrix of the fit parameters used to draw the initial
+            chain positions and for the initial mass matrix
+        init_scale : float, optional
+            scale factor for the init_cov standard deviations
+        nleapfrog : int, optional
+            number of leapfrog steps per trajectory
+        target_accept : float, optional
+            target acceptance probability for the step size adaptation
+        nadapt : int, optional
+            number of adaptation steps, default is nsteps / 4
+        kwargs : dict
+            not used
+        """
+        block_and_grad = getattr(objfunc, "block_and_grad", None)
+        if block_and_grad is None:
+            raise ValueError("the HMC sampler requires the log(probability) gradient")
+        if resume:
+            raise ValueError("resume is not supported by the HMC sampler")
+        if autocorr_check:
+            warnings.warn("autocorr_check not supported by the HMC sampler")
+
+        self._reset_fit_info()
+        ndim = len(initval)
+        nchains = 2 * ndim
+        if layout is None:
+            layout = ParameterLayout(fargs[0])
+        pos = self._init_walkers(
+            initval, nchains, layout, init_cov=init_cov, init_scale=init_scale
+        )
+
+        if init_cov is not None:
+            inv_mass = (init_scale ** 2) * np.diag(init_cov)
+        else:
+            # Gauss-Newton approximation to the covariance
+            jac = objfunc.weighted_derivs(np.asarray(initval)[np.newaxis, :])[0]
+            inv_mass = np.diag(np.linalg.pinv(jac @ jac.T))
+        inv_mass = np.where(inv_mass > 0.0, inv_mass, 1.0)
+
+        if nadapt is None:
+            nadapt = nsteps // 4
+        chain, log_prob, accepted, step_size, inv_mass = self.opt_method(
+            block_and_grad,
+            pos,
+            nsteps,
+            inv_mass,
+            nleapfrog=nleapfrog,
+            target_accept=target_accept,
+            nadapt=nadapt,
+        )
+
+        backend = chain_to_backend(
+            chain,
+            log_prob,
+            accepted,
+            filename=save_samples,
+            param_names=layout.param_names,
+        )
+        self.fit_info["sampler"] = backend
+        self.fit_info["samples"] = chain
+        self.fit_info["hmc"] = {
+            "step_size": step_size,
+            "inv_mass": inv_mass,
+            "nadapt": nadapt,
+            "nleapfrog": nleapfrog,
+        }
+
+        return self._get_best_fit_params(backend), self.fit_info
+
+
+# samplers for EmceeFitter
+mcmc_samplers = {"emcee": EmceeOpt, "hmc": HMCOpt}
+
+
 class EmceeFitter(Fitter):
     """
     Use emcee and least squares statistic
+
+    Unless the model has tied parameters, the prior, model, and likelihood
+    are evaluated for all the walkers in one broadcast pass each step.
+
+    Parameters
+    ----------
+    nsteps : int
+        number of steps in the MCMC chain
+    burnfrac : float, optional
+        fraction of the chain to discard as burn in, default is to estimate
+        the burn in from the chain (see mcmc_chains.estimate_burnin)
+    save_samples : str, optional
+        filename for the HDF5 file to save the samples
+    nprocs : int, optional
+        number of processes to spread the walker evaluations over
+    autocorr_check : int, optional
+        check the autocorrelation time every autocorr_check steps and stop
+        when converged, nsteps is then the maximum number of steps
+    autocorr_ntau : float, optional
+        converged when the chain is longer than autocorr_ntau times the
+        autocorrelation time and the time has stabilized
+    autocorr_tol : float, optional
+        the time has stabilized when its fractional change since the
+        previous check is below autocorr_tol
+    resume : boolean, optional
+        if True, continue the chain stored in save_samples appending nsteps
+        more steps
+    projection : callable, optional
+        called as projection(model, x, y, weights=weights, layout=layout) to
+        give a log(probability) for a subset of the free parameters with the
+        rest solved/marginalized, e.g., varpro.LinearProjection.  It
+        must provide sample_indxs, sample_layout, and reconstruct.  The saved
+        chain has all the free parameters.
+    sampler : str or class, optional
+        MCMC sampler, "emcee", "hmc", or an Optimization class with the
+        EmceeOpt interface.  "hmc" requires the model to have analytic
+        derivatives (fit_deriv) and nprocs = 1.
+    unbounded : boolean, optional
+        if True, sample the bounded parameters in unconstrained parameters
+        (see BoundedTransform), the saved chain is in the model parameters
     """
 
-    def __init__(self, nsteps=100, burnfrac=0.1, save_samples=None):
-        super().__init__(optimizer=EmceeOpt, statistic=leastsquare)
+    def __init__(
+        self,
+        nsteps=100,
+        burnfrac=None,
+        save_samples=None,
+        nprocs=1,
+        autocorr_check=None,
+        autocorr_ntau=50,
+        autocorr_tol=0.01,
+        resume=False,
+        projection=None,
+        sampler="emcee",
+        unbounded=False,
+    ):
+        if isinstance(sampler, str):
+            sampler = mcmc_samplers[sampler]
+        super().__init__(optimizer=sampler, statistic=leastsquare)
         self.nsteps = nsteps
         self.burnfrac = burnfrac
         self.fit_info = {}
         self.save_samples = save_samples
+        self.nprocs = nprocs
+        self.autocorr_check = autocorr_check
+        self.autocorr_ntau = autocorr_ntau
+        self.autocorr_tol = autocorr_tol
+        self.resume = resume
+        self.projection = projection
+        self.unbounded = unbounded
+        self.layout = None
 
     # add lnlike and lnprior and have log_probability just be the combo of the two
     def log_prior(self, fps, *args):
@@ -141,17 +1333,11 @@ class EmceeFitter(Fitter):
         # need to be handled explicitly to get good sampler chains
         #   standard astropy modeling fitting results in chains not accurately
         #   reflecting the bounds
-        model = args[0]
-        k = 0
-        for cname in model.param_names:
-            if not model.fixed[cname]:
-                if model.bounds[cname][0] is not None:
-                    if fps[k] < model.bounds[cname][0]:
-                        return -np.inf
-                if model.bounds[cname][1] is not None:
-                    if fps[k] > model.bounds[cname][1]:
-                        return -np.inf
-                k += 1
+        # layout is compiled once per fit in __call__
+        if self.layout is None:
+            self.layout = ParameterLayout(args[0])
+        if not self.layout.in_bounds(fps):
+            return -np.inf
 
         # no other priors, so return 0.0 = log(1.0)
         return 0.0
@@ -210,6 +1396,72 @@ class EmceeFitter(Fitter):
             return -np.inf
         return lp + self.log_likelihood(fps, *args)
 
+    def _reconstruct_chain(self, projection, transform):
+        """
+        Reconstruct the chain of all the free parameters from the chain of
+        the sampled parameters.  Replaces the sampler in fit_info with a
+        backend with the full chain, saved to save_samples if set.
+
+        Parameters
+        ----------
+        projection : object
+            projection used for the sampling, None if not used
+        transform : BoundedTransform
+            transform used for the sampling, None if not used
+
+        Returns
+        -------
+        fitparams : array
+            best fit values for all the free parameters
+        """
+        sampler = self.fit_info["sampler"]
+        chain = sampler.get_chain()
+        log_prob = sampler.get_log_prob()
+        nsteps, nwalkers, nsample = chain.shape
+        samples = chain.reshape(-1, nsample)
+
+        if transform is not None:
+            # log(prob) of the model parameters without the Jacobian
+            log_prob = log_prob - transform.log_jacobian(samples).reshape(
+                nsteps, nwalkers
+            )
+            samples = transform.to_bounded(samples)
+        best_sample = samples[np.nanargmax(log_prob)]
+        if projection is not None:
+            samples = projection.reconstruct(samples)
+            fitparams = projection.reconstruct(best_sample[np.newaxis, :], draw=False)
+            fitparams = fitparams[0]
+        else:
+            fitparams = best_sample
+
+        self.fit_info["sampler"] = chain_to_backend(
+            samples.reshape(nsteps, nwalkers, self.layout.ndim),
+            log_prob,
+            getattr(sampler, "backend", sampler).accepted,
+            filename=self.save_samples,
+            param_names=self.layout.param_names,
+        )
+        self.fit_info["samples"] = self.fit_info["sampler"].get_chain()
+
+        return fitparams
+
+    def _set_discard(self):
+        """
+        Determine the number of burn in steps to discard, stored in fit_info
+        and with the saved samples.
+        """
+        sampler = self.fit_info["sampler"]
+        if self.burnfrac is None:
+            discard = estimate_burnin(sampler.get_log_prob(), sampler.get_chain())
+        else:
+            discard = int(self.burnfrac * sampler.iteration)
+        # adaptation steps of the HMC sampler are not valid samples
+        if self.fit_info.get("hmc") is not None:
+            discard = max(discard, self.fit_info["hmc"]["nadapt"])
+        self.fit_info["discard"] = discard
+        if self.save_samples:
+            set_discard(emcee.backends.HDFBackend(self.save_samples), discard)
+
     def _set_uncs_and_posterior(self, model):
         """
         Set the symmetric and asymmetric Gaussian uncertainties
@@ -226,40 +1478,36 @@ class EmceeFitter(Fitter):
             model updated with uncertainties
         """
         sampler = self.fit_info["sampler"]
-        nwalkers, nsteps = sampler.lnprobability.shape
-        # discard the 1st burn_frac (burn in)
-        flat_samples = sampler.get_chain(discard=int(self.burnfrac * nsteps), flat=True)
+        # discard the burn in
+        flat_samples = sampler.get_chain(discard=self.fit_info["discard"], flat=True)
         nflatsteps, ndim = flat_samples.shape
 
+        # percentiles for all the fit parameters at once
+        mcmc = np.percentile(flat_samples, [16, 50, 84], axis=0)
+
+        # set the uncertainty arrays - could be done via the parameter objects
+        # but would need an update to the model properties to make this happen
+        # fixed parameters have zero uncertainties
         nparams = len(model.parameters)
         model.uncs = np.zeros((nparams))
         model.uncs_plus = np.zeros((nparams))
         model.uncs_minus = np.zeros((nparams))
-        k = 0
+        # the model keeps the max log probability parameters
+        fit_indxs = self.layout.fit_indxs
+        model.uncs[fit_indxs] = 0.5 * (mcmc[2] - mcmc[0])
+        model.uncs_plus[fit_indxs] = mcmc[2] - mcmc[1]
+        model.uncs_minus[fit_indxs] = mcmc[1] - mcmc[0]
+
+        for pname in model.param_names:
+            param = getattr(model, pname)
+            param.posterior = None
+        for k, pname in enumerate(self.layout.param_names):
+            # set the posterior distribution to the samples
+            param = getattr(model, pname)
+            param.posterior = astrounc.Distribution(flat_samples[:, k])
+
+        # now set uncertainties on the parameter objects themselves
         for i, pname in enumerate(model.param_names):
-            if not model.fixed[pname]:
-                mcmc = np.percentile(flat_samples[:, k], [16, 50, 84])
-
-                # set the uncertainty arrays - could be done via the parameter objects
-                # but would need an update to the model properties to make this happen
-                model.parameters[i] = mcmc[1]
-                model.uncs[i] = 0.5 * (mcmc[2] - mcmc[0])
-                model.uncs_plus[i] = mcmc[2] - mcmc[1]
-                model.uncs_minus[i] = mcmc[1] - mcmc[0]
-
-                # set the posterior distribution to the samples
-                param = getattr(model, pname)
-                param.posterior = astrounc.Distribution(flat_samples[:, k])
-                k += 1
-            else:
-                model.uncs[i] = 0.0
-                model.uncs_plus[i] = 0.0
-                model.uncs_minus[i] = 0.0
-                # set the posterior distribution to the samples
-                param = getattr(model, pname)
-                param.posterior = None
-
-            # now set uncertainties on the parameter objects themselves
             param = getattr(model, pname)
             param.unc = model.uncs[i]
             param.unc_plus = model.uncs_plus[i]
@@ -297,14 +1545,98 @@ class EmceeFitter(Fitter):
         farg = (model_copy, weights) + farg
         p0, _ = _model_to_fit_params(model_copy)
 
-        fitparams, self.fit_info = self._opt_method(
-            self.log_probability,
-            p0,
-            farg,
-            self.nsteps,
-            save_samples=self.save_samples,
-            **kwargs
-        )
+        # compile the free parameter layout once for the fit
+        self.layout = ParameterLayout(model_copy)
+
+        layout = self.layout
+        save_samples = self.save_samples
+        projection = None
+        log_probability = None
+        if self.projection is not None:
+            if self.resume:
+                raise ValueError("resume is not supported with a projection")
+            projection = self.projection(
+                model_copy, farg[2], farg[3], weights=weights, layout=self.layout
+            )
+            log_probability = projection
+            # only sample the subset of the parameters
+            layout = projection.sample_layout
+            p0 = p0[projection.sample_indxs]
+            if kwargs.get("init_cov") is not None:
+                kwargs["init_cov"] = np.asarray(kwargs["init_cov"])[
+                    np.ix_(projection.sample_indxs, projection.sample_indxs)
+                ]
+            # full chain saved after the other parameters are reconstructed
+            save_samples = None
+        elif (
+            not self.layout.has_tied
+            or self.nprocs > 1
+            or self.unbounded
+            or self._opt_method.requires_gradient
+        ):
+            # self contained log(probability) avoids the astropy model overhead
+            log_probability = EmceeLogProbability(
+                model_copy, farg[2], farg[3], weights=weights, layout=self.layout
+            )
+
+        transform = None
+        if self.unbounded:
+            if self.resume:
+                raise ValueError("resume is not supported with unbounded")
+            transform = BoundedTransform(layout)
+            log_probability = TransformedLogProbability(log_probability, transform)
+            if kwargs.get("init_cov") is not None:
+                kwargs["init_cov"] = transform.transform_cov(p0, kwargs["init_cov"])
+            p0 = transform.to_unbounded(layout.clip(p0))
+            layout = transform.layout
+            # chain saved after the transform back to the model parameters
+            save_samples = None
+
+        pool = None
+        if self.nprocs > 1 and self._opt_method.requires_gradient:
+            raise ValueError(
+                "nprocs > 1 is not supported by the %s sampler" % self._opt_method
+            )
+        elif self.nprocs > 1:
+            # picklable log(probability) set once in each worker process
+            pool = multiprocessing.Pool(
+                self.nprocs,
+                initializer=_init_pool_worker,
+                initargs=(log_probability,),
+            )
+            objfunc = PoolLogProbability(pool, self.nprocs)
+            vectorize = True
+        elif log_probability is not None:
+            objfunc = log_probability
+            vectorize = True
+        else:
+            objfunc = self.log_probability
+            vectorize = False
+
+        try:
+            fitparams, self.fit_info = self._opt_method(
+                objfunc,
+                p0,
+                farg,
+                self.nsteps,
+                save_samples=save_samples,
+                vectorize=vectorize,
+                autocorr_check=self.autocorr_check,
+                autocorr_ntau=self.autocorr_ntau,
+                autocorr_tol=self.autocorr_tol,
+                resume=self.resume,
+                layout=layout,
+                **kwargs
+            )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if projection is not None or transform is not None:
+            fitparams = self._reconstruct_chain(projection, transform)
+
+        self._set_discard()
 
         # set the output model parameters to the "best fit" parameters
         _fitter_to_model_params(model_copy, fitparams)
@@ -322,26 +1654,23 @@ class EmceeFitter(Fitter):
         sampler = self.fit_info["sampler"]
 
         # only the non fixed parameters were fit
-        fit_param_names = []
-        for pname in fitted_model.param_names:
-            if not fitted_model.fixed[pname]:
-                fit_param_names.append(pname)
+        fit_param_names = self.layout.param_names
 
         # plot the walker chains for all parameters
-        nwalkers, nsteps, ndim = sampler.chain.shape
+        chain = sampler.get_chain()
+        nsteps, nwalkers, ndim = chain.shape
         fig, ax = plt.subplots(ndim, sharex=True, figsize=(13, 13))
         walk_val = np.arange(nsteps)
         for i in range(ndim):
             for k in range(nwalkers):
-                ax[i].plot(walk_val, sampler.chain[k, :, i], "-")
+                ax[i].plot(walk_val, chain[:, k, i], "-")
                 ax[i].set_ylabel(fit_param_names[i])
         fig.savefig("%s_walker_param_values.png" % filebase)
         plt.close(fig)
 
         # plot the 1D and 2D likelihood functions in a traditional triangle plot
-        nwalkers, nsteps = sampler.lnprobability.shape
-        # discard the 1st burn_frac (burn in)
-        flat_samples = sampler.get_chain(discard=int(self.burnfrac * nsteps), flat=True)
+        # discard the burn in
+        flat_samples = sampler.get_chain(discard=self.fit_info["discard"], flat=True)
         nflatsteps, ndim = flat_samples.shape
         fig = corner.corner(
             flat_samples,
@@ -352,3 +1681,117 @@ class EmceeFitter(Fitter):
         )
         fig.savefig("%s_param_triangle.png" % filebase)
         plt.close(fig)
+
+
+class LaplaceFitter(EmceeFitter):
+    """
+    Gaussian (Laplace) approximation to the posterior around the best fit.
+    A quick alternative to a full MCMC run.  The model should already be
+    at the best fit, e.g., from LevMarLSQFitter.
+
+    The covariance is the inverse of the Hessian of the chisqr computed
+    from a numerical Jacobian of the weighted residuals.  Samples are drawn
+    from the Gaussian truncated to the parameter bounds and stored in the
+    same format as EmceeFitter, including save_samples.
+
+    Parameters
+    ----------
+    nsteps : int
+        number of "steps", nsteps * nwalkers samples are drawn
+    save_samples : str, optional
+        filename for the HDF5 file to save the samples
+    deriv_step : float, optional
+        relative step for the numerical Jacobian
+    """
+
+    def __init__(self, nsteps=100, save_samples=None, deriv_step=1e-5):
+        super().__init__(nsteps=nsteps, burnfrac=0.0, save_samples=save_samples)
+        self.deriv_step = deriv_step
+
+    def _laplace_cov(self, log_probability, fps):
+        """
+        Covariance matrix of the Gaussian approximation to the posterior.
+
+        Parameters
+        ----------
+        log_probability : EmceeLogProbability
+            log(probability) of the fit
+        fps : array
+            best fit parameters
+
+        Returns
+        -------
+        cov : 2D array
+            covariance matrix
+        """
+        ndim = len(fps)
+        steps = self.deriv_step * np.maximum(np.absolute(fps), 1e-3)
+        # central differences for all the parameters in one block
+        block = np.tile(fps, (2 * ndim, 1))
+        block[np.arange(ndim), np.arange(ndim)] += steps
+        block[np.arange(ndim) + ndim, np.arange(ndim)] -= steps
+        ymod = log_probability.model_block(self.layout.full_params(block))
+        jac = log_probability.weights * (ymod[:ndim] - ymod[ndim:])
+        jac = jac.T / (2.0 * steps)
+        return np.linalg.pinv(jac.T @ jac)
+
+    def __call__(self, model, x, y, weights=None, **kwargs):
+        """
+        Sample the Gaussian approximation to the posterior.
+
+        Parameters
+        ----------
+        model : `~astropy.modeling.FittableModel`
+            model at the best fit
+        x : array
+            input coordinates
+        y : array
+            input coordinates
+        weights : array, optional
+            Weights for fitting.
+            For data with Gaussian uncertainties, the weights should be
+            1/sigma.
+        kwargs : dict
+            not used, for compatibility with EmceeFitter
+
+        Returns
+        -------
+        model_copy : `~astropy.modeling.FittableModel`
+            a copy of the input model with the uncertainties set
+        """
+        model_copy = _validate_model(model, self._opt_method.supported_constraints)
+        self.layout = ParameterLayout(model_copy)
+        log_probability = EmceeLogProbability(
+            model_copy, x, y, weights=weights, layout=self.layout
+        )
+
+        fitparams = self.layout.params[self.layout.fit_indxs]
+        cov = self._laplace_cov(log_probability, fitparams)
+
+        ndim = self.layout.ndim
+        nwalkers = 2 * ndim
+        samples = EmceeOpt._init_walkers(
+            fitparams, self.nsteps * nwalkers, self.layout, init_cov=cov
+        )
+        log_prob = log_probability.block(samples)
+
+        backend = chain_to_backend(
+            samples.reshape(self.nsteps, nwalkers, ndim),
+            log_prob.reshape(self.nsteps, nwalkers),
+            np.full(nwalkers, self.nsteps),
+            filename=self.save_samples,
+            param_names=self.layout.param_names,
+        )
+        self.fit_info = {
+            "perparams": None,
+            "samples": backend.get_chain(),
+            "sampler": backend,
+            "autocorr": None,
+            "cov": cov,
+        }
+        self._set_discard()
+
+        # best fit is the input model
+        _fitter_to_model_params(model_copy, fitparams)
+
+        return self._set_uncs_and_posterior(model_copy)
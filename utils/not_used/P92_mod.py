@@ -307,5 +307,91 @@ class P92_mod(Fittable1DModel):
         # return A(x)/A(V)
         return axav
 
-    # use numerical derivaties (need to add analytic)
-    fit_deriv = None
+    @staticmethod
+    def _p92_single_term_deriv(in_lambda, amplitude, cen_wave, b, n):
+        r"""
+        Derivatives of a single P92 term with respect to the amplitude,
+        central wavelength, b coefficient, and n coefficient
+
+        Parameters
+        ----------
+        in_lambda: vector of floats
+           wavelengths in same units as cen_wave
+
+        amplitude: float
+           amplitude
+
+        cen_wave: flaot
+           central wavelength
+
+        b : float
+           b coefficient
+
+        n : float
+           n coefficient
+        """
+        l_norm = in_lambda / cen_wave
+        l_norm_n = np.power(l_norm, n)
+        l_norm_mn = np.power(l_norm, -1 * n)
+        denom = l_norm_n + l_norm_mn + b
+
+        d_amplitude = 1.0 / denom
+        d_denom = -amplitude / (denom ** 2)
+        d_cen_wave = d_denom * (n / cen_wave) * (l_norm_mn - l_norm_n)
+        d_b = d_denom
+        d_n = d_denom * np.log(l_norm) * (l_norm_n - l_norm_mn)
+
+        return [d_amplitude, d_cen_wave, d_b, d_n]
+
+    def _p92_width_term_deriv(self, in_lambda, amplitude, cen_wave, width):
+        """
+        Derivatives of a single P92 term with n = 2 and b computed from the
+        width with respect to the amplitude, central wavelength, and width
+        """
+        b = np.power((width / cen_wave), 2.0) - 2.0
+        d_amplitude, d_cen_wave, d_b, d_n = self._p92_single_term_deriv(
+            in_lambda, amplitude, cen_wave, b, 2.0
+        )
+
+        # b depends on the central wavelength and width
+        d_cen_wave = d_cen_wave + d_b * (-2.0 * (width ** 2) / (cen_wave ** 3))
+        d_width = d_b * 2.0 * width / (cen_wave ** 2)
+
+        return [d_amplitude, d_cen_wave, d_width]
+
+    def fit_deriv(
+        self,
+        in_x,
+        BKG_amp,
+        BKG_lambda,
+        BKG_width,
+        FUV_amp,
+        FUV_lambda,
+        FUV_b,
+        FUV_n,
+        NUV_amp,
+        NUV_lambda,
+        NUV_width,
+        SIL1_amp,
+        SIL1_lambda,
+        SIL1_width,
+        SIL2_amp,
+        SIL2_lambda,
+        SIL2_width,
+        FIR_amp,
+        FIR_lambda,
+        FIR_width,
+    ):
+        """
+        Derivatives of the P92 function with respect to the parameters
+        """
+        lam = 1.0 / in_x
+
+        return (
+            self._p92_width_term_deriv(lam, BKG_amp, BKG_lambda, BKG_width)
+            + self._p92_single_term_deriv(lam, FUV_amp, FUV_lambda, FUV_b, FUV_n)
+            + self._p92_width_term_deriv(lam, NUV_amp, NUV_lambda, NUV_width)
+            + self._p92_width_term_deriv(lam, SIL1_amp, SIL1_lambda, SIL1_width)
+            + self._p92_width_term_deriv(lam, SIL2_amp, SIL2_lambda, SIL2_width)
+            + self._p92_width_term_deriv(lam, FIR_amp, FIR_lambda, FIR_width)
+        )
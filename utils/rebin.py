@@ -0,0 +1,135 @@
+import numpy as np
+
+all = ["bin_indices", "rebin_spectra"]
+
+
+def bin_indices(waves, bin_min, bin_max):
+    """
+    Bin of each wavelength for sorted, non-overlapping bins [min, max).
+
+    Parameters
+    ----------
+    waves : array
+        wavelengths
+    bin_min, bin_max : 1D arrays
+        minimum and maximum wavelengths of the bins, increasing
+
+    Returns
+    -------
+    indxs : array
+        bin index of each wavelength, -1 if not in a bin
+    """
+    waves = np.asarray(waves)
+    indxs = np.searchsorted(bin_min, waves, side="right") - 1
+    inbin = (indxs >= 0) & (waves < np.asarray(bin_max)[np.maximum(indxs, 0)])
+    return np.where(inbin, indxs, -1)
+
+
+def rebin_spectra(
+    waves, values, bin_min, bin_max, uncs=None, npts=None, weighted=False, unc=None
+):
+    """
+    Rebin one or many spectra onto wavelength bins.
+
+    The points in each bin are found once with a sorted search and summed
+    with np.bincount, avoiding a search over all the points for each bin.
+
+    Only points with finite values, and finite, positive uncertainties when
+    uncs is given, are used.  Other points are skipped, not propagated as
+    nan or inf into their bins, so bins with such points differ from a plain
+    average of all the points in the bin.
+
+    Parameters
+    ----------
+    waves : array
+        wavelengths [nwaves] shared by all the spectra or [nspec, nwaves]
+    values : array
+        spectra [nwaves] or [nspec, nwaves]
+    bin_min, bin_max : 1D arrays
+        minimum and maximum wavelengths of the bins [min, max), increasing
+        (e.g., from measure_extinction.merge_obsspec._wavegrid)
+    uncs : array, optional
+        uncertainties with the same shape as values, required for the weighted
+        mean and the uncertainties, points with uncs <= 0 are not used
+    npts : array, optional
+        number of points for each value, values with npts <= 0 are not used
+    weighted : boolean, optional
+        inverse variance weighted instead of unweighted mean
+    unc : str, optional
+        uncertainty of the binned values, "propagated" for the propagated
+        uncertainty of the mean or "weighted" for 1/sqrt(sum(1/uncs^2)),
+        default is "weighted" for the weighted mean and "propagated" otherwise
+
+    Returns
+    -------
+    bvalues : array
+        binned values [nbins] or [nspec, nbins], nan for empty bins
+    buncs : array
+        binned uncertainties, None if uncs not given
+    bnpts : array
+        number of points in each bin
+    """
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    values = np.atleast_2d(values)
+    nspec, nwaves = values.shape
+    nbins = len(bin_min)
+    waves = np.broadcast_to(np.asarray(waves, dtype=float), values.shape)
+
+    good = np.isfinite(values)
+    if uncs is not None:
+        uncs = np.atleast_2d(np.asarray(uncs, dtype=float))
+        good &= np.isfinite(uncs) & (uncs > 0.0)
+    if npts is not None:
+        good &= np.atleast_2d(npts) > 0
+    bindxs = bin_indices(waves, bin_min, bin_max)
+    good &= bindxs >= 0
+
+    # one bin index over all the spectra for one bincount
+    flat = (np.arange(nspec)[:, np.newaxis] * nbins + bindxs)[good]
+    size = nspec * nbins
+
+    def binsum(vals):
+        return np.bincount(flat, weights=vals[good], minlength=size).reshape(
+            nspec, nbins
+        )
+
+    bnpts = np.bincount(flat, minlength=size).reshape(nspec, nbins)
+    filled = bnpts > 0
+    if weighted or uncs is not None:
+        if uncs is None:
+            raise ValueError("uncs needed for the weighted mean")
+        ivar = np.zeros(values.shape)
+        ivar[good] = 1.0 / np.square(uncs[good])
+        sum_ivar = binsum(ivar)
+
+    bvalues = np.full((nspec, nbins), np.nan)
+    if weighted:
+        bvalues[filled] = binsum(ivar * np.where(good, values, 0.0))[filled]
+        bvalues[filled] /= sum_ivar[filled]
+    else:
+        bvalues[filled] = binsum(values)[filled] / bnpts[filled]
+
+    buncs = None
+    if uncs is not None:
+        if unc is None:
+            unc = "weighted" if weighted else "propagated"
+        buncs = np.full((nspec, nbins), np.nan)
+        if unc == "weighted":
+            buncs[filled] = 1.0 / np.sqrt(sum_ivar[filled])
+        elif unc == "propagated":
+            if weighted:
+                buncs[filled] = 1.0 / np.sqrt(sum_ivar[filled])
+            else:
+                buncs[filled] = (
+                    np.sqrt(binsum(np.square(uncs))[filled]) / bnpts[filled]
+                )
+        else:
+            raise ValueError("unc must be propagated or weighted")
+
+    if single:
+        bvalues = bvalues[0]
+        bnpts = bnpts[0]
+        if buncs is not None:
+            buncs = buncs[0]
+    return bvalues, buncs, bnpts
@@ -0,0 +1,377 @@
+import argparse
+import contextlib
+import multiprocessing
+import os
+import runpy
+import shlex
+import sys
+import time
+import traceback
+from functools import lru_cache
+
+import matplotlib
+
+from astropy.table import Table
+
+from dependencies import DependencyTracker, local_modules
+
+# directory with the scripts run for each sightline
+utils_dir = os.path.dirname(os.path.abspath(__file__))
+
+# default arguments from fit_plasymdrude_all_ext and fit_fm90_all_ext
+g21_default_args = "--png --nsteps=10000 --autocorr_check=500 --init_cov"
+fm90_default_args = "--png --nsteps=10000 --autocorr_check=500 --init_cov"
+
+# default base path to the observed data from calc_ext
+calc_default_path = "/home/kgordon/Python_git/extstar_data/"
+
+
+def _init_worker():
+    """
+    Set up a worker process once, the imports done by the scripts are then
+    reused for all the sightlines run by the worker.
+    """
+    matplotlib.use("Agg")
+    if utils_dir not in sys.path:
+        sys.path.insert(0, utils_dir)
+
+
+def run_script(script, argv, logfile):
+    """
+    Run a script in this process as __main__ with its output in a log file.
+
+    Parameters
+    ----------
+    script : str
+        script file name
+    argv : list of str
+        commandline arguments for the script
+    logfile : str
+        file for the stdout and stderr of the script
+
+    Returns
+    -------
+    status : int
+        exit status, 0 for success
+    runtime : float
+        run time in seconds
+    """
+    import matplotlib.pyplot as plt
+
+    start = time.time()
+    saved_argv = sys.argv
+    with open(logfile, "w") as log:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            sys.argv = [script] + argv
+            try:
+                runpy.run_path(script, run_name="__main__")
+                status = 0
+            except SystemExit as err:
+                if err.code is None or isinstance(err.code, int):
+                    status = err.code or 0
+                else:
+                    print(err.code)
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.argv = saved_argv
+                plt.close("all")
+    return status, time.time() - start
+
+
+def sightline_steps(job):
+    """
+    Steps for one sightline with their scripts, arguments, inputs, and outputs.
+
+    Parameters
+    ----------
+    job : dict
+        sightline, red and comparison star names, the arguments for each step,
+        and the path to the observed data
+
+    Returns
+    -------
+    steps : list of tuples
+        (step, script, argv, inputs, outputs) for the calc_ext, G21 fit, and
+        FM90 fit steps in order
+    """
+    extfile = "fits/%s_%s_ext.fits" % (job["redstar"], job["compstar"])
+    g21file = extfile.replace(".fits", "_POWLAW2DRUDE.fits")
+    fm90file = g21file.replace(".fits", "_FM90.fits")
+    calc_args = [job["redstar"], job["compstar"]]
+    if job["path"] is not None:
+        calc_args += ["--path", job["path"]]
+        datpath = job["path"]
+    else:
+        datpath = calc_default_path
+    datfiles = [
+        os.path.join(datpath, "DAT_files/%s.dat" % cname)
+        for cname in [job["redstar"], job["compstar"]]
+    ]
+    return [
+        ("calc", "calc_ext.py", calc_args, datfiles, [extfile]),
+        (
+            "g21",
+            "fit_mir_ext_powerlaw.py",
+            [extfile] + job["g21_args"],
+            [extfile],
+            [g21file],
+        ),
+        (
+            "fm90",
+            "fit_uv_ext_fm90.py",
+            [g21file] + job["fm90_args"],
+            [g21file],
+            [fm90file],
+        ),
+    ]
+
+
+@lru_cache(maxsize=None)
+def step_code_files(script):
+    """
+    Code files for a step, the script and the local modules it imports,
+    changes to any of them rerun the step.
+
+    Parameters
+    ----------
+    script : str
+        script file name in the utils directory
+
+    Returns
+    -------
+    code : tuple of str
+        code file names relative to the current directory
+    """
+    return tuple(local_modules(os.path.join(utils_dir, script)))
+
+
+def plan_sightline(tracker, job):
+    """
+    Find the steps of a sightline that need to run because their inputs, code,
+    or arguments changed or their outputs are missing.  All the steps after a
+    step that runs also run as their inputs are the outputs of that step.
+
+    Parameters
+    ----------
+    tracker : DependencyTracker
+        recorded signatures of the steps
+    job : dict
+        sightline job, job["steps"] are the requested steps
+
+    Returns
+    -------
+    reasons : dict
+        reasons to run each requested step, an empty list if up to date
+    """
+    reasons = {}
+    upstream = None
+    for step, script, argv, inputs, outputs in sightline_steps(job):
+        if step not in job["steps"]:
+            continue
+        if upstream is not None:
+            reasons[step] = ["%s runs" % upstream]
+        else:
+            reasons[step] = tracker.changes(
+                "%s %s" % (job["sightline"], step),
+                inputs,
+                code=step_code_files(script),
+                args=argv,
+                outputs=outputs,
+            )
+        if len(reasons[step]) > 0:
+            upstream = step
+    return reasons
+
+
+def record_sightline(tracker, job, results):
+    """
+    Record the signatures of the steps of a sightline that succeeded.
+
+    Parameters
+    ----------
+    tracker : DependencyTracker
+        recorded signatures of the steps
+    job : dict
+        sightline job
+    results : list of tuples
+        (sightline, step, status, runtime) for each step run
+    """
+    succeeded = [step for _, step, status, _ in results if status == 0]
+    for step, script, argv, inputs, outputs in sightline_steps(job):
+        if step in succeeded:
+            tracker.record(
+                "%s %s" % (job["sightline"], step),
+                inputs,
+                code=step_code_files(script),
+                args=argv,
+            )
+
+
+def run_sightline(job):
+    """
+    Run the calc_ext, G21 fit, and FM90 fit steps for one sightline, later
+    steps are skipped if a step fails.
+
+    Parameters
+    ----------
+    job : dict
+        sightline, red and comparison star names, steps to run, the
+        arguments for each step, and the log directory
+
+    Returns
+    -------
+    results : list of tuples
+        (sightline, step, status, runtime) for each step, status is None for
+        skipped steps
+    """
+    results = []
+    failed = False
+    for step, script, argv, inputs, outputs in sightline_steps(job):
+        if step not in job["steps"]:
+            continue
+        if failed:
+            results.append((job["sightline"], step, None, 0.0))
+            continue
+        # start new chains unless resuming
+        if step != "calc" and "--resume" not in argv:
+            chainfile = outputs[0].replace(".fits", ".h5")
+            if os.path.isfile(chainfile):
+                os.remove(chainfile)
+        logfile = os.path.join(job["logdir"], "%s_%s.log" % (job["sightline"], step))
+        status, runtime = run_script(os.path.join(utils_dir, script), argv, logfile)
+        results.append((job["sightline"], step, status, runtime))
+        failed = status != 0
+    return results
+
+
+def read_manifest(filename):
+    """
+    Read the sightlines from a list of extinction curve files
+    (e.g., data/all_ext_14oct20.dat).
+
+    Parameters
+    ----------
+    filename : str
+        file with one extinction curve file name per line, # for comments
+
+    Returns
+    -------
+    sightlines : list of tuples
+        (sightline, reddened star, comparison star)
+    """
+    sightlines = []
+    with open(filename, "r") as f:
+        for line in f:
+            name = line.strip()
+            if (len(name) == 0) or (name.find("#") == 0):
+                continue
+            sightline = os.path.basename(name).split("_ext")[0]
+            redstar, compstar = sightline.split("_")[0:2]
+            sightlines.append((sightline, redstar, compstar))
+    return sightlines
+
+
+if __name__ == "__main__":
+
+    # commandline parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest", help="file with the list of sightlines")
+    parser.add_argument(
+        "--steps",
+        help="comma separated steps to run for each sightline",
+        default="calc,g21,fm90",
+    )
+    parser.add_argument(
+        "--nprocs",
+        help="number of sightlines run in parallel, the fits then need nprocs=1",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--g21_args", help="arguments for the G21 fits", default=g21_default_args
+    )
+    parser.add_argument(
+        "--fm90_args", help="arguments for the FM90 fits", default=fm90_default_args
+    )
+    parser.add_argument("--path", help="base path to observed data for calc_ext")
+    parser.add_argument("--logdir", help="directory for the logs", default="logs")
+    parser.add_argument(
+        "--dry_run",
+        help="only report the steps that would run and why",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--force", help="run the steps even if up to date", action="store_true"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.logdir, exist_ok=True)
+    jobs = [
+        {
+            "sightline": sightline,
+            "redstar": redstar,
+            "compstar": compstar,
+            "steps": args.steps.split(","),
+            "g21_args": shlex.split(args.g21_args),
+            "fm90_args": shlex.split(args.fm90_args),
+            "path": args.path,
+            "logdir": args.logdir,
+        }
+        for sightline, redstar, compstar in read_manifest(args.manifest)
+    ]
+
+    # only run the steps with changed inputs, code, or arguments
+    tracker = DependencyTracker()
+    nuptodate = 0
+    for job in jobs:
+        if args.force:
+            continue
+        reasons = plan_sightline(tracker, job)
+        job["steps"] = [step for step in job["steps"] if len(reasons[step]) > 0]
+        for step, sreasons in reasons.items():
+            if len(sreasons) == 0:
+                nuptodate += 1
+            elif args.dry_run:
+                print(f"{job['sightline']} {step}: {', '.join(sreasons)}")
+    jobs = [job for job in jobs if len(job["steps"]) > 0]
+    print(f"{nuptodate} steps up to date, {len(jobs)} sightlines to run")
+    if args.dry_run:
+        sys.exit(0)
+
+    # run the sightlines in parallel, the steps for each in order
+    results = []
+    sjobs = {job["sightline"]: job for job in jobs}
+    with multiprocessing.Pool(args.nprocs, initializer=_init_worker) as pool:
+        for sresults in pool.imap_unordered(run_sightline, jobs):
+            for sightline, step, status, runtime in sresults:
+                if status is None:
+                    print(f"{sightline} {step}: skipped")
+                else:
+                    print(f"{sightline} {step}: status={status} {runtime:.1f} s")
+            results += sresults
+            if len(sresults) > 0:
+                record_sightline(tracker, sjobs[sresults[0][0]], sresults)
+                tracker.write()
+
+    # status of -1 for skipped steps
+    results.sort(key=lambda result: result[0])
+    otab = Table(
+        rows=[
+            (sightline, step, -1 if status is None else status, runtime)
+            for sightline, step, status, runtime in results
+        ],
+        names=["sightline", "step", "status", "runtime"],
+    )
+    otab.write(
+        os.path.join(args.logdir, "run_summary.dat"),
+        format="ascii.commented_header",
+        overwrite=True,
+    )
+
+    nfailed = sum([status != 0 for _, _, status, _ in results])
+    if nfailed > 0:
+        print(f"{nfailed} steps failed or were skipped, see {args.logdir}")
+        sys.exit(1)
@@ -0,0 +1,203 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from measure_extinction.extdata import ExtData
+
+from mcmc_chains import ChainReader
+
+all = ["read_filelist", "SampleData", "load_sample", "load_filelist"]
+
+
+def read_filelist(filelist, basedir="fits", sort=False):
+    """
+    Read the extinction curve files from a list file.
+
+    Parameters
+    ----------
+    filelist : str
+        file with one extinction curve file name per line, # for comments
+    basedir : str, optional
+        directory with the extinction curve files
+    sort : boolean, optional
+        sort the names
+
+    Returns
+    -------
+    names : list of str
+        names as given in the list file
+    extfnames : list of str
+        extinction curve file names
+    """
+    names = []
+    with open(filelist, "r") as f:
+        for line in f:
+            name = line.strip()
+            if (len(name) == 0) or (name.find("#") == 0):
+                continue
+            names.append(name)
+    if sort:
+        names = sorted(names)
+    return names, [os.path.join(basedir, name) for name in names]
+
+
+class SampleData:
+    """
+    Extinction curves, FM90 fits, and MCMC chains for a sample of sightlines,
+    all lists are in the order of the sightlines with None for missing files.
+
+    Attributes
+    ----------
+    names : list of str
+        sightline names as given in the list file
+    extfnames : list of str
+        extinction curve file names
+    exts : list of ExtData
+        extinction curves
+    exts_fm90 : list of ExtData
+        FM90 fits of the curves (_FM90.fits), if loaded
+    chains, chains_fm90 : list of 2D arrays
+        flattened, burned in samples of the fits to the curves and the FM90
+        fits (.h5), if loaded
+    timing : list of tuples
+        (file name, load time in seconds) for each file loaded
+    """
+
+    def __init__(self, names, extfnames):
+        self.names = list(names)
+        self.extfnames = list(extfnames)
+        n_ext = len(self.names)
+        self.exts = [None] * n_ext
+        self.exts_fm90 = [None] * n_ext
+        self.chains = [None] * n_ext
+        self.chains_fm90 = [None] * n_ext
+        self.timing = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def print_timing(self, nslowest=5):
+        """
+        Print the total load time and the slowest files.
+
+        Parameters
+        ----------
+        nslowest : int, optional
+            number of the slowest files to print
+        """
+        total = sum([ctime for _, ctime in self.timing])
+        print(f"loaded {len(self.timing)} files, {total:.2f} s summed over threads")
+        for cfile, ctime in sorted(self.timing, key=lambda x: -x[1])[0:nslowest]:
+            print(f"  {ctime:.3f} s {cfile}")
+
+
+def _load_chain(chainfile, burnfrac, thin):
+    """
+    Flattened, burned in samples of a chain.
+    """
+    return ChainReader(chainfile, burnfrac=burnfrac, thin=thin).get_chain(flat=True)
+
+
+def _timed_load(task):
+    """
+    Load one file and time it.
+    """
+    attr, k, filename, loader = task
+    start = time.time()
+    return attr, k, filename, loader(filename), time.time() - start
+
+
+def load_sample(
+    extfnames,
+    names=None,
+    fm90=False,
+    chains=False,
+    burnfrac=0.4,
+    thin=1,
+    max_workers=8,
+    verbose=False,
+):
+    """
+    Load the extinction curves and, optionally, their FM90 fits and chains
+    with a pool of threads as the time is mostly spent reading the files.
+
+    Parameters
+    ----------
+    extfnames : list of str
+        extinction curve file names
+    names : list of str, optional
+        sightline names, default is extfnames
+    fm90 : boolean, optional
+        load the FM90 fits of the curves (_FM90.fits) if they exist
+    chains : boolean, optional
+        load the chains of the curves (.h5) and of the FM90 fits if they exist
+    burnfrac : float, optional
+        fraction of the chains to discard if no burn in is stored
+    thin : int or "auto", optional
+        only use every thin steps of the chains
+    max_workers : int, optional
+        number of threads
+    verbose : boolean, optional
+        print the load time of the slowest files
+
+    Returns
+    -------
+    sample : SampleData
+        loaded sample
+    """
+    if names is None:
+        names = extfnames
+    sample = SampleData(names, extfnames)
+
+    def chain_loader(chainfile):
+        return _load_chain(chainfile, burnfrac, thin)
+
+    tasks = []
+    for k, extfname in enumerate(extfnames):
+        tasks.append(("exts", k, extfname, ExtData))
+        fm90fname = extfname.replace(".fits", "_FM90.fits")
+        if fm90 and os.path.isfile(fm90fname):
+            tasks.append(("exts_fm90", k, fm90fname, ExtData))
+        if chains:
+            for attr, cfname in [("chains", extfname), ("chains_fm90", fm90fname)]:
+                chainfile = cfname.replace(".fits", ".h5")
+                if os.path.isfile(chainfile):
+                    tasks.append((attr, k, chainfile, chain_loader))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for attr, k, filename, data, runtime in pool.map(_timed_load, tasks):
+            getattr(sample, attr)[k] = data
+            sample.timing.append((filename, runtime))
+
+    if verbose:
+        sample.print_timing()
+    return sample
+
+
+def load_filelist(filelist, basedir="fits", sort=False, extra=None, **kwargs):
+    """
+    Load the sample of sightlines in a list file.
+
+    Parameters
+    ----------
+    filelist : str
+        file with one extinction curve file name per line, # for comments
+    basedir : str, optional
+        directory with the extinction curve files
+    sort : boolean, optional
+        sort the names
+    extra : list of tuples, optional
+        (name, file name) of curves to add after the list (e.g., averages)
+    kwargs : dict
+        other arguments for load_sample
+
+    Returns
+    -------
+    sample : SampleData
+        loaded sample
+    """
+    names, extfnames = read_filelist(filelist, basedir=basedir, sort=sort)
+    for name, extfname in extra or []:
+        names.append(name)
+        extfnames.append(extfname)
+    return load_sample(extfnames, names=names, **kwargs)
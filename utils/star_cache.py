@@ -0,0 +1,123 @@
+import hashlib
+import os
+import pickle
+
+import measure_extinction
+from measure_extinction.stardata import StarData
+
+all = ["stardata_dependencies", "cached_stardata"]
+
+# version of the cache files, changes invalidate all the cached stars
+cache_version = 1
+
+
+def stardata_dependencies(filename, path=""):
+    """
+    Files read by StarData for a DAT file, the DAT file and the spectra and
+    other files it references.
+
+    Parameters
+    ----------
+    filename : str
+        DAT file name relative to path
+    path : str, optional
+        base path to observed data
+
+    Returns
+    -------
+    files : list of str
+        DAT file and the possible referenced files, some may not exist
+    """
+    datfile = os.path.join(path, filename)
+    files = [datfile]
+    with open(datfile, "r") as f:
+        for line in f:
+            if line.find("#") == 0 or line.find("=") < 0:
+                continue
+            value = line[line.find("=") + 1 :].strip().split(" ")[0]
+            if os.path.splitext(value)[1] not in [".fits", ".dat", ".txt"]:
+                continue
+            for cfile in [
+                path + value,
+                os.path.join(os.path.dirname(datfile), value),
+            ]:
+                if cfile not in files:
+                    files.append(cfile)
+    return files
+
+
+def _file_stats(files):
+    """
+    Modification times and sizes of files, None for the missing files.
+    """
+    stats = {}
+    for cfile in files:
+        if os.path.isfile(cfile):
+            fstat = os.stat(cfile)
+            stats[cfile] = (fstat.st_mtime, fstat.st_size)
+        else:
+            stats[cfile] = None
+    return stats
+
+
+def cached_stardata(filename, path="", cachedir=".stardata_cache", **kwargs):
+    """
+    StarData from a cache of the parsed stars on disk.
+
+    The whole StarData object is pickled after a header with the
+    modification times and sizes of the DAT file and the files it
+    references.  The star is parsed again if any of these changed or the
+    cached star cannot be unpickled.  The cache file name is a hash of the
+    cache version, the measure_extinction version, the DAT file, and the
+    arguments, so a new measure_extinction (e.g., with changed StarData
+    attributes) never reads stars pickled by another version.
+
+    Parameters
+    ----------
+    filename : str
+        DAT file name relative to path
+    path : str, optional
+        base path to observed data
+    cachedir : str, optional
+        directory for the cached stars
+    kwargs : dict
+        other arguments for StarData (e.g., use_corfac)
+
+    Returns
+    -------
+    stardata : StarData
+        observed data
+    """
+    # the key includes the measure_extinction version as the pickled
+    # StarData depends on its class definition
+    meta = {
+        "version": cache_version,
+        "measure_extinction": getattr(measure_extinction, "__version__", None),
+        "filename": os.path.abspath(os.path.join(path, filename)),
+        "kwargs": sorted(kwargs.items()),
+    }
+    key = hashlib.sha1(repr(meta).encode()).hexdigest()
+    cachefile = os.path.join(cachedir, "%s.pkl" % key)
+
+    # metadata is pickled first so stale stars are not unpickled
+    if os.path.isfile(cachefile):
+        try:
+            with open(cachefile, "rb") as f:
+                cmeta = pickle.load(f)
+                if cmeta == dict(meta, stats=_file_stats(cmeta["stats"].keys())):
+                    return pickle.load(f)
+        except Exception:
+            # truncated or unreadable cache file, parse the star again
+            pass
+
+    stardata = StarData(filename, path=path, **kwargs)
+
+    meta["stats"] = _file_stats(stardata_dependencies(filename, path=path))
+    os.makedirs(cachedir, exist_ok=True)
+    tmpfile = "%s.%d.tmp" % (cachefile, os.getpid())
+    with open(tmpfile, "wb") as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(stardata, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile, cachefile)
+
+    return stardata
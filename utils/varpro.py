@@ -0,0 +1,484 @@
+import numpy as np
+from scipy import optimize
+from scipy.special import ndtr
+
+from astropy.modeling import CompoundModel
+from astropy.modeling.fitting import (
+    LevMarLSQFitter,
+    _fitter_to_model_params,
+    DEFAULT_MAXITER,
+    DEFAULT_ACC,
+    DEFAULT_EPS,
+)
+
+from G21 import drude, drude_asym
+from models_mcmc_extension import (
+    EmceeLogProbability,
+    evaluate_model_block,
+    _model_block_broadcasts,
+)
+
+all = ["LinearProjection", "AvProjection", "VarProLSQFitter"]
+
+
+def _g21_terms(
+    x, scale, alpha, sil1_amp, sil1_center, sil1_fwhm, sil2_amp, sil2_center, sil2_fwhm
+):
+    """
+    G21 terms multiplied by the amplitudes
+    """
+    wave = 1 / x
+    return {
+        "scale": x ** alpha,
+        "sil1_amp": drude(wave, 1.0, sil1_center, sil1_fwhm),
+        "sil2_amp": drude(wave, 1.0, sil2_center, sil2_fwhm),
+    }
+
+
+def _g21_drude_asym_terms(
+    x,
+    scale,
+    alpha,
+    sil1_amp,
+    sil1_center,
+    sil1_fwhm,
+    sil1_asym,
+    sil2_amp,
+    sil2_center,
+    sil2_fwhm,
+    sil2_asym,
+):
+    """
+    G21_drude_asym terms multiplied by the amplitudes
+    """
+    wave = 1 / x
+    return {
+        "scale": x ** alpha,
+        "sil1_amp": drude_asym(wave, 1.0, sil1_center, sil1_fwhm, sil1_asym),
+        "sil2_amp": drude_asym(wave, 1.0, sil2_center, sil2_fwhm, sil2_asym),
+    }
+
+
+def _fm90_terms(x, C1, C2, C3, C4, xo, gamma):
+    """
+    FM90 terms multiplied by the C1-C4 coefficients
+    """
+    x2 = x ** 2
+    y = x - 5.9
+    return {
+        "C1": np.ones_like(x),
+        "C2": x,
+        "C3": x2 / ((x2 - xo ** 2) ** 2 + x2 * (gamma ** 2)),
+        "C4": np.where(x >= 5.9, 0.5392 * (y ** 2) + 0.05644 * (y ** 3), 0.0),
+    }
+
+
+# models that are linear in a subset of their parameters
+#   given as functions returning the term multiplied by each linear parameter
+linear_terms = {
+    "G21": _g21_terms,
+    "G21_drude_asym": _g21_drude_asym_terms,
+    "FM90": _fm90_terms,
+}
+
+
+class LinearProjection(EmceeLogProbability):
+    """
+    Log(probability) of the nonlinear parameters of a model with the linear
+    parameters solved by linear least squares (variable projection).
+
+    Supports the models in linear_terms and these models piped into
+    AxAvToExv.  For the AxAvToExv compound models, E(x-V) is bilinear in A(V)
+    and the A(x)/A(V) amplitudes and both are solved for.
+
+    Parameters
+    ----------
+    model : astropy model
+        model to fit
+    x, y : array
+        data
+    weights : array, optional
+        weights (1/unc)
+    layout : ParameterLayout, optional
+        layout of the model free parameters
+    linear : str, optional
+        "amplitudes" to solve for all the free amplitudes (and A(V)) or
+        "Av" to only solve for A(V)
+    mode : str, optional
+        "profile" for the linear parameters at the conditional best fit or
+        "marginalize" to integrate over the linear parameters.  The
+        marginalization is exact for a single linear parameter.  For more
+        than one it is approximate: the unbounded gaussian integral is used,
+        the conditional best fit is required to be within the prior bounds,
+        and the prior mass outside the bounds is ignored, biasing the
+        posterior near the bounds.
+    """
+
+    # gradient of the projected log(probability) not available
+    block_and_grad = None
+
+    def __init__(
+        self,
+        model,
+        x,
+        y,
+        weights=None,
+        layout=None,
+        linear="amplitudes",
+        mode="profile",
+    ):
+        super().__init__(model, x, y, weights=weights, layout=layout)
+        if linear not in ["amplitudes", "Av"]:
+            raise ValueError("linear must be amplitudes or Av")
+        if mode not in ["profile", "marginalize"]:
+            raise ValueError("mode must be profile or marginalize")
+        self.linear = linear
+        self.mode = mode
+
+        # the A(x)/A(V) model and location of A(V) in the parameters
+        if isinstance(model, CompoundModel):
+            if model.op != "|" or type(model.right).__name__ != "AxAvToExv":
+                raise ValueError("only compound models of model | AxAvToExv")
+            leaf = model.left
+            self.av_indx = len(leaf.param_names)
+            suffix = "_0"
+        else:
+            if linear == "Av":
+                raise ValueError("Av is only linear for model | AxAvToExv")
+            leaf = model
+            self.av_indx = None
+            suffix = ""
+        self.n_leaf = len(leaf.param_names)
+        self.leaf_broadcasts = _model_block_broadcasts(leaf, x)
+
+        if linear == "amplitudes":
+            leaf_name = type(leaf).__name__
+            if leaf_name not in linear_terms.keys():
+                raise ValueError("no linear terms known for %s" % leaf_name)
+            self.terms = linear_terms[leaf_name]
+            amp_names = list(self.terms(np.ones(1), *leaf.parameters).keys())
+        else:
+            self.terms = None
+            amp_names = []
+
+        # split the free parameters into linear and sampled parameters
+        free_names = self.layout.param_names
+        self.amp_names = [cname for cname in amp_names if cname + suffix in free_names]
+        self.fixed_amp_names = [
+            cname for cname in amp_names if cname + suffix not in free_names
+        ]
+        self.leaf_names = list(leaf.param_names)
+        linear_names = [cname + suffix for cname in self.amp_names]
+        self.av_free = self.av_indx is not None and "Av_1" in free_names
+        if self.av_free:
+            linear_names.append("Av_1")
+        if len(linear_names) == 0:
+            raise ValueError("no free linear parameters")
+        self.linear_indxs = np.array(
+            [free_names.index(cname) for cname in linear_names]
+        )
+        self.sample_indxs = np.array(
+            [k for k in range(self.layout.ndim) if k not in self.linear_indxs]
+        )
+        self.sample_layout = self.layout.subset(self.sample_indxs)
+        self.lin_layout = self.layout.subset(self.linear_indxs)
+
+    def _basis(self, theta):
+        """
+        Linear basis functions and offset for a block of the sampled
+        parameters.
+
+        Parameters
+        ----------
+        theta : 2D array
+            block of the sampled parameters [nblock, nsample]
+
+        Returns
+        -------
+        basis : 3D array
+            basis functions [nblock, nlinear, npts]
+        offset : 2D array
+            model part not depending on the linear parameters [nblock, npts]
+        params : 2D array
+            full model parameters (linear parameters at initial values)
+        """
+        fps = np.tile(self.layout.params[self.layout.fit_indxs], (len(theta), 1))
+        fps[:, self.sample_indxs] = theta
+        params = self.layout.full_params(fps)
+        cols = params.T[:, :, np.newaxis]
+        leaf_cols = cols[: self.n_leaf]
+
+        if self.linear == "Av":
+            # E(x-V) = A(V) * (A(x)/A(V) - 1)
+            axav = evaluate_model_block(
+                self.model.left, self.x, params[:, : self.n_leaf], self.leaf_broadcasts
+            )
+            basis = (axav - 1.0)[:, np.newaxis, :]
+            return basis, np.zeros((len(theta), len(self.x))), params
+
+        terms = self.terms(self.x, *leaf_cols)
+        nblock = len(theta)
+        basis = [
+            np.broadcast_to(terms[cname], (nblock, len(self.x)))
+            for cname in self.amp_names
+        ]
+        offset = np.zeros((nblock, len(self.x)))
+        for cname in self.fixed_amp_names:
+            k = self.leaf_names.index(cname)
+            offset = offset + leaf_cols[k] * terms[cname]
+
+        if self.av_indx is not None:
+            if self.av_free:
+                # E(x-V) = sum(A(V) * amp * term) + A(V) * (fixed - 1)
+                basis.append(offset - 1.0)
+                offset = np.zeros_like(offset)
+            else:
+                av = cols[self.av_indx]
+                basis = [av * cbasis for cbasis in basis]
+                offset = av * (offset - 1.0)
+
+        return np.stack(basis, axis=1), offset, params
+
+    def _solve(self, theta):
+        """
+        Solve for the linear parameters for a block of the sampled parameters.
+
+        Returns
+        -------
+        beta : 2D array
+            coefficients of the basis functions [nblock, nlinear]
+        precision : 3D array
+            weighted normal matrix [nblock, nlinear, nlinear]
+        wresid : 2D array
+            weighted residuals at beta [nblock, npts]
+        """
+        basis, offset, params = self._basis(theta)
+        wbasis = basis * self.weights
+        wres = (self.y - offset) * self.weights
+        precision = np.einsum("bip,bjp->bij", wbasis, wbasis)
+        rhs = np.einsum("bip,bp->bi", wbasis, wres)
+        beta = np.einsum("bij,bj->bi", np.linalg.pinv(precision), rhs)
+        wresid = wres - np.einsum("bi,bip->bp", beta, wbasis)
+        return beta, precision, wresid
+
+    def _to_params(self, beta):
+        """
+        Convert the basis coefficients to the linear model parameters
+        """
+        if self.av_free and self.linear == "amplitudes":
+            # coefficients are A(V) * amp
+            av = beta[:, -1:]
+            return np.concatenate([beta[:, :-1] / av, av], axis=1)
+        return beta
+
+    def residuals(self, theta):
+        """
+        Weighted residuals at the conditional best fit linear parameters.
+
+        Parameters
+        ----------
+        theta : 1D array
+            sampled parameters
+
+        Returns
+        -------
+        residuals : array
+            weighted residuals
+        """
+        beta, precision, wresid = self._solve(np.atleast_2d(theta))
+        return wresid[0]
+
+    def block(self, theta):
+        """
+        Natural log of the probability for a block of sampled parameters.
+
+        Parameters
+        ----------
+        theta : 2D array
+            block of sampled parameters [nblock, nsample]
+
+        Returns
+        -------
+        log_prob : array
+            log(probability) of each row
+        """
+        log_prob = np.full(len(theta), -np.inf)
+        gindxs = self.sample_layout.in_bounds(theta)
+        if not np.any(gindxs):
+            return log_prob
+
+        beta, precision, wresid = self._solve(theta[gindxs])
+        clog_prob = -0.5 * np.sum(np.square(wresid), axis=1)
+        lin_params = self._to_params(beta)
+        nlin = beta.shape[1]
+
+        if self.mode == "profile":
+            clog_prob[~self.lin_layout.in_bounds(lin_params)] = -np.inf
+        else:
+            sign, logdet = np.linalg.slogdet(precision)
+            clog_prob += 0.5 * nlin * np.log(2.0 * np.pi) - 0.5 * logdet
+            clog_prob[sign <= 0] = -np.inf
+            if nlin == 1:
+                # exact for the bounded prior on the single linear parameter
+                sigma = 1.0 / np.sqrt(precision[:, 0, 0])
+                mass = ndtr((self.lin_layout.upper[0] - beta[:, 0]) / sigma) - ndtr(
+                    (self.lin_layout.lower[0] - beta[:, 0]) / sigma
+                )
+                with np.errstate(divide="ignore"):
+                    clog_prob += np.log(mass)
+            else:
+                # approximate, the truncated gaussian mass is not computed,
+                # instead the conditional mode is required in the prior bounds
+                clog_prob[~self.lin_layout.in_bounds(lin_params)] = -np.inf
+                if self.av_free and self.linear == "amplitudes":
+                    # Jacobian from A(V) * amp to amp
+                    with np.errstate(divide="ignore"):
+                        clog_prob -= (nlin - 1) * np.log(np.absolute(beta[:, -1]))
+
+        log_prob[gindxs] = clog_prob
+        return log_prob
+
+    def reconstruct(self, theta, draw=True, maxtries=100):
+        """
+        Full free parameters for a block of sampled parameters.  The linear
+        parameters are the conditional best fit values or, when draw is
+        set and the mode is marginalize, drawn from the conditional
+        posterior within the prior bounds.
+
+        Parameters
+        ----------
+        theta : 2D array
+            block of sampled parameters [nblock, nsample]
+        draw : boolean, optional
+            draw the linear parameters from the conditional posterior
+        maxtries : int, optional
+            maximum number of redraws for values outside the prior bounds,
+            the conditional best fit is used after this
+
+        Returns
+        -------
+        fps : 2D array
+            free parameters [nblock, ndim]
+        """
+        beta, precision, wresid = self._solve(theta)
+        lin_params = self._to_params(beta)
+
+        if draw and self.mode == "marginalize":
+            redraw = np.full(len(theta), True)
+            for k in range(maxtries):
+                nredraw = np.sum(redraw)
+                if nredraw == 0:
+                    break
+                chol = np.linalg.cholesky(precision[redraw])
+                rand = np.random.standard_normal((nredraw, beta.shape[1], 1))
+                cbeta = (
+                    beta[redraw]
+                    + np.linalg.solve(np.swapaxes(chol, 1, 2), rand)[:, :, 0]
+                )
+                cparams = self._to_params(cbeta)
+                gvals = self.lin_layout.in_bounds(cparams)
+                (indxs,) = np.where(redraw)
+                lin_params[indxs[gvals]] = cparams[gvals]
+                redraw[indxs[gvals]] = False
+
+        fps = np.empty((len(theta), self.layout.ndim))
+        fps[:, self.sample_indxs] = theta
+        fps[:, self.linear_indxs] = self.lin_layout.clip(lin_params)
+        return fps
+
+
+class VarProLSQFitter(LevMarLSQFitter):
+    """
+    Levenberg-Marquardt fitter with the linear parameters solved by
+    linear least squares at each step (variable projection).  The result is
+    polished with a standard fit of all the parameters to provide the
+    covariance matrix.
+
+    Parameters
+    ----------
+    linear : str, optional
+        "amplitudes" or "Av", see LinearProjection
+    """
+
+    def __init__(self, linear="amplitudes"):
+        super().__init__()
+        self.linear = linear
+
+    def __call__(
+        self,
+        model,
+        x,
+        y,
+        weights=None,
+        maxiter=DEFAULT_MAXITER,
+        acc=DEFAULT_ACC,
+        epsilon=DEFAULT_EPS,
+        estimate_jacobian=False,
+    ):
+        """
+        Fit the model to the data.  Parameters as for LevMarLSQFitter.
+        """
+        model_copy = model.copy()
+        projection = LinearProjection(
+            model_copy, x, y, weights=weights, linear=self.linear
+        )
+        layout = projection.sample_layout
+        theta0 = layout.params[layout.fit_indxs]
+
+        def residuals(theta):
+            return projection.residuals(layout.clip(theta))
+
+        theta, cov, info, mess, ierr = optimize.leastsq(
+            residuals,
+            theta0,
+            maxfev=maxiter,
+            epsfcn=epsilon,
+            xtol=acc,
+            ftol=acc,
+            full_output=True,
+        )
+        fps = projection.reconstruct(layout.clip(theta)[np.newaxis, :], draw=False)
+        _fitter_to_model_params(model_copy, fps[0])
+
+        # polish with all the parameters free
+        model_fit = super().__call__(
+            model_copy,
+            x,
+            y,
+            weights=weights,
+            maxiter=maxiter,
+            acc=acc,
+            epsilon=epsilon,
+            estimate_jacobian=estimate_jacobian,
+        )
+        self.fit_info["varpro_nfev"] = info["nfev"]
+        self.fit_info["varpro_message"] = mess
+        return model_fit
+
+
+class AvProjection(LinearProjection):
+    """
+    Log(probability) for a model | AxAvToExv compound model with A(V)
+    marginalized or profiled.  A(V) is a linear scale factor for a fixed
+    A(x)/A(V) curve shape.  Works for any A(x)/A(V) model.
+
+    Parameters
+    ----------
+    model : astropy CompoundModel
+        model of the form axav_model | AxAvToExv
+    x, y : array
+        data
+    weights : array, optional
+        weights (1/unc)
+    layout : ParameterLayout, optional
+        layout of the model free parameters
+    mode : str, optional
+        "marginalize" to integrate over A(V) with the A(V) chain drawn
+        from the conditional posterior or "profile" for A(V) at the
+        conditional best fit
+    """
+
+    def __init__(self, model, x, y, weights=None, layout=None, mode="marginalize"):
+        super().__init__(
+            model, x, y, weights=weights, layout=layout, linear="Av", mode=mode
+        )